@@ -0,0 +1,245 @@
+import os
+import sys
+import time
+import shutil
+import socket
+import asyncio
+import logging
+import secrets
+import itertools
+from urllib.parse import urlparse
+
+import aiohttp
+
+# ——— Configuration ———
+ENABLED = os.environ.get("ARIA2_RPC", "1").lower() not in ("0", "false", "no")
+CONNECTIONS = int(os.environ.get("ARIA2_CONNECTIONS", 8))   # Per download and server (aria2 allows up to 16)
+DOWNLOADS = int(os.environ.get("ARIA2_DOWNLOADS", 4))       # Active at once; the rest wait in aria2's queue
+PER_HOST = int(os.environ.get("ARIA2_PER_HOST", 2))         # Active downloads per server
+POLL = 0.5                                                  # Seconds between status polls
+START_TIMEOUT = 10
+# yt-dlp options for what the daemon can't take (HLS/DASH fragments, merged formats):
+# its native downloader instead of one more aria2c process per link
+YTDL_FALLBACK = {"external_downloader": {}, "concurrent_fragment_downloads": 8}
+
+
+class Aria2Error(Exception):
+    pass
+
+
+class Aria2Daemon:
+    """One long-lived aria2c driven over JSON-RPC.
+
+    Global connections are bounded by DOWNLOADS * CONNECTIONS, and each
+    server sees at most PER_HOST * CONNECTIONS because downloads wait for
+    a per-host slot before they are handed to aria2. The daemon exits with
+    the bot (--stop-with-process), and close() shuts it down cleanly and
+    for good: calls after it raise Aria2Error rather than start a new one.
+    """
+
+    def __init__(self):
+        self.proc = None
+        self.url = None
+        self.secret = secrets.token_hex(16)
+        self.session = None
+        self.hosts = {}        # host → Semaphore(PER_HOST)
+        self.gids = set()      # downloads in flight, for pause_all/unpause_all
+        self._ids = itertools.count(1)
+        self._lock = asyncio.Lock()
+        self.closed = False    # shut down on purpose (drain, /stop): no restarting
+
+    @property
+    def enabled(self):
+        return ENABLED and shutil.which("aria2c") is not None
+
+    async def start(self):
+        async with self._lock:
+            if self.closed:
+                raise Aria2Error("aria2c was shut down")
+            if self.proc and self.proc.returncode is None:
+                return
+            if self.proc:
+                logging.error(f"aria2c exited with {self.proc.returncode}, restarting")
+            with socket.socket() as s:
+                s.bind(("127.0.0.1", 0))
+                port = s.getsockname()[1]
+            self.proc = await asyncio.create_subprocess_exec(
+                "aria2c", "--enable-rpc", f"--rpc-listen-port={port}", "--rpc-listen-all=false",
+                f"--rpc-secret={self.secret}", f"--stop-with-process={os.getpid()}",
+                f"--max-concurrent-downloads={DOWNLOADS}", f"--max-connection-per-server={CONNECTIONS}",
+                f"--split={CONNECTIONS}", "--min-split-size=1M", "--continue=true",
+                "--auto-file-renaming=false", "--allow-overwrite=true", "--file-allocation=none",
+                "--console-log-level=warn", "--summary-interval=0",
+                stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL
+            )
+            self.url = f"http://127.0.0.1:{port}/jsonrpc"
+            if self.session is None or self.session.closed:
+                self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10))
+            deadline = time.monotonic() + START_TIMEOUT
+            while True:
+                try:
+                    await self._call("aria2.getVersion")
+                    break
+                except (aiohttp.ClientError, Aria2Error):
+                    if self.proc.returncode is not None or time.monotonic() > deadline:
+                        raise Aria2Error("aria2c did not start")
+                    await asyncio.sleep(0.1)
+
+    async def _call(self, method, *params):
+        payload = {"jsonrpc": "2.0", "id": next(self._ids), "method": method,
+                   "params": [f"token:{self.secret}", *params]}
+        async with self.session.post(self.url, json=payload) as resp:
+            data = await resp.json(content_type=None)
+        if "error" in data:
+            raise Aria2Error(data["error"].get("message", str(data["error"])))
+        return data["result"]
+
+    async def call(self, method, *params):
+        await self.start()
+        return await self._call(method, *params)
+
+    # ——— Downloads ———
+    async def add(self, url, path, headers=None, rate=None):
+        """Queue url for download to path; returns the gid."""
+        options = {"dir": os.path.dirname(os.path.abspath(path)), "out": os.path.basename(path)}
+        if headers:
+            options["header"] = [f"{k}: {v}" for k, v in headers.items()]
+        if rate:
+            options["max-download-limit"] = str(int(rate))
+        return await self.call("aria2.addUri", [url], options)
+
+    async def status(self, gid):
+        return await self.call("aria2.tellStatus", gid,
+                               ["status", "totalLength", "completedLength", "downloadSpeed", "errorMessage"])
+
+    async def pause(self, gid):
+        await self.call("aria2.forcePause", gid)
+
+    async def unpause(self, gid):
+        await self.call("aria2.unpause", gid)
+
+    async def remove(self, gid):
+        try:
+            await self.call("aria2.forceRemove", gid)
+        except Aria2Error:
+            pass  # already finished or gone
+        try:
+            await self.call("aria2.removeDownloadResult", gid)
+        except Aria2Error:
+            pass
+
+    async def pause_all(self):
+        for gid in list(self.gids):
+            try: await self.pause(gid)
+            except Aria2Error: pass
+
+    async def unpause_all(self):
+        for gid in list(self.gids):
+            try: await self.unpause(gid)
+            except Aria2Error: pass
+
+    async def download(self, url, path, headers=None, progress=None, rate=None):
+        """Download url to path through the daemon and return path.
+
+        `progress(current, total, speed)` is awaited on every poll; `rate` is
+        a callable giving the current byte/s cap, re-applied when it changes.
+        Cancelling the caller removes the download from aria2.
+        """
+        host = urlparse(url).hostname or ""
+        slot = self.hosts.setdefault(host, asyncio.Semaphore(PER_HOST))
+        async with slot:
+            limit = int(rate()) if rate else None
+            gid = await self.add(url, path, headers, limit)
+            self.gids.add(gid)
+            try:
+                while True:
+                    if self.closed:
+                        # Left to aria2's control file; the next process resumes from there
+                        raise Aria2Error("aria2c was shut down")
+                    st = await self.status(gid)
+                    if st["status"] == "complete":
+                        return path
+                    if st["status"] in ("error", "removed"):
+                        raise Aria2Error(st.get("errorMessage") or f"download {st['status']}")
+                    if progress:
+                        await progress(int(st["completedLength"]), int(st["totalLength"]), int(st["downloadSpeed"]))
+                    if rate and int(rate()) != limit:
+                        limit = int(rate())
+                        await self.call("aria2.changeOption", gid, {"max-download-limit": str(limit)})
+                    await asyncio.sleep(POLL)
+            finally:
+                self.gids.discard(gid)
+                if self.proc.returncode is None:
+                    # Drop it from aria2 (stopping it if we were cancelled or failed)
+                    await asyncio.shield(self.remove(gid))
+
+    async def close(self):
+        """Ask aria2c to shut down, killing it if it doesn't within a few seconds."""
+        self.closed = True
+        if self.proc and self.proc.returncode is None:
+            try:
+                await self._call("aria2.shutdown")
+                await asyncio.wait_for(self.proc.wait(), 5)
+            except Exception:
+                self.proc.kill()
+                await self.proc.wait()
+        if self.session and not self.session.closed:
+            await self.session.close()
+
+
+daemon = Aria2Daemon()
+
+
+# ——— Self-test against a local HTTP server ———
+async def _selftest(root, url, size):
+    seen = []
+
+    async def progress(current, total, speed):
+        seen.append(current)
+
+    out = os.path.join(root, "out.bin")
+    start = time.perf_counter()
+    await daemon.download(url, out, progress=progress, rate=lambda: 4 * 2**20)
+    elapsed = time.perf_counter() - start
+    assert os.path.getsize(out) == size, "size mismatch"
+    with open(os.path.join(root, "sample.bin"), "rb") as a, open(out, "rb") as b:
+        assert a.read() == b.read(), "content mismatch"
+    print(f"download : {size / 2**20:.0f} MiB in {elapsed:.2f}s at a 4 MiB/s cap, {len(seen)} progress ticks")
+
+    # Pause/unpause/remove on a slow transfer
+    task = asyncio.ensure_future(daemon.download(url, os.path.join(root, "slow.bin"), rate=lambda: 256 * 2**10))
+    await asyncio.sleep(1)
+    gid = next(iter(daemon.gids))
+    await daemon.pause(gid)
+    assert (await daemon.status(gid))["status"] == "paused"
+    await daemon.unpause(gid)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    assert not daemon.gids
+    print("control  : pause, unpause and cancel OK")
+    await daemon.close()
+    assert daemon.proc.returncode is not None
+    print("shutdown : OK")
+
+
+def _main():
+    import tempfile
+    import threading
+    import functools
+    from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+    if not daemon.enabled:
+        sys.exit("aria2c not found")
+    size = 16 * 2**20
+    root = tempfile.mkdtemp()
+    with open(os.path.join(root, "sample.bin"), "wb") as f:
+        f.write(os.urandom(size))
+    handler = functools.partial(SimpleHTTPRequestHandler, directory=root)
+    handler.log_message = lambda *a: None
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    asyncio.run(_selftest(root, f"http://127.0.0.1:{server.server_port}/sample.bin", size))
+
+
+if __name__ == "__main__":
+    _main()
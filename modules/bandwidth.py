@@ -0,0 +1,140 @@
+import os
+import time
+import asyncio
+from contextlib import contextmanager
+
+import metrics
+import sampler
+import tracing
+
+# ——— Configuration ———
+# Fixed link capacity in bytes/s (e.g. "12.5M"); when unset it is measured from the sampler
+BW_UP = os.environ.get("BW_UP", "")
+BW_DOWN = os.environ.get("BW_DOWN", "")
+DEFAULT_CAPACITY = 12.5 * 2**20   # 100 Mbit/s until the sampler has seen real traffic
+HEADROOM = 1.25                   # Hand out a bit more than measured so the estimate can grow
+MIN_RATE = 64 * 2**10             # No share is throttled below this
+WEIGHTS = {"interactive": 4, "bulk": 1}
+# Batch kinds (see tracing.begin) that count as interactive
+INTERACTIVE = {"pro"}
+
+share_rate = metrics.Gauge("bot_bandwidth_share_bytes", "Bandwidth allotted per chat.", ["direction", "chat"])
+
+
+def _parse_rate(text):
+    if not text:
+        return None
+    units = {"K": 2**10, "M": 2**20, "G": 2**30}
+    suffix = text[-1].upper()
+    return float(text[:-1]) * units[suffix] if suffix in units else float(text)
+
+
+class TokenBucket:
+    """Allows `rate` bytes/s with bursts of about a second; consumers may go into debt and wait it off."""
+
+    __slots__ = ("rate", "tokens", "last")
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.last = time.monotonic()
+
+    def set_rate(self, rate):
+        self._refill()
+        self.rate = rate
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    async def consume(self, n):
+        self._refill()
+        self.tokens -= n
+        if self.tokens < 0:
+            await asyncio.sleep(-self.tokens / self.rate)
+
+
+class Share:
+    """One job's slice of the link in one direction."""
+
+    __slots__ = ("direction", "chat", "weight", "bucket")
+
+    def __init__(self, direction, chat, weight):
+        self.direction = direction
+        self.chat = chat
+        self.weight = weight
+        self.bucket = TokenBucket(MIN_RATE)
+
+    @property
+    def rate(self):
+        return self.bucket.rate
+
+    async def consume(self, n):
+        await self.bucket.consume(n)
+
+    def progress(self, inner=None):
+        """A pyrogram progress callback that throttles the transfer, then calls `inner`."""
+        seen = [0]
+
+        async def callback(current, total, *args):
+            await self.consume(max(0, current - seen[0]))
+            seen[0] = current
+            if inner:
+                await inner(current, total, *args)
+        return callback
+
+
+class BandwidthManager:
+    """Splits measured up/down capacity between chats, then between each chat's jobs.
+
+    Every chat gets a slice weighted by its most important job (interactive
+    beats bulk), and its jobs split that slice by their own weights. Shares
+    are rebalanced whenever a job starts or finishes.
+    """
+
+    def __init__(self):
+        self.shares = {"up": set(), "down": set()}
+        self.fixed = {"up": _parse_rate(BW_UP), "down": _parse_rate(BW_DOWN)}
+
+    def capacity(self, direction):
+        if self.fixed[direction]:
+            return self.fixed[direction]
+        key = "net_up" if direction == "up" else "net_down"
+        seen = max((s[key] for s in sampler.samples), default=0.0)
+        return max(seen, DEFAULT_CAPACITY) * HEADROOM
+
+    def _rebalance(self, direction):
+        shares = self.shares[direction]
+        chats = {}
+        for s in shares:
+            chats.setdefault(s.chat, []).append(s)
+        total = sum(max(s.weight for s in group) for group in chats.values())
+        capacity = self.capacity(direction)
+        for chat, group in chats.items():
+            chat_rate = capacity * max(s.weight for s in group) / total
+            share_rate.set(chat_rate, direction=direction, chat=chat)
+            weights = sum(s.weight for s in group)
+            for s in group:
+                s.bucket.set_rate(max(MIN_RATE, chat_rate * s.weight / weights))
+
+    @contextmanager
+    def share(self, direction, chat=None, priority=None):
+        """Hold a share for the enclosed transfer; chat and priority default to the traced job."""
+        ids = tracing.current()
+        chat = chat if chat is not None else ids.get("chat")
+        if priority is None:
+            priority = "interactive" if ids.get("kind") in INTERACTIVE else "bulk"
+        share = Share(direction, chat, WEIGHTS[priority])
+        self.shares[direction].add(share)
+        self._rebalance(direction)
+        try:
+            yield share
+        finally:
+            self.shares[direction].discard(share)
+            if not any(s.chat == chat for s in self.shares[direction]):
+                share_rate.remove(direction=direction, chat=chat)
+            self._rebalance(direction)
+
+
+bandwidth = BandwidthManager()
@@ -4,8 +4,16 @@ import logging
 from pyrogram import filters, Client
 from pyrogram.types import Message
 from pyrogram.enums import ChatAction
-from pyromod import listen
 from collections import deque
+import metrics
+import tracing
+import drain
+from fvr import run_ffmpeg, validate_args
+from docbatch import DocBatcher
+from vars import DOC_ALBUMS
+from bandwidth import bandwidth
+from uploadpool import pool as uploads
+from session import SessionExpired, store as sessions
 
 # Set up logging configuration to capture only errors
 logging.basicConfig(
@@ -49,17 +57,14 @@ async def process_file(bot, chat_id, file_info, ff_args):
         await bot.send_message(chat_id, f"⚙️ Processing {file_name}...\n`{cmd}`")
 
         # Run the ffmpeg command
-        proc = await asyncio.create_subprocess_shell(
-            cmd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        stdout, stderr = await proc.communicate()
+        # A graceful restart lets this encode finish and the next process send the result
+        handoff = {"chat": chat_id, "caption": f"✅ Processed: {original_name}", "cleanup": [file_path]}
+        result = await run_ffmpeg(file_path, ff_args, local_out, chat_id, "batch", handoff=handoff)
 
         # Check if processing was successful
-        if proc.returncode != 0:
+        if result.returncode != 0:
             # Capture full error message
-            err_msg = stderr.decode(errors="ignore").strip()
+            err_msg = result.stderr.strip()
             logging.error(f"FFmpeg processing failed for file {file_name}. Full error message:\n{err_msg}")
 
             # Split and send long error messages
@@ -73,49 +78,91 @@ async def process_file(bot, chat_id, file_info, ff_args):
         await bot.send_message(chat_id, f"❌ Error processing {os.path.basename(file_path)}: {e}")
         return False, None
 
+# Report outputs an album could not deliver
+async def report_album_failures(bot, chat_id, failures):
+    for _, name, e in failures:
+        await bot.send_message(chat_id, f"❌ Failed to upload processed file: {name}\nError: {e}")
+
 # Batch processing worker function
-async def batch_worker(bot, chat_id, queue, ff_args, semaphore):
+async def batch_worker(bot, chat_id, queue, ff_args, semaphore, albums=None):
     while queue:
         async with semaphore:
-            if not queue:  # Check again in case queue emptied while waiting
+            if not queue or drain.draining():  # Emptied while waiting, or left for after the restart
                 break
                 
             file_info = queue.popleft()
+            metrics.queue_length.set(len(queue), chat=chat_id)
             
-            # Process the file
-            success, output_path = await process_file(bot, chat_id, file_info, ff_args)
+            with tracing.item(file_info["n"], file=file_info["original_name"]):
+                # Process the file
+                success, output_path = await process_file(bot, chat_id, file_info, ff_args)
             
-            if success:
-                # Upload the processed file
-                await bot.send_chat_action(chat_id, ChatAction.UPLOAD_DOCUMENT)
-                try:
-                    # Get original filename for the caption
+                if success and albums:
+                    # Sent with the next album; the batcher removes the output once it's out
+                    os.remove(file_info["path"])
                     original_name = file_info.get("original_name", os.path.basename(file_info['path']))
-                    await bot.send_document(
-                        chat_id, 
-                        output_path, 
-                        caption=f"✅ Processed: {original_name}",
-                        file_name=os.path.basename(output_path)  # Ensure the file is sent with the branded name
-                    )
-                except Exception as e:
-                    await bot.send_message(
-                        chat_id,
-                        f"❌ Failed to upload processed file: {os.path.basename(output_path)}\nError: {e}"
-                    )
+                    failures = await albums.add(output_path, f"✅ Processed: {original_name}",
+                                                file_info["n"], os.path.basename(output_path))
+                    await report_album_failures(bot, chat_id, failures)
+                elif success:
+                    # Upload the processed file
+                    await bot.send_chat_action(chat_id, ChatAction.UPLOAD_DOCUMENT)
+                    try:
+                        # Get original filename for the caption
+                        original_name = file_info.get("original_name", os.path.basename(file_info['path']))
+                        with metrics.timed("upload"), bandwidth.share("up") as share:
+                            await uploads.send_document(
+                                bot,
+                                chat_id, 
+                                output_path, 
+                                caption=f"✅ Processed: {original_name}",
+                                file_name=os.path.basename(output_path),  # Ensure the file is sent with the branded name
+                                progress=share.progress()
+                            )
+                        metrics.bytes_total.inc(os.path.getsize(output_path), direction="up")
+                    except Exception as e:
+                        await bot.send_message(
+                            chat_id,
+                            f"❌ Failed to upload processed file: {os.path.basename(output_path)}\nError: {e}"
+                        )
                 
-                # Clean up files
-                try:
-                    os.remove(file_info["path"])
-                    os.remove(output_path)
-                except OSError as e:
-                    logging.error(f"Error removing files: {e}")
+                    # Clean up files
+                    try:
+                        os.remove(file_info["path"])
+                        os.remove(output_path)
+                    except OSError as e:
+                        logging.error(f"Error removing files: {e}")
+
+# Continue a batch after a graceful restart; the downloaded inputs are still on disk
+async def resume_batch(bot, state):
+    chat_id = state["chat"]
+    file_queue = deque(f for f in state["files"] if os.path.exists(f["path"]))
+    if not file_queue:
+        return await bot.send_message(chat_id, "♻️ The bot restarted and your /batch files are gone, please send them again.")
+    await bot.send_message(chat_id, f"♻️ Back after a restart: continuing your batch with {len(file_queue)} files.")
+    trace_token = tracing.begin("batch", chat_id, args=state["args"], resumed=True)
+    try:
+        metrics.queue_length.set(len(file_queue), chat=chat_id)
+        drain.hold(("batch", chat_id), "batch", "resume_batch",
+                   lambda: {"chat": chat_id, "args": state["args"], "files": list(file_queue)} if file_queue else None)
+        await batch_worker(bot, chat_id, file_queue, state["args"], asyncio.Semaphore(5))
+        if drain.draining():
+            return
+        drain.release(("batch", chat_id))
+        metrics.queue_length.remove(chat=chat_id)
+        await bot.send_message(chat_id, "✅ Batch processing complete!")
+    finally:
+        tracing.end(trace_token)
 
 # Main handler function for the "batch" command
 def batch_feature(bot: Client):
     @bot.on_message(filters.command("batch") & filters.private)
+    @sessions.conversation("batch")
     async def batch_handler(_, m: Message):
+        trace_token = None
         try:
             chat_id = m.chat.id
+            conv = sessions.find("batch", chat_id)
             user_id = m.from_user.id
             
             # Ask for FFmpeg arguments first
@@ -126,23 +173,30 @@ def batch_feature(bot: Client):
             )
             await m.reply_text(help_text)
 
-            # Listen for the user inputting FFmpeg args
-            cmd_msg: Message = await bot.listen(chat_id)
-            ff_args = cmd_msg.text.strip()
-
-            # If user asks for help/examples
-            if ff_args.lower() in ("help", "?", "examples"):
-                examples = (
-                    "`-vf scale=1280:720 -c:v libx264 -crf 23`\n"
-                    "`-q:v 2 -preset slow`\n"
-                    "`-c:v copy -c:a copy` (stream copy/no re-encode)"
-                )
-                await m.reply_text(
-                    f"Here are some example ffmpeg args:\n{examples}\n\nNow please send your ffmpeg arguments:"
-                )
-                cmd_msg = await bot.listen(chat_id)
+            # Listen until the user sends args that pass the preflight check
+            while True:
+                cmd_msg: Message = await conv.listen()
                 ff_args = cmd_msg.text.strip()
 
+                # If user asks for help/examples
+                if ff_args.lower() in ("help", "?", "examples"):
+                    examples = (
+                        "`-vf scale=1280:720 -c:v libx264 -crf 23`\n"
+                        "`-q:v 2 -preset slow`\n"
+                        "`-c:v copy -c:a copy` (stream copy/no re-encode)"
+                    )
+                    await m.reply_text(
+                        f"Here are some example ffmpeg args:\n{examples}\n\nNow please send your ffmpeg arguments:"
+                    )
+                    continue
+
+                error = await validate_args(ff_args)
+                if error is None:
+                    break
+                await m.reply_text(f"❌ These ffmpeg args won't work:\n`{error}`\n\nPlease send corrected arguments:")
+
+            trace_token = tracing.begin("batch", chat_id, args=ff_args)
+
             # Ensure the download directory exists
             ensure_dir(download_dir)
             
@@ -156,7 +210,7 @@ def batch_feature(bot: Client):
             file_queue = deque()
             
             while True:
-                file_msg: Message = await bot.listen(chat_id)
+                file_msg: Message = await conv.listen(commands=("bs",))
                 
                 # Check if user wants to start processing
                 if file_msg.text and file_msg.text.startswith("/bs"):
@@ -200,13 +254,17 @@ def batch_feature(bot: Client):
                 # Download the file
                 await m.reply_text(f"⬇️ Downloading file {len(file_queue) + 1}: {original_name}")
                 try:
-                    local_path = await file_msg.download(file_name=file_path)
+                    with metrics.timed("fetch"), bandwidth.share("down") as share:
+                        local_path = await file_msg.download(file_name=file_path, progress=share.progress())
+                    metrics.bytes_total.inc(os.path.getsize(local_path), direction="down")
                     file_queue.append({
                         "id": file_msg.id,
+                        "n": len(file_queue) + 1,
                         "path": local_path,
                         "type": file_type,
                         "original_name": original_name
                     })
+                    metrics.queue_length.set(len(file_queue), chat=chat_id)
                     await m.reply_text(f"✅ Downloaded: `{os.path.basename(local_path)}` ({len(file_queue)} files in queue)")
                 except Exception as e:
                     await m.reply_text(f"❌ Failed to download file: {e}")
@@ -214,6 +272,7 @@ def batch_feature(bot: Client):
             # Check if there are any files to process
             if not file_queue:
                 return await m.reply_text("❌ No files to process.")
+            conv.state = "running"
             
             # Confirm batch processing is starting
             await m.reply_text(
@@ -226,14 +285,28 @@ def batch_feature(bot: Client):
             semaphore = asyncio.Semaphore(5)
             
             # Start the batch processing
-            await batch_worker(bot, chat_id, file_queue, ff_args, semaphore)
+            albums = DocBatcher(bot, chat_id) if DOC_ALBUMS else None
+            drain.hold(("batch", chat_id), "batch", "resume_batch",
+                       lambda: {"chat": chat_id, "args": ff_args, "files": list(file_queue)} if file_queue else None)
+            await batch_worker(bot, chat_id, file_queue, ff_args, semaphore, albums)
+            if albums:
+                await report_album_failures(bot, chat_id, await albums.flush())
+            if drain.draining():
+                return  # the new process works through the rest
+            drain.release(("batch", chat_id))
             
+            metrics.queue_length.remove(chat=chat_id)
+
             # Notify when all files are done
             await m.reply_text("✅ Batch processing complete!")
             
+        except SessionExpired:
+            raise
         except Exception as e:
             logging.error(f"Unexpected error in batch_handler: {e}")
             await send_message_in_parts(bot, chat_id, f"❌ An unexpected error occurred: {e}")
+        finally:
+            tracing.end(trace_token)
     
     # Add command handler for /bs outside of batch processing
     @bot.on_message(filters.command("bs") & filters.private)
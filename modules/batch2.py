@@ -1,11 +1,24 @@
 import os
+import time
 import asyncio
 import logging
 import signal
 from pyrogram import filters, Client
 from pyrogram.types import Message
 from pyrogram.enums import ChatAction
-from pyromod import listen  # for bot.listen()
+import metrics
+import tracing
+from fvr import run_ffmpeg, validate_args
+import multiout
+import serve
+import estimator
+import jobqueue
+import drain
+from docbatch import DocBatcher
+from vars import JOB_QUEUE, DOC_ALBUMS
+from bandwidth import bandwidth
+from uploadpool import pool as uploads
+from session import Session, store as sessions
 
 # ——— Configuration ———
 logging.basicConfig(
@@ -17,14 +30,25 @@ logging.basicConfig(
 DOWNLOAD_ROOT = "./downloads/batches"
 MAX_CONCURRENT = 5          # Max simultaneous ffmpeg jobs
 START_DELAY = 10            # Seconds between starting first 5 jobs
+QUEUE_POLL = 10             # Seconds between batch status checks in queue mode
 
-# ——— In‑memory State Stores ———
-pending_files = {}   # chat_id → list of (file_id, original_filename)
-batch_counters = {}  # chat_id → int
-batch_args = {}      # chat_id → ffmpeg args (str)
-batch_states = {}    # chat_id → "collecting"|"await_args"|"ready"|None
-batch_tasks = {}     # chat_id → list of asyncio.Task
-batch_procs = {}     # chat_id → list of subprocess.Process
+_queue = []          # the shared JobQueue, opened on first use
+
+# ——— Session State ———
+class Batch2Session(Session):
+    """state: "collecting" → "await_args" → "ready" → "running" → None."""
+
+    __slots__ = ("counter", "args", "files", "info", "sampled", "queue_key", "done")
+
+    def __init__(self, kind, chat):
+        super().__init__(kind, chat)
+        self.counter = 0
+        self.args = None       # ffmpeg args (str)
+        self.files = []        # (file_id, original_filename)
+        self.info = {}         # file_id → {"size", "duration", "pixels"} from Telegram
+        self.sampled = {}      # file_id → local path already fetched for sampling
+        self.queue_key = None  # job queue batch key (queue mode)
+        self.done = set()      # file_ids finished this batch, left out of a restart checkpoint
 
 # ——— Helpers ———
 def ensure_dir(path):
@@ -37,162 +61,397 @@ async def send_long(bot, chat_id, text):
     for part in split_long(text):
         await bot.send_message(chat_id, part)
 
+def get_queue():
+    if not _queue:
+        _queue.append(jobqueue.open_queue(JOB_QUEUE))
+    return _queue[0]
+
+async def report_album_failures(bot, chat_id, failures):
+    for _, name, e in failures:
+        await send_long(bot, chat_id, f"❌ `{name}` could not be sent:\n`{e}`")
+
+def reset_state(s):
+    """Back to idle; the session itself stays (with its batch counter) until it expires."""
+    metrics.queue_length.remove(chat=s.chat)
+    s.release()
+    s.state = None
+    s.files = []
+    s.args = None
+    s.tasks = []
+    s.procs = []
+    s.queue_key = None
+    s.info = {}
+    s.sampled = {}
+    s.done = set()
+
+async def record_estimate(args, result, outs):
+    """Teach the estimator from a finished encode of these args."""
+    probe_in = result.entry.get("probe_in") or {}
+    await estimator.observe_input(probe_in.get("size"), probe_in.get("duration"))
+    await estimator.observe(args, probe_in.get("duration"), estimator.pixels_of(probe_in), result.entry["wall"],
+                            sum(os.path.getsize(p) for p in outs if os.path.exists(p)))
+
+# ——— Per-file Pipeline ———
+async def fetch_input(bot: Client, chat_id, batch_no, file_id, orig_name):
+    dest_dir = os.path.join(DOWNLOAD_ROOT, f"batch_{batch_no}")
+    ensure_dir(dest_dir)
+    with metrics.timed("fetch"), bandwidth.share("down", chat_id) as share:
+        local_in = await bot.download_media(file_id, file_name=os.path.join(dest_dir, orig_name),
+                                            progress=share.progress())
+    metrics.bytes_total.inc(os.path.getsize(local_in), direction="down")
+    return local_in
+
+# Shared by the in-process scheduler below and by worker.py in queue mode
+async def process_file(bot: Client, chat_id, batch_no, file_id, orig_name, args, on_start=None, albums=None,
+                       local_in=None):
+    """Download one file, run ffmpeg on it, upload the result(s); returns True on success.
+
+    With `albums` (a DocBatcher) outputs are queued for the next album instead
+    of being sent one by one; the batcher deletes them once they're out.
+    `local_in` skips the download when the input is already on disk.
+    """
+    if not local_in:
+        await bot.send_message(chat_id, f"⬇️ Downloading `{orig_name}`…")
+        local_in = await fetch_input(bot, chat_id, batch_no, file_id, orig_name)
+    dest_dir = os.path.dirname(local_in)
+
+    # Build output path preserving original filename
+    base, _ = os.path.splitext(orig_name)
+    out_path = os.path.join(dest_dir, f"{base}_batch{batch_no}.mkv")
+
+    specs = multiout.parse_specs(args)
+    if len(specs) > 1:
+        return await run_multi_file(bot, chat_id, batch_no, local_in, orig_name,
+                                    os.path.join(dest_dir, f"{base}_batch{batch_no}"), specs, on_start, albums)
+
+    await bot.send_message(chat_id, f"⚙️ Running ffmpeg on `{orig_name}`…")
+    # A graceful restart lets this encode finish and the next process send the result
+    handoff = {"chat": chat_id, "caption": f"✅ `{orig_name}` done.", "cleanup": [local_in], "file_id": file_id}
+    result = await run_ffmpeg(local_in, args, out_path, chat_id, "batch2", on_start=on_start, handoff=handoff)
+    if result.returncode == 0:
+        await record_estimate(args, result, [out_path])
+
+    if result.returncode != 0:
+        err = result.stderr
+        logging.error(f"[Batch {batch_no}] `{orig_name}` error: {err}")
+        await send_long(bot, chat_id, f"❌ `{orig_name}` failed:\n`{err}`")
+    elif serve.wanted(out_path):
+        await serve.send_link(bot, chat_id, out_path, f"✅ `{orig_name}` done.\n`{result.usage.summary()}`")
+        out_path = None
+    elif albums:
+        caption = f"✅ `{orig_name}` done.\n`{result.usage.summary()}`"
+        await report_album_failures(bot, chat_id, await albums.add(out_path, caption, orig_name, orig_name))
+        out_path = None
+    else:
+        await bot.send_chat_action(chat_id, ChatAction.UPLOAD_DOCUMENT)
+        with metrics.timed("upload"), bandwidth.share("up", chat_id) as share:
+            await uploads.send_document(bot, chat_id, out_path,
+                                        caption=f"✅ `{orig_name}` done.\n`{result.usage.summary()}`",
+                                        progress=share.progress())
+        metrics.bytes_total.inc(os.path.getsize(out_path), direction="up")
+
+    # Cleanup
+    for p in (local_in, out_path):
+        try: os.remove(p)
+        except: pass
+    return result.returncode == 0
+
+async def run_multi_file(bot, chat_id, batch_no, local_in, orig_name, base, specs, on_start=None, albums=None):
+    outs = multiout.output_paths(base, specs)
+    await bot.send_message(chat_id, f"⚙️ Encoding {len(specs)} renditions of `{orig_name}` from one decode…")
+    result = await multiout.run_multi(local_in, specs, outs, chat_id, "batch2", on_start=on_start)
+    try:
+        if result.returncode != 0:
+            err = result.stderr
+            logging.error(f"[Batch {batch_no}] `{orig_name}` error: {err}")
+            await send_long(bot, chat_id, f"❌ `{orig_name}` failed:\n`{err}`")
+            return False
+        await record_estimate("\n".join(specs), result, outs)
+
+        if albums:
+            for i, path in enumerate(outs, 1):
+                caption = f"✅ `{orig_name}` rendition {i}/{len(specs)}: `{specs[i - 1]}`"
+                await report_album_failures(bot, chat_id, await albums.add(path, caption, orig_name, os.path.basename(path)))
+            outs = []  # the batcher removes them once sent
+            return True
+
+        async def upload(i, path):
+            if serve.wanted(path):
+                await serve.send_link(bot, chat_id, path, f"✅ `{orig_name}` rendition {i}/{len(specs)}: `{specs[i - 1]}`")
+                return
+            with metrics.timed("upload"), bandwidth.share("up", chat_id) as share:
+                await uploads.send_document(bot, chat_id, path,
+                                            caption=f"✅ `{orig_name}` rendition {i}/{len(specs)}: `{specs[i - 1]}`",
+                                            progress=share.progress())
+            metrics.bytes_total.inc(os.path.getsize(path), direction="up")
+
+        await bot.send_chat_action(chat_id, ChatAction.UPLOAD_DOCUMENT)
+        await asyncio.gather(*(upload(i, p) for i, p in enumerate(outs, 1)))
+        await bot.send_message(chat_id, f"`{result.usage.summary()}`")
+        return True
+    finally:
+        multiout.cleanup(outs + [local_in])
+
 # ——— Core Processing Coroutine ———
-async def process_batch(bot: Client, chat_id: int):
-    files = pending_files[chat_id][:]
-    args = batch_args[chat_id]
-    batch_no = batch_counters[chat_id]
-
-    sem = asyncio.Semaphore(MAX_CONCURRENT)
-    delays = [i * START_DELAY for i in range(MAX_CONCURRENT)]
-    tasks = []
-    procs = []
-    batch_procs[chat_id] = procs
-
-    async def run_file(idx, file_id, orig_name, delay):
-        await asyncio.sleep(delay)
-        async with sem:
-            # Download
-            await bot.send_message(chat_id, f"⬇️ Downloading `{orig_name}`…")
-            dest_dir = os.path.join(DOWNLOAD_ROOT, f"batch_{batch_no}")
-            ensure_dir(dest_dir)
-            local_in = await bot.download_media(file_id, file_name=os.path.join(dest_dir, orig_name))
-
-            # Build output path preserving original filename
-            base, _ = os.path.splitext(orig_name)
-            out_path = os.path.join(dest_dir, f"{base}_batch{batch_no}.mkv")
-
-            await bot.send_message(chat_id, f"⚙️ Running ffmpeg on `{orig_name}`…")
-            cmd = f"ffmpeg -i '{local_in}' {args} '{out_path}'"
-            proc = await asyncio.create_subprocess_shell(
-                cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
-            )
-            procs.append(proc)
-            _, stderr = await proc.communicate()
-
-            if proc.returncode != 0:
-                err = stderr.decode(errors="ignore")
-                logging.error(f"[Batch {batch_no}] `{orig_name}` error: {err}")
-                await send_long(bot, chat_id, f"❌ `{orig_name}` failed:\n`{err}`")
-            else:
-                await bot.send_chat_action(chat_id, ChatAction.UPLOAD_DOCUMENT)
-                await bot.send_document(chat_id, out_path, caption=f"✅ `{orig_name}` done.")
-
-            # Cleanup
-            for p in (local_in, out_path):
-                try: os.remove(p)
-                except: pass
+async def process_batch(bot: Client, s: Batch2Session):
+    chat_id = s.chat
+    files = s.files[:]
+    args = s.args
+    batch_no = s.counter
+    trace_token = tracing.begin("batch2", chat_id, batch=batch_no, args=args, files=len(files))
+
+    try:
+        sem = asyncio.Semaphore(MAX_CONCURRENT)
+        delays = [i * START_DELAY for i in range(MAX_CONCURRENT)]
+        tasks = []
+        procs = s.procs
+        albums = DocBatcher(bot, chat_id) if DOC_ALBUMS else None
+
+        async def run_file(idx, file_id, orig_name, delay):
+            await asyncio.sleep(delay)
+            async with sem:
+                if drain.draining():
+                    return  # checkpointed below, started again after the restart
+                with tracing.item(idx + 1, file=orig_name):
+                    metrics.queue_length.dec(chat=chat_id)
+                    await process_file(bot, chat_id, batch_no, file_id, orig_name, args, on_start=procs.append, albums=albums,
+                                       local_in=s.sampled.pop(file_id, None))
+                    s.done.add(file_id)
+
+        def checkpoint():
+            # Files ffmpeg is still encoding are handed off on their own, see drain.py
+            running = drain.handed_off("file_id")
+            left = [[fid, name] for fid, name in files if fid not in s.done and fid not in running]
+            if not left:
+                return None
+            return {"chat": chat_id, "batch": batch_no, "args": args, "files": left,
+                    "info": {fid: s.info[fid] for fid, _ in left if fid in s.info}}
+
+        drain.hold(("batch2", chat_id), "batch2", "resume_batch", checkpoint)
+
+        # Launch first up to MAX_CONCURRENT with staggered delays
+        for i, (fid, fname) in enumerate(files[:MAX_CONCURRENT]):
+            tasks.append(asyncio.create_task(run_file(i, fid, fname, delays[i])))
 
-    # Launch first up to MAX_CONCURRENT with staggered delays
-    for i, (fid, fname) in enumerate(files[:MAX_CONCURRENT]):
-        tasks.append(asyncio.create_task(run_file(i, fid, fname, delays[i])))
-
-    # Rolling‑window scheduler for the rest
-    async def schedule_rest():
-        started = len(tasks)
-        total = len(files)
-        while started < total:
-            # Wait until any slot frees
-            await sem.acquire()
-            sem.release()
-            fid, fname = files[started]
-            tasks.append(asyncio.create_task(run_file(started, fid, fname, 0)))
-            started += 1
-
-    scheduler = asyncio.create_task(schedule_rest())
-    tasks.append(scheduler)
-    batch_tasks[chat_id] = tasks
-
-    # Await all tasks
-    await asyncio.gather(*tasks, return_exceptions=True)
-    await bot.send_message(chat_id, f"🎉 Batch #{batch_no} complete!")
-
-    # Reset state
-    batch_states[chat_id] = None
-    pending_files[chat_id].clear()
-    batch_args.pop(chat_id, None)
-    batch_tasks.pop(chat_id, None)
-    batch_procs.pop(chat_id, None)
+        # Rolling‑window scheduler for the rest
+        async def schedule_rest():
+            started = len(tasks)
+            total = len(files)
+            while started < total:
+                # Wait until any slot frees
+                await sem.acquire()
+                sem.release()
+                fid, fname = files[started]
+                tasks.append(asyncio.create_task(run_file(started, fid, fname, 0)))
+                started += 1
+
+        scheduler = asyncio.create_task(schedule_rest())
+        tasks.append(scheduler)
+        s.tasks = tasks
+
+        # Await all tasks
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if albums:
+            await report_album_failures(bot, chat_id, await albums.flush())
+        if drain.draining():
+            return  # the new process finishes the batch
+        drain.release(("batch2", chat_id))
+        await bot.send_message(chat_id, f"🎉 Batch #{batch_no} complete!")
+        reset_state(s)
+    finally:
+        tracing.end(trace_token)
+
+async def resume_batch(bot: Client, state):
+    """After a graceful restart: run the files the old process hadn't started."""
+    s = sessions.get("batch2", state["chat"], Batch2Session)
+    s.counter = max(s.counter, state["batch"])
+    s.args = state["args"]
+    s.files = [tuple(f) for f in state["files"]]
+    s.info = state["info"]
+    s.state = "running"
+    metrics.queue_length.set(len(s.files), chat=s.chat)
+    await bot.send_message(s.chat, f"♻️ Back after a restart: Batch #{s.counter} continues with {len(s.files)} files.")
+    await process_batch(bot, s)
+
+# ——— Estimates & Ordering ———
+async def plan_batch(bot: Client, s: Batch2Session, order="sjf"):
+    """Estimate every file, put the batch in shortest-job-first order and post the ETAs."""
+    chat_id = s.chat
+    files = s.files
+    args = s.args
+    info = s.info
+    if not files:
+        return
+    if not estimator.known(args):
+        # Nothing learned for these args yet: sample the smallest input
+        fid, fname = min(files, key=lambda f: info.get(f[0], {}).get("size") or float("inf"))
+        await bot.send_message(chat_id, f"🔎 Sampling `{fname}` to estimate encode times…")
+        local_in = await fetch_input(bot, chat_id, s.counter, fid, fname)
+        await estimator.sample(local_in, args)
+        if JOB_QUEUE:
+            os.remove(local_in)  # workers fetch their own copy
+        else:
+            s.sampled[fid] = local_in
+
+    down, up = bandwidth.capacity("down"), bandwidth.capacity("up")
+    costs = {}
+    for fid, _ in files:
+        meta = info.get(fid, {})
+        est = estimator.predict(args, **meta)
+        if est:
+            costs[fid] = (est, (meta.get("size") or 0) / down + est.seconds + est.size / up)
+    if order != "fifo":
+        # Unknown files keep their place after the estimated ones
+        files.sort(key=lambda f: (f[0] not in costs, costs[f[0]][1] if f[0] in costs else 0))
+    if not costs:
+        return await bot.send_message(chat_id, "⏱️ No estimate available for these args, running in order.")
+
+    finish = estimator.schedule([costs[f][1] if f in costs else 0 for f, _ in files], MAX_CONCURRENT, START_DELAY)
+    lines = [f"⏱️ **Estimated plan** ({'submission' if order == 'fifo' else 'shortest-first'} order, "
+             f"{MAX_CONCURRENT} at a time):"]
+    for i, ((fid, fname), done) in enumerate(zip(files, finish), 1):
+        if i > 20:
+            lines.append(f"…and {len(files) - 20} more")
+            break
+        if fid in costs:
+            est = costs[fid][0]
+            lines.append(f"{i}. `{fname}` — encode ~{estimator.fmt_time(est.seconds)}, "
+                         f"~{est.size / 2**20:.0f} MB, ready in ~{estimator.fmt_time(done)}")
+        else:
+            lines.append(f"{i}. `{fname}` — no estimate")
+    source = {c[0].source for c in costs.values()}
+    lines.append(f"\n🏁 Batch ETA ~{estimator.fmt_time(max(finish))} "
+                 f"({'from past runs' if source == {'history'} else 'from samples'})")
+    await send_long(bot, chat_id, "\n".join(lines))
+
+# ——— Queue Mode ———
+async def enqueue_batch(bot: Client, s: Batch2Session):
+    """Hand every file to the worker processes, then report once they've all finished."""
+    queue = get_queue()
+    chat_id = s.chat
+    files = s.files[:]
+    args = s.args
+    batch_no = s.counter
+    key = f"{chat_id}:{batch_no}:{int(time.time())}"
+    s.queue_key = key
+    for file_id, orig_name in files:
+        payload = {"chat": chat_id, "batch_no": batch_no, "file_id": file_id, "file_name": orig_name, "args": args}
+        await queue.enqueue("batch2", payload, chat=chat_id, batch=key)
+    await bot.send_message(chat_id, f"📤 Queued {len(files)} files for the workers.")
+
+    while True:
+        await asyncio.sleep(QUEUE_POLL)
+        status = await queue.batch_status(key)
+        left = status.get("queued", 0) + status.get("running", 0)
+        metrics.queue_length.set(left, chat=chat_id)
+        if not left:
+            break
+    await bot.send_message(
+        chat_id, f"🎉 Batch #{batch_no} complete! ✅ {status.get('done', 0)} done, ❌ {status.get('failed', 0)} failed."
+    )
+    reset_state(s)
 
 # ——— Feature Registration ———
 def batch_feature2(bot: Client):
     @bot.on_message(filters.command("batch2") & filters.private)
     async def start_batch(_, m: Message):
-        cid = m.chat.id
-        batch_counters[cid] = batch_counters.get(cid, 0) + 1
-        pending_files[cid] = []
-        batch_states[cid] = "collecting"
-        ensure_dir(os.path.join(DOWNLOAD_ROOT, f"batch_{batch_counters[cid]}"))
+        s = sessions.get("batch2", m.chat.id, Batch2Session)
+        if s.running:
+            return await m.reply_text(f"⏳ Batch #{s.counter} is still running. Wait for it or /nuke it.")
+        reset_state(s)
+        s.counter += 1
+        s.state = "collecting"
+        s.route(lambda msg: on_message(s, msg))
+        ensure_dir(os.path.join(DOWNLOAD_ROOT, f"batch_{s.counter}"))
         await m.reply_text(
-            f"📦 Started Batch #{batch_counters[cid]}.\n"
+            f"📦 Started Batch #{s.counter}.\n"
             "Send me all your videos/.mkv files. When done, send /end."
         )
 
     @bot.on_message(filters.command("end") & filters.private)
     async def end_collection(_, m: Message):
-        cid = m.chat.id
-        if batch_states.get(cid) != "collecting":
+        s = sessions.find("batch2", m.chat.id)
+        if not s or s.state != "collecting":
             return await m.reply_text("⚠️ No active batch. Use /batch first.")
-        batch_states[cid] = "await_args"
-        count = len(pending_files[cid])
+        s.state = "await_args"
+        count = len(s.files)
         await m.reply_text(f"✅ Collected {count} files. Now send your ffmpeg args (or “help”).")
 
     @bot.on_message(filters.command("nuke") & filters.private)
     async def nuke_batch(_, m: Message):
-        cid = m.chat.id
-        # cancel asyncio tasks
-        for t in batch_tasks.get(cid, []):
-            t.cancel()
-        # kill subprocesses
-        for p in batch_procs.get(cid, []):
-            try: p.send_signal(signal.SIGKILL)
-            except: pass
-        # reset
-        batch_states[cid] = None
-        pending_files[cid].clear()
-        batch_args.pop(cid, None)
-        batch_tasks.pop(cid, None)
-        batch_procs.pop(cid, None)
+        s = sessions.find("batch2", m.chat.id)
+        if s:
+            # cancel asyncio tasks
+            for t in s.tasks:
+                t.cancel()
+            # kill subprocesses
+            for p in s.procs:
+                try: p.send_signal(signal.SIGKILL)
+                except: pass
+            # queued jobs; workers drop running ones on their next heartbeat
+            if s.queue_key:
+                await get_queue().cancel_batch(s.queue_key)
+            # reset
+            reset_state(s)
         await m.reply_text("💥 All ongoing downloads & ffmpeg jobs have been nuked.")
 
     @bot.on_message(filters.command("s") & filters.private)
     async def start_processing(_, m: Message):
-        cid = m.chat.id
-        if batch_states.get(cid) != "ready":
+        s = sessions.find("batch2", m.chat.id)
+        if not s or s.state != "ready":
             return await m.reply_text("⚠️ Finish with /end & send args before /s.")
+        order = "fifo" if len(m.command) > 1 and m.command[1].lower() == "fifo" else "sjf"
+        s.state = "running"
         await m.reply_text("🚀 Launching batch processing…")
-        asyncio.create_task(process_batch(bot, cid))
 
-    @bot.on_message(filters.private & ~filters.command(["batch","end","s","nuke"]))
-    async def catch_all(_, m: Message):
-        cid = m.chat.id
-        state = batch_states.get(cid)
+        async def launch():
+            try:
+                await plan_batch(bot, s, order)
+            except Exception as e:
+                logging.error(f"Estimating batch for {s.chat} failed: {e}")
+            await (enqueue_batch if JOB_QUEUE else process_batch)(bot, s)
+        s.tasks = [asyncio.create_task(launch())]
 
-        if state == "collecting":
+    # Files and args arrive through the router while the session holds the chat
+    async def on_message(s: Batch2Session, m: Message):
+        if s.state == "collecting":
             media = m.video or (
                 m.document if m.document and m.document.file_name.lower().endswith(".mkv") else None
             )
             if not media:
                 return await m.reply_text("❌ Please send a video or .mkv document.")
             fname = media.file_name or f"{media.file_unique_id}.mkv"
-            pending_files[cid].append((media.file_id, fname))
+            s.files.append((media.file_id, fname))
+            s.info[media.file_id] = {
+                "size": media.file_size,
+                "duration": getattr(media, "duration", None),
+                "pixels": media.width * media.height if getattr(media, "width", None) else None,
+            }
+            metrics.queue_length.set(len(s.files), chat=s.chat)
             await m.reply_text(f"✔️ Collected `{fname}`")
 
-        elif state == "await_args":
+        elif s.state == "await_args":
             txt = m.text.strip()
             if txt.lower() in ("help","?","examples"):
                 await m.reply_text(
                     "Examples:\n"
                     "`-vf scale=1280:720 -c:v libx264 -crf 23`\n"
                     "`-q:v 2 -preset slow`\n"
-                    "`-c:v copy -c:a copy`\n\nNow send your ffmpeg args:"
+                    "`-c:v copy -c:a copy`\n"
+                    "Several lines (one per output) encode multiple renditions from a single decode.\n\n"
+                    "Now send your ffmpeg args:"
                 )
                 return
-            batch_args[cid] = txt
-            batch_states[cid] = "ready"
+            specs = multiout.parse_specs(txt)
+            error = await (multiout.validate_specs(specs) if len(specs) > 1 else validate_args(txt))
+            if error:
+                return await m.reply_text(f"❌ These ffmpeg args won't work:\n`{error}`\n\nSend corrected args:")
+            s.args = txt
+            s.state = "ready"
+            s.release()
             await m.reply_text(
-                f"📥 FFmpeg args set. {len(pending_files[cid])} files queued.\n"
-                "Send /s to start processing."
+                f"📥 FFmpeg args set. {len(s.files)} files queued.\n"
+                "Send /s to start processing (shortest files first), or `/s fifo` to keep your order."
             )
 
     return bot
@@ -0,0 +1,387 @@
+"""Offline end-to-end benchmark for the bot's flows.
+
+Runs /upload, /pro, /batch and /batch2 against a fake pyrogram client and a
+local HTTPS server, so throughput can be measured without a Telegram
+account or real course sites:
+
+    python modules/bench.py --flows upload,pro,batch,batch2 --files 4 --seconds 20 --upload-mbps 40
+
+Needs ffmpeg, openssl and the bot's own requirements.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import resource
+import tempfile
+import subprocess
+from types import SimpleNamespace
+from collections import defaultdict
+
+from aiohttp import web
+from pyrogram.enums import ChatType
+from pyrogram.errors import StopPropagation
+
+import router
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CHAT_ID = 777
+CHUNK = 512 * 1024
+
+
+# ——— Fake Telegram ———
+class FakeMessage:
+    _ids = iter(range(1, 1 << 30))
+
+    def __init__(self, client, text=None, video=None, document=None, outgoing=False):
+        self._client = client
+        self.id = next(self._ids)
+        self.chat = SimpleNamespace(id=CHAT_ID, type=ChatType.PRIVATE)
+        self.from_user = SimpleNamespace(id=CHAT_ID)
+        self.text = text
+        self.caption = None
+        self.video = video
+        self.document = document
+        self.outgoing = outgoing
+
+    # incoming media
+    async def download(self, file_name=None, **kwargs):
+        media = self.video or self.document
+        return await self._client._fetch(media.file_id, file_name)
+
+    # replies
+    async def reply_text(self, text, *args, **kwargs):
+        return self._client._sent(text)
+
+    async def reply_document(self, document, caption="", progress=None, progress_args=(), **kwargs):
+        return await self._client.send_document(CHAT_ID, document, caption, progress=progress,
+                                                progress_args=progress_args)
+
+    async def reply_video(self, video, caption="", progress=None, progress_args=(), **kwargs):
+        return await self._client.send_video(CHAT_ID, video, caption, progress=progress,
+                                             progress_args=progress_args)
+
+    async def reply_chat_action(self, action):
+        pass
+
+    async def edit(self, text, *args, **kwargs):
+        self.text = text
+        return self
+
+    edit_text = edit
+
+    async def delete(self, revoke=True):
+        pass
+
+    def stop_propagation(self):
+        raise StopPropagation
+
+
+class FakeClient:
+    """Just enough of pyrogram.Client to drive the flows; scripted replies go through the router."""
+
+    def __init__(self, files, upload_bps, download_bps):
+        self.me = SimpleNamespace(username="benchbot", id=1)
+        self.handlers = []
+        self.files = files  # file_id → local source path
+        self.upload_bps = upload_bps
+        self.download_bps = download_bps
+        self.inbox = asyncio.Queue()
+        self.outbox = []
+        self.stages = defaultdict(list)
+        self.delivered = []  # (timestamp, bytes)
+        router.attach(self)
+        self.feeder = asyncio.ensure_future(self._feed())
+
+    # handler registration; filters are evaluated directly, groups are registration order
+    def on_message(self, flt=None, group=0):
+        def decorator(func):
+            self.handlers.append((func, flt))
+            return func
+        return decorator
+
+    async def dispatch(self, m):
+        for func, flt in self.handlers:
+            if flt is None or await flt(self, m):
+                try:
+                    await func(self, m)
+                except StopPropagation:
+                    pass
+                return
+
+    # conversation replies, handed over once a flow is waiting for them
+    async def _feed(self):
+        while True:
+            m = await self.inbox.get()
+            while not router.router.owner(CHAT_ID):
+                await asyncio.sleep(0.01)
+            await self.dispatch(m)
+
+    # outgoing
+    def _sent(self, text):
+        m = FakeMessage(self, text=text, outgoing=True)
+        self.outbox.append(text)
+        return m
+
+    async def send_message(self, chat_id, text, *args, **kwargs):
+        return self._sent(text)
+
+    async def send_chat_action(self, chat_id, action):
+        pass
+
+    async def _transfer(self, path, bps, progress=None, progress_args=()):
+        size = os.path.getsize(path)
+        done = 0
+        while done < size:
+            n = min(CHUNK, size - done)
+            await asyncio.sleep(n / bps)
+            done += n
+            if progress:
+                await progress(done, size, *progress_args)
+        return size
+
+    async def send_document(self, chat_id, document, caption="", progress=None, progress_args=(), **kwargs):
+        start = time.perf_counter()
+        size = await self._transfer(document, self.upload_bps, progress, progress_args)
+        self.stages["upload"].append(time.perf_counter() - start)
+        self.delivered.append((time.perf_counter(), size))
+        return self._sent(caption)
+
+    send_video = send_document
+
+    async def _fetch(self, file_id, file_name=None):
+        start = time.perf_counter()
+        src = self.files[file_id]
+        dest = file_name or os.path.join("downloads", os.path.basename(src))
+        os.makedirs(os.path.dirname(dest) or ".", exist_ok=True)
+        await self._transfer(src, self.download_bps)
+        shutil.copyfile(src, dest)
+        self.stages["fetch"].append(time.perf_counter() - start)
+        return dest
+
+    async def download_media(self, file_id, file_name=None, **kwargs):
+        return await self._fetch(file_id, file_name)
+
+    # helpers for scripting conversations
+    def text(self, text):
+        return FakeMessage(self, text=text)
+
+    def media(self, file_id, as_video=True):
+        name = os.path.basename(self.files[file_id])
+        media = SimpleNamespace(file_id=file_id, file_unique_id=file_id, file_name=name)
+        return FakeMessage(self, video=media) if as_video else FakeMessage(self, document=media)
+
+    async def wait_for(self, needle, timeout=3600):
+        start = len(self.outbox)
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if any(needle in (t or "") for t in self.outbox[start:]):
+                return
+            await asyncio.sleep(0.1)
+        raise TimeoutError(needle)
+
+
+# ——— Local Fixtures ———
+def ffmpeg(*args):
+    subprocess.run(["ffmpeg", "-hide_banner", "-loglevel", "error", "-y", *args], check=True)
+
+
+def make_fixtures(root, count, seconds):
+    """Synthetic videos, an HLS rendition, a PDF and a self-signed certificate."""
+    videos = []
+    for i in range(count):
+        path = os.path.join(root, f"v{i}.mp4")
+        ffmpeg("-f", "lavfi", "-i", f"testsrc=size=1280x720:rate=25:duration={seconds}",
+               "-f", "lavfi", "-i", f"sine=frequency={400 + i * 100}:duration={seconds}",
+               "-c:v", "libx264", "-preset", "ultrafast", "-c:a", "aac", "-shortest", path)
+        videos.append(path)
+
+    os.makedirs(os.path.join(root, "hls"), exist_ok=True)
+    ffmpeg("-i", videos[0], "-c", "copy", "-f", "hls", "-hls_time", "4",
+           "-hls_playlist_type", "vod", os.path.join(root, "hls", "index.m3u8"))
+
+    with open(os.path.join(root, "notes.pdf"), "wb") as f:
+        f.write(b"%PDF-1.4\n" + os.urandom(512 * 1024) + b"\n%%EOF\n")
+
+    subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+                    "-subj", "/CN=127.0.0.1", "-keyout", os.path.join(root, "key.pem"),
+                    "-out", os.path.join(root, "cert.pem")], check=True, capture_output=True)
+    return videos
+
+
+async def serve(root):
+    """HTTPS static server; FileResponse answers Range requests itself."""
+    import ssl
+
+    async def handle(request):
+        path = os.path.join(root, request.match_info["path"])
+        if not os.path.isfile(path):
+            raise web.HTTPNotFound()
+        return web.FileResponse(path)
+
+    app = web.Application()
+    app.router.add_get("/{path:.+}", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    ctx = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    ctx.load_cert_chain(os.path.join(root, "cert.pem"), os.path.join(root, "key.pem"))
+    site = web.TCPSite(runner, "127.0.0.1", 0, ssl_context=ctx)
+    await site.start()
+    return runner, site._server.sockets[0].getsockname()[1]
+
+
+# ——— Flows ———
+FF_ARGS = "-c:v libx264 -preset ultrafast -crf 30 -c:a copy"
+
+
+async def flow_upload(bot, port, videos):
+    import main
+    lines = [f"Video {i}:https://127.0.0.1:{port}/{os.path.basename(v)}" for i, v in enumerate(videos)]
+    lines += [f"Stream:https://127.0.0.1:{port}/hls/index.m3u8", f"Notes:https://127.0.0.1:{port}/notes.pdf"]
+    with open("links.txt", "w") as f:
+        f.write("\n".join(lines))
+    bot.files["links"] = os.path.abspath("links.txt")
+    for reply in (bot.media("links", as_video=False), bot.text("1"), bot.text("Bench"),
+                  bot.text("720"), bot.text("bench"), bot.text("no")):
+        bot.inbox.put_nowait(reply)
+    await main.account_login(bot, bot.text("/upload"))
+
+
+async def flow_pro(bot, port, videos):
+    import pro
+    pro.pro_feature(bot)
+    for i in range(len(videos)):
+        bot.inbox.put_nowait(bot.media(f"v{i}"))
+        bot.inbox.put_nowait(bot.text(FF_ARGS))
+        await bot.dispatch(bot.text("/pro"))
+
+
+async def flow_batch(bot, port, videos):
+    import batch
+    batch.batch_feature(bot)
+    bot.inbox.put_nowait(bot.text(FF_ARGS))
+    for i in range(len(videos)):
+        bot.inbox.put_nowait(bot.media(f"v{i}"))
+    bot.inbox.put_nowait(bot.text("/bs"))
+    await bot.dispatch(bot.text("/batch"))
+
+
+async def flow_batch2(bot, port, videos):
+    import batch2
+    batch2.batch_feature2(bot)
+    await bot.dispatch(bot.text("/batch2"))
+    for i in range(len(videos)):
+        await bot.dispatch(bot.media(f"v{i}"))
+    await bot.dispatch(bot.text("/end"))
+    await bot.dispatch(bot.text(FF_ARGS))
+    await bot.dispatch(bot.text("/s"))
+    await bot.wait_for("complete!")
+
+
+FLOWS = {"upload": flow_upload, "pro": flow_pro, "batch": flow_batch, "batch2": flow_batch2}
+
+
+# ——— Reporting ———
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+async def watch_disk(path, peak):
+    while True:
+        total = 0
+        for dirpath, _, names in os.walk(path):
+            for n in names:
+                try: total += os.path.getsize(os.path.join(dirpath, n))
+                except OSError: pass
+        peak[0] = max(peak[0], total)
+        await asyncio.sleep(0.5)
+
+
+async def run(args):
+    workdir = tempfile.mkdtemp(prefix="bench_")
+    fixtures = os.path.join(workdir, "www")
+    os.makedirs(fixtures)
+    videos = make_fixtures(fixtures, args.files, args.seconds)
+
+    # Trust the self-signed fixture server in both the yt-dlp CLI and the pool
+    conf = os.path.join(workdir, "config", "yt-dlp")
+    os.makedirs(conf)
+    with open(os.path.join(conf, "config"), "w") as f:
+        f.write("--no-check-certificates\n")
+    os.environ["XDG_CONFIG_HOME"] = os.path.dirname(conf)
+    import ytdl_pool
+    ytdl_pool.DEFAULT_OPTS["nocheckcertificate"] = True
+
+    runner, port = await serve(fixtures)
+    results = {}
+    for name in args.flows:
+        cwd = os.path.join(workdir, name)
+        os.makedirs(cwd)
+        os.chdir(cwd)
+        files = {f"v{i}": v for i, v in enumerate(videos)}
+        bot = FakeClient(files, args.upload_mbps * 125000, args.download_mbps * 125000)
+        peak_disk = [0]
+        watcher = asyncio.create_task(watch_disk(cwd, peak_disk))
+        start = time.perf_counter()
+        await FLOWS[name](bot, port, videos)
+        wall = time.perf_counter() - start
+        watcher.cancel()
+        bot.feeder.cancel()
+
+        marks = [start] + [t for t, _ in bot.delivered]
+        item = [b - a for a, b in zip(marks, marks[1:])]
+        sent = sum(size for _, size in bot.delivered)
+        results[name] = {
+            "files": len(bot.delivered),
+            "wall_s": round(wall, 2),
+            "files_per_min": round(len(bot.delivered) / wall * 60, 2),
+            "bytes_per_s": round(sent / wall),
+            "stages": {stage: {"p50": round(percentile(v, 50), 3), "p95": round(percentile(v, 95), 3)}
+                       for stage, v in {**bot.stages, "item": item}.items()},
+            "peak_disk": peak_disk[0],
+        }
+        os.chdir(HERE)
+
+    await ytdl_pool.pool.close()
+    await runner.cleanup()
+    peak_rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                   resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) * 1024
+    shutil.rmtree(workdir, ignore_errors=True)
+    return results, peak_rss
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--flows", default="upload,pro,batch,batch2")
+    parser.add_argument("--files", type=int, default=3)
+    parser.add_argument("--seconds", type=int, default=20, help="length of each synthetic video")
+    parser.add_argument("--upload-mbps", type=float, default=40.0)
+    parser.add_argument("--download-mbps", type=float, default=200.0)
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+    args.flows = [f for f in args.flows.split(",") if f]
+
+    sys.path.insert(0, HERE)
+    results, peak_rss = asyncio.run(run(args))
+
+    for name, r in results.items():
+        print(f"\n[{name}] {r['files']} files in {r['wall_s']}s — "
+              f"{r['files_per_min']} files/min, {r['bytes_per_s'] / 1e6:.2f} MB/s, "
+              f"peak disk {r['peak_disk'] / 1e6:.1f} MB")
+        for stage, p in r["stages"].items():
+            print(f"  {stage:<8} p50 {p['p50']:8.3f}s   p95 {p['p95']:8.3f}s")
+    print(f"\npeak RSS: {peak_rss / 1e6:.1f} MB")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"flows": results, "peak_rss": peak_rss}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import os
+import re
 import time
 import datetime
 import aiohttp
@@ -6,11 +7,18 @@ import aiofiles
 import asyncio
 import logging
 import requests
-import tgcrypto
 import subprocess
 import concurrent.futures
 
-from utils import progress_bar
+from utils import progress_bar, download_progress
+from ytdl_pool import pool, YtdlError, with_rate_limit
+from aria2 import daemon as aria2, Aria2Error, YTDL_FALLBACK
+from bandwidth import bandwidth
+from uploadpool import pool as uploads
+import metrics
+import sampler
+import retry
+import formats
 
 from pyrogram import Client, filters
 from pyrogram.types import Message
@@ -51,58 +59,39 @@ async def download(url,name):
     async with aiohttp.ClientSession() as session:
         async with session.get(url) as resp:
             if resp.status == 200:
-                f = await aiofiles.open(ka, mode='wb')
-                await f.write(await resp.read())
-                await f.close()
+                with bandwidth.share("down") as share:
+                    f = await aiofiles.open(ka, mode='wb')
+                    async for chunk in resp.content.iter_chunked(256 * 1024):
+                        await share.consume(len(chunk))
+                        await f.write(chunk)
+                    await f.close()
     return ka
 
 
 
+_SPACES = re.compile(r" {2,}")
+
+
 def parse_vid_info(info):
-    info = info.strip()
-    info = info.split("\n")
     new_info = []
-    temp = []
-    for i in info:
-        i = str(i)
+    temp = set()
+    for i in info.strip().split("\n"):
         if "[" not in i and '---' not in i:
-            while "  " in i:
-                i = i.replace("  ", " ")
-            i.strip()
-            i = i.split("|")[0].split(" ",2)
-            try:
-                if "RESOLUTION" not in i[2] and i[2] not in temp and "audio" not in i[2]:
-                    temp.append(i[2])
-                    new_info.append((i[0], i[2]))
-            except:
-                pass
+            i = _SPACES.sub(" ", i).split("|", 1)[0].split(" ", 2)
+            if len(i) > 2 and "RESOLUTION" not in i[2] and i[2] not in temp and "audio" not in i[2]:
+                temp.add(i[2])
+                new_info.append((i[0], i[2]))
     return new_info
 
 
 def vid_info(info):
-    info = info.strip()
-    info = info.split("\n")
     new_info = dict()
-    temp = []
-    for i in info:
-        i = str(i)
+    for i in info.strip().split("\n"):
         if "[" not in i and '---' not in i:
-            while "  " in i:
-                i = i.replace("  ", " ")
-            i.strip()
-            i = i.split("|")[0].split(" ",3)
-            try:
-                if "RESOLUTION" not in i[2] and i[2] not in temp and "audio" not in i[2]:
-                    temp.append(i[2])
-                    
-                    # temp.update(f'{i[2]}')
-                    # new_info.append((i[2], i[0]))
-                    #  mp4,mkv etc ==== f"({i[1]})" 
-                    
-                    new_info.update({f'{i[2]}':f'{i[0]}'})
-
-            except:
-                pass
+            i = _SPACES.sub(" ", i).split("|", 1)[0].split(" ", 3)
+            # mp4,mkv etc ==== f"({i[1]})"
+            if len(i) > 2 and "RESOLUTION" not in i[2] and i[2] not in new_info and "audio" not in i[2]:
+                new_info[i[2]] = i[0]
     return new_info
 
 
@@ -151,17 +140,44 @@ def time_name():
     return f"{date} {current_time}.mp4"
 
 
-async def download_video(url,cmd, name):
-    download_cmd = f'{cmd} -R 25 --fragment-retries 25 --external-downloader aria2c --downloader-args "aria2c: -x 16 -j 32"'
-    global failed_counter
-    print(download_cmd)
-    logging.info(download_cmd)
-    k = subprocess.run(download_cmd, shell=True)
-    if "visionias" in cmd and k.returncode != 0 and failed_counter <= 10:
-        failed_counter += 1
-        await asyncio.sleep(5)
-        await download_video(url, cmd, name)
-    failed_counter = 0
+async def download_video(url, opts, name, info_path=None, reply=None):
+    logging.info(f"yt-dlp {url} {opts}")
+    progress = None
+    if reply:
+        async def progress(current, total, speed):
+            await download_progress(current, total, speed, reply)
+
+    # Single-file formats go to the shared aria2c daemon; the rest to yt-dlp's own downloader
+    direct = aria2.enabled and formats.direct_format(url, opts.get("format"))
+    if aria2.enabled:
+        opts = {**opts, **YTDL_FALLBACK}
+
+    async def attempt():
+        if direct:
+            # outtmpl always says .mp4; the file gets the extension of what the format really is
+            base = os.path.splitext(opts["outtmpl"])[0] if opts.get("outtmpl") else name
+            path = f"{base}.{direct.get('ext') or 'mp4'}"
+            return await aria2.download(direct["url"], path, direct.get("http_headers"), progress, lambda: share.rate)
+        # The share's rate is fixed for the yt-dlp run; a retry picks up the current one
+        job = await pool.submit(url, with_rate_limit(opts, share.rate), info_path, progress)
+        try:
+            async with sampler.account(job.worker.proc.pid, f"yt-dlp {name}"):
+                return await job
+        except asyncio.CancelledError:
+            pool.cancel(job)
+            raise
+
+    # Backoff and per-host circuit breaking live in retry.py; CircuitOpen goes to the caller
+    try:
+        with metrics.timed("download"), bandwidth.share("down") as share:
+            path = await retry.call(url, attempt, retry_on=(YtdlError, Aria2Error))
+    except (YtdlError, Aria2Error, retry.CircuitOpen):
+        metrics.jobs_total.inc(kind="download", status="failed")
+        raise
+    metrics.jobs_total.inc(kind="download", status="ok")
+    if path and os.path.isfile(path):
+        metrics.bytes_total.inc(os.path.getsize(path), direction="down")
+        return path
     try:
         if os.path.isfile(name):
             return name
@@ -182,18 +198,19 @@ async def download_video(url,cmd, name):
 
 async def send_doc(bot: Client, m: Message,cc,ka,cc1,prog,count,name):
     reply = await m.reply_text(f"Uploading » `{name}`")
-    time.sleep(1)
+    await asyncio.sleep(1)
     start_time = time.time()
     await m.reply_document(ka,caption=cc1)
     count+=1
     await reply.delete (True)
-    time.sleep(1)
+    await asyncio.sleep(1)
     os.remove(ka)
-    time.sleep(3) 
+    await asyncio.sleep(3) 
 
 
 async def send_vid(bot: Client, m: Message,cc,filename,thumb,name,prog):
-    subprocess.run(f'ffmpeg -i "{filename}" -ss 00:01:00 -vframes 1 "{filename}.jpg"', shell=True)
+    with metrics.timed("thumbnail"):
+        subprocess.run(f'ffmpeg -i "{filename}" -ss 00:01:00 -vframes 1 "{filename}.jpg"', shell=True)
     await prog.delete (True)
     reply = await m.reply_text(f"**⥣ Uploading ...** » `{name}`")
     try:
@@ -204,14 +221,18 @@ async def send_vid(bot: Client, m: Message,cc,filename,thumb,name,prog):
     except Exception as e:
         await m.reply_text(str(e))
 
-    dur = int(duration(filename))
+    with metrics.timed("ffprobe"):
+        dur = int(duration(filename))
 
     start_time = time.time()
-
-    try:
-        await m.reply_video(filename,caption=cc, supports_streaming=True,height=720,width=1280,thumb=thumbnail,duration=dur, progress=progress_bar,progress_args=(reply,start_time))
-    except Exception:
-        await m.reply_document(filename,caption=cc, progress=progress_bar,progress_args=(reply,start_time))
+    size = os.path.getsize(filename)
+
+    with metrics.timed("upload"), bandwidth.share("up") as share:
+        try:
+            await uploads.send_video(bot, m.chat.id, filename,caption=cc, supports_streaming=True,height=720,width=1280,thumb=thumbnail,duration=dur, progress=share.progress(progress_bar),progress_args=(reply,start_time))
+        except Exception:
+            await uploads.send_document(bot, m.chat.id, filename,caption=cc, progress=share.progress(progress_bar),progress_args=(reply,start_time))
+    metrics.bytes_total.inc(size, direction="up")
     os.remove(filename)
 
     os.remove(f"{filename}.jpg")
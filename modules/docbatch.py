@@ -0,0 +1,100 @@
+import os
+import asyncio
+import logging
+from pyrogram.types import InputMediaDocument
+from pyrogram.errors import FloodWait
+
+import metrics
+import tracing
+from uploadpool import pool as uploads
+
+# ——— Configuration ———
+GROUP_SIZE = 10   # Telegram's maximum album size
+DOWNLOADS = 4     # Documents fetched at once per batcher
+
+
+class DocBatcher:
+    """Collects documents for one chat and sends them as albums of up to GROUP_SIZE.
+
+    Documents are fetched in the background as soon as they're added, and
+    albums keep the order they were added in. Callers flush whenever
+    something else (a video) has to appear between documents, and once at
+    the end. add() and flush() return the documents that could not be
+    fetched or sent as (key, name, exception) for the caller to report.
+    """
+
+    def __init__(self, bot, chat_id, size=GROUP_SIZE, downloads=DOWNLOADS, cleanup=True):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.size = size
+        self.cleanup = cleanup
+        self.group = []  # (future path, caption, key, name)
+        self._sem = asyncio.Semaphore(downloads)
+
+    @property
+    def pending(self):
+        return len(self.group)
+
+    async def _fetch(self, fetch):
+        async with self._sem:
+            return await fetch()
+
+    async def add(self, source, caption, key=None, name=None):
+        """Queue a document: `source` is a path, or a coroutine function that downloads one."""
+        if callable(source):
+            future = asyncio.ensure_future(self._fetch(source))
+        else:
+            future = asyncio.get_running_loop().create_future()
+            future.set_result(source)
+        self.group.append((future, caption, key, name))
+        if len(self.group) >= self.size:
+            return await self.flush()
+        return []
+
+    async def flush(self):
+        group, self.group = self.group, []
+        if not group:
+            return []
+        await asyncio.gather(*(f for f, _, _, _ in group), return_exceptions=True)
+
+        ready, failures = [], []
+        for future, caption, key, name in group:
+            error = future.exception()
+            if error is None and not os.path.isfile(future.result()):
+                error = FileNotFoundError(f"{name or key}: download produced no file")
+            if error is None:
+                ready.append((future.result(), caption, key, name))
+            else:
+                failures.append((key, name, error))
+
+        if ready:
+            try:
+                await self._send([(path, caption) for path, caption, _, _ in ready])
+            except Exception as e:
+                logging.error(f"Sending {len(ready)} documents failed: {e}")
+                failures.extend((key, name, e) for _, _, key, name in ready)
+            finally:
+                if self.cleanup:
+                    for path, _, _, _ in ready:
+                        try: os.remove(path)
+                        except OSError: pass
+        return failures
+
+    async def _send(self, items):
+        size = sum(os.path.getsize(p) for p, _ in items)
+        while True:
+            try:
+                with metrics.timed("upload", documents=len(items)):
+                    if len(items) == 1:
+                        await uploads.send_document(self.bot, self.chat_id, items[0][0], caption=items[0][1])
+                    else:
+                        await uploads.send_media_group(
+                            self.bot, self.chat_id, [InputMediaDocument(p, caption=c) for p, c in items]
+                        )
+                break
+            except FloodWait as e:
+                logging.warning(f"FloodWait {e.value}s while sending {len(items)} documents")
+                metrics.floodwait_seconds.inc(e.value)
+                with tracing.span("floodwait", seconds=e.value):
+                    await asyncio.sleep(e.value)
+        metrics.bytes_total.inc(size, direction="up")
@@ -0,0 +1,230 @@
+import os
+import sys
+import json
+import time
+import signal
+import asyncio
+import logging
+from pyrogram import filters
+
+import loader
+import metrics
+from session import store as sessions
+
+# ——— Configuration ———
+STATE_FILE = "./downloads/drain.json"
+UPLOAD_DEADLINE = int(os.environ.get("DRAIN_UPLOAD_TIMEOUT", 300))  # Seconds uploads in progress get to finish
+REATTACH_POLL = 2           # Seconds between checks on an encode left running by the old process
+JOB_COMMANDS = ["upload", "pro", "batch", "batch2", "s"]
+GROUP = -3                  # Ahead of the router, so no new work starts while draining
+
+_state = {"draining": False}
+_held = {}  # key → (module, resume function, state callable): work picked up again after a restart
+
+
+def _running():
+    """fvr's running encodes; none if no encode has loaded fvr yet."""
+    return sys.modules["fvr"].running if "fvr" in sys.modules else {}
+
+
+def draining():
+    return _state["draining"]
+
+
+def hold(key, module, resume, state):
+    """Save `state()` on a graceful restart and call module.resume(bot, state) once the bot is back.
+
+    `key` is a (kind, chat) pair; `state` returns a JSON-able dict, or None
+    when there is nothing left worth resuming.
+    """
+    _held[key] = (module, resume, state)
+
+
+def release(key):
+    _held.pop(key, None)
+
+
+def handed_off(field):
+    """`field` of every running encode's handoff, e.g. the batch2 file ids ffmpeg already has."""
+    return {rec["handoff"].get(field) for rec in _running().values() if rec["handoff"]}
+
+
+async def notify(bot, state):
+    await bot.send_message(state["chat"], state["text"])
+
+
+# ——— Draining ———
+async def _wait_for_uploads(reply):
+    from bandwidth import bandwidth
+    deadline = time.monotonic() + UPLOAD_DEADLINE
+    shown = None
+    while bandwidth.shares["up"] and time.monotonic() < deadline:
+        n = len(bandwidth.shares["up"])
+        if n != shown:
+            shown = n
+            try:
+                await reply.edit(f"♻️ Restarting: no new jobs, waiting up to {UPLOAD_DEADLINE}s for {n} uploads…")
+            except Exception:
+                pass
+        await asyncio.sleep(1)
+    return len(bandwidth.shares["up"])
+
+
+async def _pause_downloads():
+    """Stop downloads so they resume from their partial files: aria2's control files, yt-dlp's .part."""
+    aria2 = sys.modules["aria2"].daemon if "aria2" in sys.modules else None
+    if aria2 and aria2.proc and aria2.proc.returncode is None:
+        await aria2.pause_all()
+        await aria2.close()
+    if "ytdl_pool" in sys.modules:
+        await sys.modules["ytdl_pool"].pool.close()
+
+
+def _checkpoint():
+    transcodes, interrupted = [], []
+    for pid, rec in _running().items():
+        if rec["handoff"]:
+            transcodes.append({**rec, "pid": pid})
+        else:
+            # Segment/multi-output pieces only make sense to the coroutine that started them
+            interrupted.append(pid)
+    held = []
+    for key, (module, resume, state) in list(_held.items()):
+        try:
+            data = state()
+        except Exception as e:
+            logging.error(f"Checkpointing {key} failed: {e}")
+            continue
+        if data:
+            held.append({"key": list(key), "module": module, "resume": resume, "state": data})
+    return {"at": time.time(), "transcodes": transcodes, "held": held}, interrupted
+
+
+async def restart(bot, m):
+    """/stop: finish uploads, keep encodes running, checkpoint the rest and exec a fresh process."""
+    from bandwidth import bandwidth
+    _state["draining"] = True
+    reply = await m.reply_text(f"♻️ Restarting: no new jobs, waiting for {len(bandwidth.shares['up'])} uploads…")
+    left = await _wait_for_uploads(reply)
+    await _pause_downloads()
+    await loader.load("uploadpool").pool.close()
+
+    state, interrupted = _checkpoint()
+    for pid in interrupted:
+        try: os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError: pass
+    os.makedirs(os.path.dirname(STATE_FILE), exist_ok=True)
+    with open(f"{STATE_FILE}.tmp", "w") as f:
+        json.dump(state, f)
+    os.replace(f"{STATE_FILE}.tmp", STATE_FILE)
+
+    # Conversations and jobs nobody will pick up again: say so while we still can
+    kept = {tuple(h["key"]) for h in state["held"]}
+    kept_chats = {t["handoff"]["chat"] for t in state["transcodes"]}
+    for s in list(sessions.sessions.values()):
+        if s.state and (s.kind, s.chat) not in kept and s.chat not in kept_chats:
+            try:
+                await bot.send_message(s.chat, f"♻️ The bot is restarting; your /{s.kind} was interrupted, please start it again.")
+            except Exception as e:
+                logging.error(f"Could not tell {s.chat} about the restart: {e}")
+
+    logging.warning(f"Restarting: {len(state['transcodes'])} encodes kept, {len(state['held'])} jobs checkpointed, "
+                    f"{left} uploads cut off")
+    await m.reply_text("♦ 𝐒𝐭𝐨𝐩𝐩𝐞𝐭 ♦", True)
+    os.execl(sys.executable, sys.executable, *sys.argv)
+
+
+# ——— Resuming ———
+def _exit_code(pid, started):
+    """Exit code of a finished encode, "running", or None if it's gone or not ours."""
+    try:
+        done, status = os.waitpid(pid, os.WNOHANG)
+        return "running" if done == 0 else os.waitstatus_to_exitcode(status)
+    except ChildProcessError:
+        pass
+    # Not our child (the container restarted): only trust a process that started when it did
+    import psutil
+    try:
+        if abs(psutil.Process(pid).create_time() - started) < 5:
+            return "running"
+    except psutil.Error:
+        pass
+    return None
+
+
+async def _reattach(bot, rec):
+    fvr = loader.load("fvr")
+    serve = loader.load("serve")
+    from bandwidth import bandwidth
+    from uploadpool import pool as uploads
+    handoff = rec["handoff"]
+    name = os.path.basename(rec["out"])
+    # Tracked like any encode, so another /stop hands it on again
+    fvr.running[rec["pid"]] = {k: v for k, v in rec.items() if k != "pid"}
+    try:
+        while (code := _exit_code(rec["pid"], rec["started"])) == "running":
+            await asyncio.sleep(REATTACH_POLL)
+    finally:
+        fvr.running.pop(rec["pid"], None)
+    try:
+        with open(rec["log"], "rb") as f:
+            err = f.read().decode(errors="ignore")
+        os.remove(rec["log"])
+    except OSError:
+        err = ""
+    if code is None:
+        # Lost track of it: trust a complete-looking output only if ffmpeg didn't report a failure
+        code = 0 if os.path.exists(rec["out"]) and "Conversion failed" not in err else 1
+    metrics.jobs_total.inc(kind=rec["module"], status="ok" if code == 0 else "failed")
+    try:
+        await fvr.record_job(handoff["chat"], rec["module"], rec.get("args", ""), rec.get("input", ""), rec["out"],
+                             rec.get("probe_in"), code, time.time() - rec["started"], err)
+    except Exception as e:
+        logging.error(f"Could not log the encode of {name}: {e}")
+
+    try:
+        if code != 0 or not os.path.exists(rec["out"]):
+            tail = "\n".join(err.strip().splitlines()[-fvr.TAIL_LINES:])
+            await bot.send_message(handoff["chat"], f"❌ `{name}` failed while the bot restarted:\n`{tail[-3500:]}`")
+        elif serve.wanted(rec["out"]):
+            await serve.send_link(bot, handoff["chat"], rec["out"], handoff["caption"])
+        else:
+            with metrics.timed("upload"), bandwidth.share("up", handoff["chat"]) as share:
+                await uploads.send_document(bot, handoff["chat"], rec["out"], caption=handoff["caption"],
+                                            progress=share.progress())
+            metrics.bytes_total.inc(os.path.getsize(rec["out"]), direction="up")
+    finally:
+        for path in [rec["out"]] + handoff.get("cleanup", []):
+            try: os.remove(path)
+            except OSError: pass
+
+
+async def resume(bot):
+    """Called once at startup: pick up what the previous process checkpointed."""
+    try:
+        with open(STATE_FILE) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return
+    os.remove(STATE_FILE)
+    logging.warning(f"Resuming {len(state['transcodes'])} encodes and {len(state['held'])} jobs "
+                    f"from the restart {time.time() - state['at']:.0f}s ago")
+    for rec in state["transcodes"]:
+        asyncio.create_task(_reattach(bot, rec))
+    for entry in state["held"]:
+        try:
+            resume_fn = getattr(loader.load(entry["module"]), entry["resume"])
+            asyncio.create_task(resume_fn(bot, entry["state"]))
+        except Exception as e:
+            logging.error(f"Could not resume {entry['key']}: {e}")
+
+
+def attach(bot, group=GROUP):
+    """While draining, job commands get a short notice instead of starting anything."""
+    async def is_draining(_, __, m):
+        return _state["draining"]
+
+    @bot.on_message(filters.command(JOB_COMMANDS) & filters.create(is_draining), group)
+    async def refuse(_, m):
+        await m.reply_text("♻️ The bot is restarting, send that again in a minute.")
+        m.stop_propagation()
@@ -0,0 +1,170 @@
+import os
+import re
+import json
+import time
+import heapq
+import asyncio
+import logging
+import tempfile
+from collections import namedtuple
+
+import joblog
+import multiout
+from fvr import probe
+
+# ——— Configuration ———
+STORE = os.path.join(joblog.LOG_DIR, "estimates.json")
+SAMPLES = 3                 # Clips encoded per sampled input
+SAMPLE_SECONDS = 4          # Length of each clip
+ALPHA = 0.3                 # Weight of a new observation in the running averages
+SAMPLE_BIAS = 1.15          # Full encodes vs. samples (startup, seeking) until measured
+REF_PIXELS = 1920 * 1080    # Observations are normalized to 1080p
+SIZE_EXP = 0.75             # Output size grows slower than pixel count
+DEFAULT_IN_RATE = 250_000   # Input bytes per second of media, for files without a duration
+
+Estimate = namedtuple("Estimate", "seconds size source")
+
+_store = {}  # args → {"full"|"sample": {"t", "b", "n"}}, plus "_bias" and "_in_rate"
+_state = {"loaded": False}
+
+_RES = re.compile(r"video:\S+ (\d+)x(\d+)")
+
+
+def _key(args):
+    return " || ".join(" ".join(spec.split()) for spec in multiout.parse_specs(args))
+
+
+def _load():
+    if not _state["loaded"]:
+        _state["loaded"] = True
+        try:
+            with open(STORE) as f:
+                _store.update(json.load(f))
+        except (OSError, ValueError):
+            pass
+
+
+def _save():
+    os.makedirs(os.path.dirname(STORE), exist_ok=True)
+    tmp = f"{STORE}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(_store, f)
+    os.replace(tmp, STORE)
+
+
+def _ewma(old, new):
+    return new if old is None else old + ALPHA * (new - old)
+
+
+def pixels_of(info):
+    """Frame size of the first video stream in a fvr.probe() summary."""
+    for s in (info or {}).get("streams", []):
+        found = _RES.match(s)
+        if found:
+            return int(found.group(1)) * int(found.group(2))
+    return None
+
+
+async def observe(args, duration, pixels, wall, out_size, kind="full"):
+    """Fold one encode (a full run or a sample) into the averages for these args."""
+    if not duration or not wall:
+        return
+    _load()
+    scale = (pixels or REF_PIXELS) / REF_PIXELS
+    t = wall / duration / scale
+    b = out_size / duration / scale ** SIZE_EXP
+    entry = _store.setdefault(_key(args), {})
+    if kind == "full" and "sample" in entry:
+        # How far samples were off for these args teaches every future sample-only guess
+        _store["_bias"] = _ewma(_store.get("_bias"), t / entry["sample"]["t"])
+    old = entry.get(kind, {})
+    entry[kind] = {"t": _ewma(old.get("t"), t), "b": _ewma(old.get("b"), b), "n": old.get("n", 0) + 1}
+    try:
+        await asyncio.to_thread(_save)
+    except OSError as e:
+        logging.error(f"Failed to save encode estimates: {e}")
+
+
+async def observe_input(size, duration):
+    """Track typical input bitrate so files without a duration can still be estimated."""
+    if size and duration:
+        _load()
+        _store["_in_rate"] = _ewma(_store.get("_in_rate"), size / duration)
+
+
+def known(args):
+    _load()
+    return bool(_store.get(_key(args)))
+
+
+def predict(args, duration=None, pixels=None, size=None):
+    """Expected encode seconds and output bytes for one input, or None with no data for these args."""
+    _load()
+    entry = _store.get(_key(args))
+    if not entry:
+        return None
+    if not duration:
+        if not size:
+            return None
+        duration = size / _store.get("_in_rate", DEFAULT_IN_RATE)
+    scale = (pixels or REF_PIXELS) / REF_PIXELS
+    if "full" in entry:
+        t, b, source = entry["full"]["t"], entry["full"]["b"], "history"
+    else:
+        t, b, source = entry["sample"]["t"] * _store.get("_bias", SAMPLE_BIAS), entry["sample"]["b"], "sample"
+    return Estimate(t * duration * scale, b * duration * scale ** SIZE_EXP, source)
+
+
+async def sample(local_in, args):
+    """Encode a few short clips spread over local_in with the user's args and record them."""
+    info = await probe(local_in)
+    if not info or not info["duration"]:
+        return None
+    duration, pixels = info["duration"], pixels_of(info)
+    await observe_input(info["size"], duration)
+    clip = min(SAMPLE_SECONDS, duration / SAMPLES)
+    offsets = [duration * (i + 0.5) / SAMPLES - clip / 2 for i in range(SAMPLES)]
+
+    specs = multiout.parse_specs(args)
+    tmp = tempfile.mkdtemp(prefix="estimate_")
+    outs = multiout.output_paths(os.path.join(tmp, "sample"), specs)
+    out_args = multiout.build_args(specs, outs) if len(specs) > 1 else args
+    wall = size = 0.0
+    try:
+        for offset in offsets:
+            cmd = (f"ffmpeg -y -hide_banner -v error -ss {offset:.2f} -t {clip:.2f} -i '{local_in}' "
+                   f"{out_args} '{outs[-1]}'")
+            start = time.perf_counter()
+            proc = await asyncio.create_subprocess_shell(
+                cmd, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL
+            )
+            if await proc.wait() != 0:
+                return None
+            wall += time.perf_counter() - start
+            size += sum(os.path.getsize(p) for p in outs if os.path.exists(p))
+    finally:
+        multiout.cleanup(outs)
+        os.rmdir(tmp)
+    await observe(args, clip * SAMPLES, pixels, wall, size, kind="sample")
+    return predict(args, duration, pixels)
+
+
+def schedule(durations, slots, stagger=0):
+    """Finish time of each job when run in order on `slots` parallel workers."""
+    free = [i * stagger for i in range(slots)]
+    heapq.heapify(free)
+    finish = []
+    for d in durations:
+        start = heapq.heappop(free)
+        finish.append(start + d)
+        heapq.heappush(free, start + d)
+    return finish
+
+
+def fmt_time(seconds):
+    seconds = int(seconds)
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
@@ -0,0 +1,174 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+from collections import namedtuple
+
+# ——— Configuration ———
+CACHE_TTL = 30 * 60            # Seconds a probed URL stays valid (signed CDN links expire)
+INFO_DIR = "./downloads/info"  # Where cached info JSON is written for --load-info-json
+VIDEO_CODECS = ("avc1", "h264")
+AUDIO_CODECS = ("mp4a", "aac")
+
+FormatChoice = namedtuple("FormatChoice", "format_id info_path height filesize")
+
+# ——— In‑memory Cache ———
+_cache = {}   # url → (expires_at, info dict, info_path)
+_locks = {}   # url → asyncio.Lock, so concurrent callers share one probe
+
+
+def _purge(now):
+    for url in [u for u, (exp, _, _) in _cache.items() if exp <= now]:
+        _, _, path = _cache.pop(url)
+        try: os.remove(path)
+        except OSError: pass
+
+
+async def fetch_info(url, ttl=CACHE_TTL):
+    """Return yt-dlp's JSON metadata for url, probing at most once per TTL."""
+    return (await fetch_entry(url, ttl))[0]
+
+
+async def fetch_entry(url, ttl=CACHE_TTL):
+    """(info, info_path) for url; the path stays valid until the entry expires."""
+    hit = _cache.get(url)
+    if hit and hit[0] > time.monotonic():
+        return hit[1], hit[2]
+
+    lock = _locks.setdefault(url, asyncio.Lock())
+    try:
+        async with lock:
+            hit = _cache.get(url)
+            if hit and hit[0] > time.monotonic():
+                return hit[1], hit[2]
+
+            proc = await asyncio.create_subprocess_exec(
+                "yt-dlp", "-J", "--no-warnings", "--no-playlist", url,
+                stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+            )
+            try:
+                stdout, stderr = await proc.communicate()
+            except BaseException:
+                # Cancelled (e.g. by linkprobe's survey timeout): don't leave yt-dlp running
+                if proc.returncode is None:
+                    proc.kill()
+                    await asyncio.shield(proc.wait())
+                raise
+            if proc.returncode != 0:
+                err = stderr.decode(errors="ignore").strip().splitlines()
+                raise RuntimeError(err[-1] if err else f"yt-dlp exited with {proc.returncode}")
+
+            info = json.loads(stdout)
+            os.makedirs(INFO_DIR, exist_ok=True)
+            info_path = os.path.join(INFO_DIR, hashlib.sha1(url.encode()).hexdigest() + ".json")
+            with open(info_path, "wb") as f:
+                f.write(stdout)
+
+            now = time.monotonic()
+            _purge(now)
+            _cache[url] = (now + ttl, info, info_path)
+    finally:
+        if _locks.get(url) is lock:
+            del _locks[url]
+    return info, info_path
+
+
+def format_size(fmt, duration):
+    """Best known byte size of a format: exact, approximate, or from bitrate."""
+    size = fmt.get("filesize") or fmt.get("filesize_approx")
+    if size:
+        return size
+    if fmt.get("tbr") and duration:
+        return fmt["tbr"] * 125 * duration  # kbit/s → bytes
+    return float("inf")
+
+
+def _has_video(fmt):
+    return fmt.get("vcodec") not in (None, "none")
+
+
+def _has_audio(fmt):
+    return fmt.get("acodec") not in (None, "none")
+
+
+def _codec_miss(codec, prefs):
+    return 0 if codec and codec.startswith(prefs) else 1
+
+
+def pick_format(info, height, video_codecs=VIDEO_CODECS, audio_codecs=AUDIO_CODECS):
+    """Pick the smallest format reaching the highest height <= the requested one.
+
+    Returns (format_id, height, filesize) or None when nothing fits, e.g. for
+    direct files that carry no resolution at all.
+    """
+    formats = info.get("formats") or [info]
+    duration = info.get("duration") or 0
+
+    audio = [f for f in formats if _has_audio(f) and not _has_video(f)]
+    best_audio = None
+    if audio:
+        best_audio = min(audio, key=lambda f: (
+            _codec_miss(f.get("acodec"), audio_codecs),
+            abs((f.get("abr") or 128) - 128),
+            format_size(f, duration),
+        ))
+
+    candidates = []
+    for f in formats:
+        h = f.get("height")
+        if not _has_video(f) or not h or h > height:
+            continue
+        if _has_audio(f):
+            fid, size = f["format_id"], format_size(f, duration)
+        elif best_audio:
+            fid = f"{f['format_id']}+{best_audio['format_id']}"
+            size = format_size(f, duration) + format_size(best_audio, duration)
+        else:
+            continue
+        candidates.append((-h, _codec_miss(f.get("vcodec"), video_codecs), size, fid, h))
+
+    if not candidates:
+        return None
+    _, _, size, fid, h = min(candidates)
+    return fid, h, (None if size == float("inf") else int(size))
+
+
+async def select_format(url, quality):
+    """Resolve the format ID for url at the quality the user asked for.
+
+    Returns a FormatChoice whose info_path can be handed to
+    `yt-dlp --load-info-json` so the URL is not extracted a second time,
+    or None if the quality is not a height or the probe failed.
+    """
+    try:
+        height = int(quality)
+    except (TypeError, ValueError):
+        return None
+    try:
+        info, info_path = await fetch_entry(url)
+    except Exception as e:
+        logging.error(f"Format probe failed for {url}: {e}")
+        return None
+
+    picked = pick_format(info, height)
+    if not picked:
+        return None
+    fid, h, size = picked
+    return FormatChoice(fid, info_path, h, size)
+
+
+def direct_format(url, format_id):
+    """The cached format dict when format_id is one plain HTTP(S) file, else None.
+
+    Those can go straight to the shared aria2 daemon; merged (video+audio) and
+    fragmented (HLS/DASH) formats still need yt-dlp.
+    """
+    hit = _cache.get(url)
+    if not hit or not format_id or "+" in format_id or "/" in format_id:
+        return None
+    for f in hit[1].get("formats") or [hit[1]]:
+        if f.get("format_id") == format_id:
+            return f if f.get("protocol") in ("http", "https") and f.get("url") else None
+    return None
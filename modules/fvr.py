@@ -1,77 +1,321 @@
 import os
-import subprocess
+import re
+import json
+import shlex
+import shutil
+import time
+import asyncio
+import tempfile
+from collections import namedtuple, OrderedDict
 from pyrogram import filters
 from pyrogram.types import Message
 
-# Colab-safe path for storing FFmpeg logs
-FFMPEG_LOG_FILE_PATH = "/content/ffmpeg_logs.txt"
+import joblog
+import metrics
+import sampler
+from vars import OWNER_ID, SUDO_USERS
 
-def create_ffmpeg_log_file():
-    """Create the FFmpeg log file if it doesn't exist."""
-    if not os.path.exists(FFMPEG_LOG_FILE_PATH):
-        with open(FFMPEG_LOG_FILE_PATH, "w") as log_file:
-            log_file.write("FFmpeg Logs - New Log File Created\n")
-        return "New FFmpeg log file created."
-    return "FFmpeg log file already exists."
+TAIL_LINES = 15   # stderr lines kept per job in the log
+VALIDATED_SIZE = 256  # dry-run verdicts remembered, least recently used dropped first
+STDERR_DIR = "./downloads/ffmpeg"  # ffmpeg writes stderr here, not to a pipe, so it can outlive a restart
 
-def write_ffmpeg_log(log_message):
-    """Write the FFmpeg log message to the log file."""
-    with open(FFMPEG_LOG_FILE_PATH, "a") as log_file:
-        log_file.write(log_message + "\n")
+FFmpegResult = namedtuple("FFmpegResult", "returncode stderr usage entry")
 
-def find_ffmpeg_path():
-    """Find the path to FFmpeg executable on the system and capture logs."""
+running = {}  # pid → {"cmd", "args", "input", "out", "probe_in", "log", "chat", "module", "handoff", "started"}
+
+_FPS = re.compile(r"fps=\s*([\d.]+)")
+_SPEED = re.compile(r"speed=\s*([\d.]+)x")
+
+
+# ——— Capability Cache ———
+caps = {"path": None, "encoders": set(), "decoders": set(), "filters": set(), "muxers": set()}
+_caps_task = None
+_validated = OrderedDict()  # (ff_args, ext) → error message or None
+
+_CODEC_LINE = re.compile(r"^\s*[VAS][F.][S.][X.][B.][D.]\s+(\S+)", re.M)
+_FILTER_LINE = re.compile(r"^\s*[T.][S.][C.]?\s+(\S+)\s+\S*->\S*", re.M)
+_MUXER_LINE = re.compile(r"^\s*D?E\s+(\S+)", re.M)
+_NAME = re.compile(r"^\w+$")
+
+CODEC_OPTS = {"-c", "-codec", "-c:v", "-vcodec", "-codec:v", "-c:a", "-acodec", "-codec:a", "-c:s", "-scodec", "-codec:s"}
+FILTER_OPTS = {"-vf", "-af", "-filter:v", "-filter:a", "-filter_complex", "-lavfi"}
+STREAM_ERRORS = ("matches no streams", "Stream map", "does not contain any stream")
+# The synthetic clip is rawvideo and PCM: stream copies and bitstream filters that work on
+# real h264/aac input fail on it for reasons that say nothing about the args
+SOURCE_ERRORS = ("is not supported by the bitstream filter", "codec not currently supported in container",
+                 "are supported for WebM", "incompatible with output codec id")
+
+
+async def _ffmpeg_list(flag):
+    proc = await asyncio.create_subprocess_exec(
+        caps["path"], "-hide_banner", flag,
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL
+    )
+    stdout, _ = await proc.communicate()
+    return stdout.decode(errors="ignore")
+
+
+async def _load_capabilities():
+    caps["path"] = shutil.which("ffmpeg")
+    if not caps["path"]:
+        return
+    encoders, decoders, filters_, muxers = await asyncio.gather(
+        _ffmpeg_list("-encoders"), _ffmpeg_list("-decoders"),
+        _ffmpeg_list("-filters"), _ffmpeg_list("-muxers")
+    )
+    caps["encoders"] = set(_CODEC_LINE.findall(encoders))
+    caps["decoders"] = set(_CODEC_LINE.findall(decoders))
+    caps["filters"] = set(_FILTER_LINE.findall(filters_))
+    caps["muxers"] = {n for names in _MUXER_LINE.findall(muxers) for n in names.split(",")}
+
+
+async def load_capabilities():
+    """Probe ffmpeg's encoders, decoders, filters and muxers once per process."""
+    global _caps_task
+    if _caps_task is None:
+        _caps_task = asyncio.ensure_future(_load_capabilities())
+    await _caps_task
+    return caps
+
+
+def _filter_names(graph):
+    for part in re.split(r"[,;]", graph):
+        name = re.sub(r"\[[^\]]*\]", "", part).strip().split("=", 1)[0]
+        if name:
+            yield name
+
+
+def check_args(ff_args):
+    """Static check of ff_args against the capability cache; returns an error or None."""
     try:
-        result = subprocess.run(['which', 'ffmpeg'],
-                                capture_output=True,
-                                text=True,
-                                check=False)
-        ffmpeg_path = result.stdout.strip().split('\n')[0] if result.returncode == 0 else None
-        if ffmpeg_path:
-            return ffmpeg_path, None
-        else:
-            return None, "FFmpeg not found in system paths."
-    except Exception as e:
-        return None, f"Error while searching for FFmpeg: {e}"
+        tokens = shlex.split(ff_args)
+    except ValueError as e:
+        return f"Could not parse arguments: {e}"
+    for opt, value in zip(tokens, tokens[1:] + [None]):
+        if opt in CODEC_OPTS:
+            if value is None:
+                return f"`{opt}` needs a codec name."
+            if value != "copy" and caps["encoders"] and value not in caps["encoders"]:
+                return f"Encoder `{value}` is not available in this ffmpeg build."
+        elif opt in FILTER_OPTS:
+            if value is None:
+                return f"`{opt}` needs a filter graph."
+            for name in _filter_names(value):
+                # Only plain names; anything else is a fragment of escaped filter options
+                if _NAME.match(name) and caps["filters"] and name not in caps["filters"]:
+                    return f"Filter `{name}` is not available in this ffmpeg build."
+        elif opt == "-f" and value is not None and caps["muxers"] and value not in caps["muxers"]:
+            return f"Output format `{value}` is not available in this ffmpeg build."
+    return None
+
+
+async def validate_args(ff_args, ext=".mkv"):
+    """Reject bad ff_args before any input is fetched.
+
+    Runs the static check, then encodes half a second of a synthetic lavfi
+    clip with the same args. Errors the clip itself causes (see STREAM_ERRORS
+    and SOURCE_ERRORS) are inconclusive and let through. Returns an error
+    message, or None if usable.
+    """
+    key = (ff_args, ext)
+    if key in _validated:
+        _validated.move_to_end(key)
+        return _validated[key]
+    await load_capabilities()
+    if not caps["path"]:
+        return "FFmpeg not found in system paths."
 
-def run_ffmpeg_with_log(command):
-    """Run FFmpeg command and capture both stdout and stderr logs."""
+    error = check_args(ff_args)
+    timed_out = False
+    if error is None:
+        fd, out = tempfile.mkstemp(suffix=ext)
+        os.close(fd)
+        cmd = (f"{caps['path']} -hide_banner -v error -f lavfi "
+               f"-i 'testsrc=size=320x240:rate=25:duration=0.5[out0];sine=duration=0.5[out1]' "
+               f"{ff_args} -t 0.5 -y '{out}'")
+        proc = await asyncio.create_subprocess_shell(
+            cmd, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE
+        )
+        try:
+            _, stderr = await asyncio.wait_for(proc.communicate(), 20)
+            err = stderr.decode(errors="ignore").strip()
+            # The synthetic clip has no subtitles or extra streams and isn't h264/aac: neither mapping
+            # nor codec/container mismatches are the user's fault
+            if proc.returncode != 0 and not any(s in err for s in STREAM_ERRORS + SOURCE_ERRORS):
+                error = err.splitlines()[-1] if err else f"ffmpeg exited with {proc.returncode}"
+        except asyncio.TimeoutError:
+            # A busy box, not proof the args work: let them through this time, but check again next time
+            timed_out = True
+            proc.kill()
+            await proc.wait()
+        finally:
+            try: os.remove(out)
+            except OSError: pass
+
+    if not timed_out:
+        _validated[key] = error
+        if len(_validated) > VALIDATED_SIZE:
+            _validated.popitem(last=False)
+    return error
+
+
+async def probe(path):
+    """Short ffprobe summary of a media file: duration, size and stream codecs."""
+    with metrics.timed("ffprobe"):
+        proc = await asyncio.create_subprocess_exec(
+            "ffprobe", "-v", "error", "-print_format", "json", "-show_format", "-show_streams", path,
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL
+        )
+        stdout, _ = await proc.communicate()
     try:
-        # Run FFmpeg command and capture both stdout and stderr
-        result = subprocess.run(command, capture_output=True, text=True, check=False)
-        stdout_log = result.stdout
-        stderr_log = result.stderr
+        data = json.loads(stdout)
+    except ValueError:
+        return None
+    fmt = data.get("format", {})
+    streams = []
+    for s in data.get("streams", []):
+        desc = f"{s.get('codec_type')}:{s.get('codec_name')}"
+        if s.get("width"):
+            desc += f" {s['width']}x{s['height']}"
+        streams.append(desc)
+    return {"duration": float(fmt.get("duration") or 0), "size": int(fmt.get("size") or 0), "streams": streams}
+
+
+def _last_float(pattern, text):
+    found = pattern.findall(text)
+    return float(found[-1]) if found else None
+
+
+async def run_ffmpeg(local_in, ff_args, local_out, chat_id=None, module="", on_start=None, input_opts="",
+                     handoff=None):
+    """Run `ffmpeg <input_opts> -i in <args> out` and record it in the job log.
+
+    Every ffmpeg invocation in the bot goes through here so metrics,
+    per-job usage and /flogs all see it. `on_start` receives the process
+    as soon as it exists (batch2 keeps it around for /nuke). `handoff`
+    ({"chat", "caption", "cleanup", …}) says how to deliver the output if
+    the bot restarts mid-encode; drain.py lets such encodes run on.
+    """
+    cmd = f"ffmpeg {input_opts} -i '{local_in}' {ff_args} '{local_out}'"
+    probe_in = await probe(local_in)
+
+    os.makedirs(STDERR_DIR, exist_ok=True)
+    fd, log = tempfile.mkstemp(suffix=".log", dir=STDERR_DIR)
+    with metrics.ffmpeg_job(module) as job:
+        with os.fdopen(fd, "wb") as err_file:
+            proc = await asyncio.create_subprocess_shell(
+                cmd, stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.DEVNULL, stderr=err_file
+            )
+        running[proc.pid] = {"cmd": cmd, "args": ff_args, "input": local_in, "out": local_out, "probe_in": probe_in,
+                             "log": log, "chat": chat_id, "module": module, "handoff": handoff, "started": time.time()}
+        if on_start:
+            on_start(proc)
+        try:
+            async with sampler.account(proc.pid, f"ffmpeg {os.path.basename(local_in)}") as usage:
+                await proc.wait()
+        except BaseException:
+            os.remove(log)
+            raise
+        finally:
+            running.pop(proc.pid, None)
+        job["ok"] = proc.returncode == 0
 
-        # Store logs into the ffmpeg_logs.txt file
-        write_ffmpeg_log(stdout_log)
-        write_ffmpeg_log(stderr_log)
+    with open(log, "rb") as f:
+        err = f.read().decode(errors="ignore")
+    os.remove(log)
+    entry = await record_job(chat_id, module, ff_args, local_in, local_out, probe_in, proc.returncode, usage.wall, err)
+    return FFmpegResult(proc.returncode, err, usage, entry)
+
+
+async def record_job(chat_id, module, ff_args, local_in, local_out, probe_in, returncode, wall, err):
+    """Add a finished encode to the job log; drain.py also calls it for encodes that outlived a restart."""
+    return await joblog.record({
+        "chat": chat_id,
+        "module": module,
+        "args": ff_args,
+        "input": os.path.basename(local_in),
+        "output": os.path.basename(local_out),
+        "probe_in": probe_in,
+        "probe_out": await probe(local_out) if returncode == 0 else None,
+        "exit": returncode,
+        "wall": round(wall, 2),
+        "fps": _last_float(_FPS, err),
+        "speed": _last_float(_SPEED, err),
+        "stderr_tail": err.strip().splitlines()[-TAIL_LINES:],
+    })
+
+
+# ——— /flogs ———
+FLOGS_HELP = (
+    "**/flogs** query the ffmpeg job log:\n"
+    "`/flogs [N]` last N jobs\n"
+    "`/flogs failed [N]` failures only\n"
+    "`/flogs slow [N]` slowest jobs\n"
+    "`/flogs chat <id|me> [N]` jobs for a chat\n"
+    "`/flogs show <job id>` full record with stderr tail\n"
+    "Bot admins see every chat's jobs, everyone else only this chat's."
+)
+
+
+def format_job(e):
+    status = "✅" if e["exit"] == 0 else f"❌ exit {e['exit']}"
+    fps = f"{e['fps']:.0f}fps" if e.get("fps") else "-"
+    speed = f"{e['speed']:.2f}x" if e.get("speed") else "-"
+    return f"#{e['id']} {status} [{e['module']}] `{e['input']}` {e['wall']:.0f}s {fps} {speed}"
+
+
+def format_detail(e):
+    lines = [format_job(e), f"chat: {e.get('chat')}", f"args: `{e['args']}`"]
+    for key in ("probe_in", "probe_out"):
+        p = e.get(key)
+        if p:
+            lines.append(f"{key}: {p['duration']:.1f}s {p['size'] / 2**20:.1f} MiB {', '.join(p['streams'])}")
+    lines.append("stderr:\n`" + "\n".join(e["stderr_tail"]) + "`")
+    return "\n".join(lines)
 
-        return stdout_log, stderr_log
-    except Exception as e:
-        write_ffmpeg_log(f"Error running FFmpeg: {str(e)}")
-        return None, f"Error running FFmpeg: {str(e)}"
 
-# Register the /flogs command for FFmpeg log capture
 def register_ffmpeg_logs_command(bot):
     @bot.on_message(filters.command("flogs"))
     async def handle_ffmpeg_command(client, message: Message):
-        """Handles the /flogs command for FFmpeg logs."""
-        ffmpeg_path, error_message = find_ffmpeg_path()
-
-        if not ffmpeg_path:
-            await message.reply_text(f"❌ {error_message}")
-            return
+        """Handles the /flogs command: queries over the indexed ffmpeg job log."""
+        await joblog.ensure_loaded()
+        # Records hold other users' args, file names and chats: only admins query across chats
+        admin = bool(message.from_user) and message.from_user.id in [OWNER_ID] + SUDO_USERS
+        scope = None if admin else message.chat.id
+        words = message.command[1:]
+        mode, rest = "last", words
+        if words and not words[0].isdigit():
+            mode, rest = words[0].lower(), words[1:]
 
-        # Example command to run with FFmpeg (this can be changed as needed)
-        ffmpeg_command = [ffmpeg_path, "-version"]
+        if mode == "show":
+            entry = joblog.get(int(rest[0])) if rest and rest[0].isdigit() else None
+            if entry and scope is not None and entry.get("chat") != scope:
+                entry = None
+            text = format_detail(entry) if entry else "❌ No such job."
+            return await message.reply_text(text[:4096])
 
-        # Run FFmpeg and capture its logs
-        stdout_log, stderr_log = run_ffmpeg_with_log(ffmpeg_command)
+        chat = message.chat.id
+        if mode == "chat" and rest and rest[0] != "me":
+            if not rest[0].lstrip("-").isdigit():
+                return await message.reply_text(FLOGS_HELP)
+            chat = int(rest[0])
+            if scope is not None and chat != scope:
+                return await message.reply_text("⛔ Other chats' jobs are for bot admins (OWNER_ID / SUDO_USERS).")
+        if mode == "chat" and rest:
+            rest = rest[1:]
+        n = int(rest[0]) if rest and rest[0].isdigit() else 10
 
-        if stdout_log:
-            response = f"✅ FFmpeg Logs:\n\n{stdout_log}\n\nError Logs (if any):\n{stderr_log}"
+        if mode == "failed":
+            jobs = joblog.failures(n, scope)
+        elif mode == "slow":
+            jobs = joblog.slowest(n, scope)
+        elif mode == "chat":
+            jobs = joblog.for_chat(chat, n)
+        elif mode == "last":
+            jobs = joblog.last(n, scope)
         else:
-            response = f"❌ Error running FFmpeg:\n{stderr_log}"
+            return await message.reply_text(FLOGS_HELP)
 
-        await message.reply_text(response)
-        write_ffmpeg_log("FFmpeg command executed.")
\ No newline at end of file
+        if not jobs:
+            return await message.reply_text("No ffmpeg jobs recorded yet.\n\n" + FLOGS_HELP)
+        await message.reply_text(("\n".join(format_job(e) for e in jobs))[:4096])
@@ -0,0 +1,115 @@
+import os
+import json
+import time
+import asyncio
+import logging
+from collections import deque
+
+# ——— Configuration ———
+# Colab-safe location when running there, next to the bot otherwise
+LOG_DIR = "/content/ffmpeg_logs" if os.path.isdir("/content") else "./ffmpeg_logs"
+LOG_FILE = os.path.join(LOG_DIR, "jobs.jsonl")
+MAX_BYTES = 5 * 1024 * 1024   # Rotate the active file beyond this size
+BACKUPS = 4                   # jobs.jsonl.1 … jobs.jsonl.4 are kept
+INDEX_SIZE = 500              # Most recent jobs kept in memory for /flogs
+
+index = deque(maxlen=INDEX_SIZE)
+_state = {"loaded": False, "next_id": 1, "queue": None, "writer": None}
+_load_lock = asyncio.Lock()  # first callers wait for one load instead of each numbering from 1
+
+
+def _files_oldest_first():
+    paths = [f"{LOG_FILE}.{i}" for i in range(BACKUPS, 0, -1)] + [LOG_FILE]
+    return [p for p in paths if os.path.exists(p)]
+
+
+def _load():
+    recent = deque(maxlen=INDEX_SIZE)
+    for path in _files_oldest_first():
+        with open(path) as f:
+            for line in f:
+                try:
+                    recent.append(json.loads(line))
+                except ValueError:
+                    continue
+    return recent
+
+
+async def ensure_loaded():
+    """Rebuild the in-memory index from disk once per process."""
+    if _state["loaded"]:
+        return
+    async with _load_lock:
+        if _state["loaded"]:
+            return
+        recent = await asyncio.to_thread(_load)
+        index.extendleft(reversed(recent))
+        if index:
+            _state["next_id"] = max(_state["next_id"], max(e["id"] for e in index) + 1)
+        _state["loaded"] = True
+
+
+def _rotate():
+    for i in range(BACKUPS - 1, 0, -1):
+        if os.path.exists(f"{LOG_FILE}.{i}"):
+            os.replace(f"{LOG_FILE}.{i}", f"{LOG_FILE}.{i + 1}")
+    os.replace(LOG_FILE, f"{LOG_FILE}.1")
+
+
+def _append(lines):
+    os.makedirs(LOG_DIR, exist_ok=True)
+    if os.path.exists(LOG_FILE) and os.path.getsize(LOG_FILE) >= MAX_BYTES:
+        _rotate()
+    with open(LOG_FILE, "a") as f:
+        f.writelines(lines)
+
+
+async def _writer():
+    queue = _state["queue"]
+    while True:
+        lines = [await queue.get()]
+        while not queue.empty():
+            lines.append(queue.get_nowait())
+        try:
+            await asyncio.to_thread(_append, lines)
+        except Exception as e:
+            logging.error(f"Failed to write ffmpeg job log: {e}")
+
+
+async def record(entry):
+    """Add a finished job to the index and queue it for the log file."""
+    await ensure_loaded()
+    entry = {"id": _state["next_id"], "ts": time.time(), **entry}
+    _state["next_id"] += 1
+    index.append(entry)
+    if _state["writer"] is None:
+        _state["queue"] = asyncio.Queue()
+        _state["writer"] = asyncio.create_task(_writer())
+    _state["queue"].put_nowait(json.dumps(entry) + "\n")
+    return entry
+
+
+# ——— Queries ———
+# `chat` limits a query to one chat's jobs; None means every chat
+def _jobs(chat):
+    return index if chat is None else [e for e in index if e.get("chat") == chat]
+
+
+def last(n=10, chat=None):
+    return list(_jobs(chat))[-n:][::-1]
+
+
+def failures(n=10, chat=None):
+    return [e for e in reversed(_jobs(chat)) if e["exit"] != 0][:n]
+
+
+def slowest(n=10, chat=None):
+    return sorted(_jobs(chat), key=lambda e: e["wall"], reverse=True)[:n]
+
+
+def for_chat(chat_id, n=10):
+    return [e for e in reversed(index) if e.get("chat") == chat_id][:n]
+
+
+def get(job_id):
+    return next((e for e in index if e["id"] == job_id), None)
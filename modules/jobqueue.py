@@ -0,0 +1,283 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import sqlite3
+from collections import namedtuple
+
+# ——— Configuration ———
+LEASE = 60          # Seconds a claim stays valid without a heartbeat
+MAX_ATTEMPTS = 3    # Claims per job before an expired lease marks it failed
+
+Job = namedtuple("Job", "id kind chat batch payload state worker attempts progress result error")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind        TEXT NOT NULL,
+    chat        INTEGER,
+    batch       TEXT,
+    payload     TEXT NOT NULL,
+    state       TEXT NOT NULL DEFAULT 'queued',  -- queued|running|done|failed|cancelled
+    worker      TEXT,
+    lease_until REAL,
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    progress    TEXT,
+    result      TEXT,
+    error       TEXT,
+    created     REAL,
+    updated     REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs(state, id);
+CREATE INDEX IF NOT EXISTS jobs_batch ON jobs(batch);
+"""
+COLUMNS = "id, kind, chat, batch, payload, state, worker, attempts, progress, result, error"
+
+
+class JobQueue:
+    """Interface every queue backend implements; all methods are coroutines.
+
+    Workers claim a job with a lease and must heartbeat before it runs out,
+    otherwise the job goes back to the queue for another worker. heartbeat,
+    complete and fail return False once the worker no longer owns the job
+    (lease lost or batch cancelled) so it can stop working on it.
+    """
+
+    async def enqueue(self, kind, payload, chat=None, batch=None):
+        raise NotImplementedError
+
+    async def claim(self, worker, lease=LEASE):
+        raise NotImplementedError
+
+    async def heartbeat(self, job_id, worker, progress=None, lease=LEASE):
+        raise NotImplementedError
+
+    async def complete(self, job_id, worker, result=None):
+        raise NotImplementedError
+
+    async def fail(self, job_id, worker, error, retry=False):
+        raise NotImplementedError
+
+    async def cancel_batch(self, batch):
+        raise NotImplementedError
+
+    async def batch_status(self, batch):
+        raise NotImplementedError
+
+    async def get(self, job_id):
+        raise NotImplementedError
+
+
+class SqliteQueue(JobQueue):
+    """Single-host backend: any number of processes sharing one SQLite file."""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        db = self._connect()
+        try:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(SCHEMA)
+        finally:
+            db.close()
+
+    def _connect(self):
+        # One short-lived connection per call: safe across threads and processes
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def _run(self, fn, *args):
+        return asyncio.to_thread(self._tx, fn, *args)
+
+    def _tx(self, fn, *args):
+        db = self._connect()
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            result = fn(db, time.time(), *args)
+            db.execute("COMMIT")
+            return result
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        finally:
+            db.close()
+
+    @staticmethod
+    def _job(row):
+        if row is None:
+            return None
+        job = Job(*row)
+        return job._replace(payload=json.loads(job.payload),
+                            result=json.loads(job.result) if job.result else None)
+
+    # ——— Transactions ———
+    @staticmethod
+    def _enqueue(db, now, kind, payload, chat, batch):
+        cur = db.execute(
+            "INSERT INTO jobs (kind, chat, batch, payload, created, updated) VALUES (?, ?, ?, ?, ?, ?)",
+            (kind, chat, batch, json.dumps(payload), now, now)
+        )
+        return cur.lastrowid
+
+    @classmethod
+    def _claim(cls, db, now, worker, lease):
+        # Expired leases go back to the queue, or fail once they've used up their attempts
+        db.execute(
+            "UPDATE jobs SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END, "
+            "error = 'lease expired on ' || worker, worker = NULL, updated = ? "
+            "WHERE state = 'running' AND lease_until < ?",
+            (MAX_ATTEMPTS, now, now)
+        )
+        row = db.execute("SELECT id FROM jobs WHERE state = 'queued' ORDER BY id LIMIT 1").fetchone()
+        if row is None:
+            return None
+        db.execute(
+            "UPDATE jobs SET state = 'running', worker = ?, lease_until = ?, attempts = attempts + 1, "
+            "progress = NULL, updated = ? WHERE id = ?",
+            (worker, now + lease, now, row[0])
+        )
+        return cls._job(db.execute(f"SELECT {COLUMNS} FROM jobs WHERE id = ?", row).fetchone())
+
+    @staticmethod
+    def _heartbeat(db, now, job_id, worker, progress, lease):
+        cur = db.execute(
+            "UPDATE jobs SET lease_until = ?, progress = COALESCE(?, progress), updated = ? "
+            "WHERE id = ? AND worker = ? AND state = 'running'",
+            (now + lease, progress, now, job_id, worker)
+        )
+        return cur.rowcount == 1
+
+    @staticmethod
+    def _finish(db, now, job_id, worker, state, result, error):
+        # A retry past MAX_ATTEMPTS is a failure
+        cur = db.execute(
+            "UPDATE jobs SET state = CASE WHEN ? = 'queued' AND attempts >= ? THEN 'failed' ELSE ? END, "
+            "result = ?, error = ?, worker = CASE WHEN ? = 'queued' THEN NULL ELSE worker END, "
+            "updated = ? WHERE id = ? AND worker = ? AND state = 'running'",
+            (state, MAX_ATTEMPTS, state, json.dumps(result) if result is not None else None, error, state,
+             now, job_id, worker)
+        )
+        return cur.rowcount == 1
+
+    @staticmethod
+    def _cancel_batch(db, now, batch):
+        cur = db.execute(
+            "UPDATE jobs SET state = 'cancelled', updated = ? WHERE batch = ? AND state IN ('queued', 'running')",
+            (now, batch)
+        )
+        return cur.rowcount
+
+    @staticmethod
+    def _batch_status(db, now, batch):
+        rows = db.execute("SELECT state, COUNT(*) FROM jobs WHERE batch = ? GROUP BY state", (batch,))
+        return dict(rows.fetchall())
+
+    @classmethod
+    def _get(cls, db, now, job_id):
+        return cls._job(db.execute(f"SELECT {COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+    # ——— JobQueue ———
+    async def enqueue(self, kind, payload, chat=None, batch=None):
+        return await self._run(self._enqueue, kind, payload, chat, batch)
+
+    async def claim(self, worker, lease=LEASE):
+        return await self._run(self._claim, worker, lease)
+
+    async def heartbeat(self, job_id, worker, progress=None, lease=LEASE):
+        return await self._run(self._heartbeat, job_id, worker, progress, lease)
+
+    async def complete(self, job_id, worker, result=None):
+        return await self._run(self._finish, job_id, worker, "done", result, None)
+
+    async def fail(self, job_id, worker, error, retry=False):
+        return await self._run(self._finish, job_id, worker, "queued" if retry else "failed", None, error)
+
+    async def cancel_batch(self, batch):
+        return await self._run(self._cancel_batch, batch)
+
+    async def batch_status(self, batch):
+        return await self._run(self._batch_status, batch)
+
+    async def get(self, job_id):
+        return await self._run(self._get, job_id)
+
+
+# ——— Backends ———
+# Other backends (Redis, Postgres, …) subclass JobQueue and register a URL scheme here
+BACKENDS = {"sqlite": lambda rest: SqliteQueue(rest)}
+
+
+def open_queue(url):
+    """Open a queue from a URL like `sqlite:///./downloads/jobs.db`."""
+    scheme, _, rest = url.partition("://")
+    if scheme not in BACKENDS:
+        raise ValueError(f"Unknown job queue backend: {scheme}")
+    return BACKENDS[scheme](rest[1:] if rest.startswith("/") else rest)
+
+
+# ——— Self-test: several local worker processes on one queue ———
+async def _sleep_worker(path, lease):
+    queue = SqliteQueue(path)
+    name = f"test-{os.getpid()}"
+    while True:
+        job = await queue.claim(name, lease)
+        if job is None:
+            if not (await queue.batch_status("test")).get("running"):
+                return
+            await asyncio.sleep(0.2)
+            continue
+        print(f"claimed {job.id}", flush=True)
+        for step in range(job.payload["steps"]):
+            await asyncio.sleep(lease / 4)
+            if not await queue.heartbeat(job.id, name, f"step {step + 1}", lease):
+                break
+        else:
+            await queue.complete(job.id, name, {"worker": name})
+
+
+async def _selftest(workers=4, jobs=20, lease=1.0):
+    import signal
+    import tempfile
+    import subprocess
+
+    path = os.path.join(tempfile.mkdtemp(prefix="jobqueue_"), "jobs.db")
+    queue = SqliteQueue(path)
+    for _ in range(jobs):
+        await queue.enqueue("sleep", {"steps": 3}, batch="test")
+
+    start = time.monotonic()
+    procs = [subprocess.Popen([sys.executable, __file__, "--sleep-worker", path, str(lease)],
+                              stdout=subprocess.PIPE, text=True)
+             for _ in range(workers)]
+
+    # Kill one worker as soon as it holds a lease; its job must move to another worker
+    victim = procs[0]
+    victim.stdout.readline()
+    victim.send_signal(signal.SIGKILL)
+    victim.wait()
+    for p in procs[1:]:
+        p.wait()
+    elapsed = time.monotonic() - start
+
+    done = [await queue.get(i) for i in range(1, jobs + 1)]
+    states = {j.state for j in done}
+    retried = [j.id for j in done if j.attempts > 1]
+    by_worker = {}
+    for j in done:
+        if j.result:
+            by_worker[j.result["worker"]] = by_worker.get(j.result["worker"], 0) + 1
+    print(f"{jobs} jobs, {workers} workers (1 killed): {elapsed:.1f}s")
+    print(f"states  : {sorted(states)}")
+    print(f"retried : {retried}")
+    print(f"per worker: {by_worker}")
+    ok = states == {"done"} and len(retried) >= 1 and len(by_worker) == workers - 1
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--sleep-worker":
+        asyncio.run(_sleep_worker(sys.argv[2], float(sys.argv[3])))
+    else:
+        n = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+        asyncio.run(_selftest(workers=n))
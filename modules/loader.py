@@ -0,0 +1,120 @@
+import sys
+import time
+import logging
+import importlib
+from pyrogram import filters
+from pyrogram.handlers import MessageHandler
+
+# ——— Feature Manifest ———
+# module, register function, commands that should trigger loading it
+MANIFEST = [
+    ("pro", "pro_feature", ["pro"]),
+    ("fvr", "register_ffmpeg_logs_command", ["flogs"]),
+    ("tracing", "register_trace_command", ["trace"]),
+    ("profiler", "register_profile_command", ["profile"]),
+    ("session", "register_sessions_command", ["sessions"]),
+    ("sysinfo", "register_system_info_handler", ["systeminfo"]),
+    ("batch", "batch_feature", ["batch", "bs"]),
+    ("batch2", "batch_feature2", ["batch2", "end", "nuke", "s"]),
+]
+
+import_times = {}  # module → seconds spent importing it
+loaded = {}        # module → list of MessageHandler registered by it
+
+
+def load(module):
+    """Import a module, recording how long the first import took."""
+    if module not in sys.modules:
+        start = time.perf_counter()
+        importlib.import_module(module)
+        import_times[module] = time.perf_counter() - start
+    return sys.modules[module]
+
+
+class _Recorder:
+    """Stands in for the Client while a feature registers its handlers."""
+
+    def __init__(self, bot):
+        self._bot = bot
+        self.handlers = []
+
+    def on_message(self, flt=None, group=0):
+        def decorator(func):
+            handler = MessageHandler(func, flt)
+            self._bot.add_handler(handler, group)
+            self.handlers.append(handler)
+            return func
+        return decorator
+
+    def __getattr__(self, name):
+        return getattr(self._bot, name)
+
+
+def activate(bot, module, register):
+    """Import a feature and register its real handlers on the bot."""
+    if module not in loaded:
+        recorder = _Recorder(bot)
+        getattr(load(module), register)(recorder)
+        loaded[module] = recorder.handlers
+        logging.info(f"Loaded feature {module} in {import_times.get(module, 0) * 1000:.1f} ms")
+    return loaded[module]
+
+
+def register_lazy(bot, group=-1):
+    """Register a cheap stub per manifest entry; the feature is imported on first use."""
+    for module, register, commands in MANIFEST:
+        stub = MessageHandler(None, filters.command(commands))
+
+        async def on_first_use(client, m, module=module, register=register, stub=stub):
+            if module not in loaded:
+                bot.remove_handler(stub, group)
+            # The real handlers are only attached after this update, so hand it over directly
+            for handler in activate(bot, module, register):
+                if await handler.check(client, m):
+                    await handler.callback(client, m)
+                    break
+            m.stop_propagation()
+
+        stub.callback = on_first_use
+        bot.add_handler(stub, group)
+
+
+def load_all(bot):
+    for module, register, _ in MANIFEST:
+        activate(bot, module, register)
+
+
+def import_report():
+    lines = [f"{name:<12} {secs * 1000:8.1f} ms"
+             for name, secs in sorted(import_times.items(), key=lambda kv: -kv[1])]
+    return "\n".join(lines) or "No feature modules loaded yet."
+
+
+# ——— Startup Benchmark ———
+def _bench(runs=5):
+    import os
+    import subprocess
+
+    here = os.path.dirname(os.path.abspath(__file__))
+
+    def timed(code):
+        best = float("inf")
+        for _ in range(runs):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, "-c", code], cwd=here, check=True)
+            best = min(best, time.perf_counter() - start)
+        return best
+
+    lazy = timed("import main")
+    eager = timed("import main, loader; loader.load_all(main.bot)")
+    print(f"startup (lazy) : {lazy * 1000:8.1f} ms")
+    print(f"startup (eager): {eager * 1000:8.1f} ms")
+    baseline = timed("pass")
+    print("\nper-module import cost:")
+    for module, _, _ in MANIFEST:
+        cost = timed(f"import {module}") - baseline
+        print(f"{module:<12} {cost * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    _bench()
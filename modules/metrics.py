@@ -0,0 +1,157 @@
+import time
+import asyncio
+import bisect
+from contextlib import contextmanager
+
+import tracing
+
+# ——— Configuration ———
+LAG_INTERVAL = 0.5      # Seconds between event-loop lag probes
+LAG_UNHEALTHY = 2.0     # Lag (s) above which /healthz reports the loop as stuck
+
+DEFAULT_BUCKETS = (0.005, 0.05, 0.25, 1, 5, 15, 60, 300, 900, 3600, float("inf"))
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, float("inf"))
+
+
+def _key(labelnames, labels):
+    return tuple(str(labels.get(name, "")) for name in labelnames)
+
+
+def _fmt_labels(labelnames, key, extra=""):
+    pairs = [f'{n}="{v}"' for n, v in zip(labelnames, key)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        registry.append(self)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in self.values.items():
+            lines.append(f"{self.name}{_fmt_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = _key(self.labelnames, labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        self.values[_key(self.labelnames, labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = _key(self.labelnames, labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def remove(self, **labels):
+        self.values.pop(_key(self.labelnames, labels), None)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = buckets
+
+    def observe(self, value, **labels):
+        key = _key(self.labelnames, labels)
+        state = self.values.get(key)
+        if state is None:
+            state = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, (counts, total, count) in self.values.items():
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                labels = _fmt_labels(self.labelnames, key, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_fmt_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_fmt_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+registry = []
+
+# ——— Bot Metrics ———
+stage_seconds = Histogram("bot_stage_seconds", "Time spent per job stage.", ["stage"])
+bytes_total = Counter("bot_bytes_total", "Bytes transferred.", ["direction"])
+jobs_total = Counter("bot_jobs_total", "Finished jobs by outcome.", ["kind", "status"])
+floodwait_seconds = Counter("bot_floodwait_seconds_total", "Seconds spent waiting on FloodWait.")
+active_ffmpeg = Gauge("bot_active_ffmpeg", "Running ffmpeg processes.")
+queue_length = Gauge("bot_queue_length", "Files waiting per chat.", ["chat"])
+loop_lag = Histogram("bot_event_loop_lag_seconds", "Event-loop scheduling lag.", buckets=LAG_BUCKETS)
+
+_last_tick = [time.monotonic(), 0.0]  # last probe time, last measured lag
+
+
+@contextmanager
+def timed(stage, **args):
+    """Record the wall time of the enclosed block under bot_stage_seconds and as a trace span."""
+    start = time.perf_counter()
+    try:
+        with tracing.span(stage, **args):
+            yield
+    finally:
+        stage_seconds.observe(time.perf_counter() - start, stage=stage)
+
+
+@contextmanager
+def ffmpeg_job(kind):
+    """Track one ffmpeg run: active gauge, latency and outcome (set `ok` on the yielded dict)."""
+    result = {"ok": False}
+    active_ffmpeg.inc()
+    try:
+        with timed("ffmpeg", module=kind):
+            yield result
+    finally:
+        active_ffmpeg.dec()
+        jobs_total.inc(kind=kind, status="ok" if result["ok"] else "failed")
+
+
+async def monitor_loop():
+    """Measure how late the loop wakes us up; feeds the lag histogram and /healthz."""
+    while True:
+        start = time.monotonic()
+        await asyncio.sleep(LAG_INTERVAL)
+        now = time.monotonic()
+        lag = max(0.0, now - start - LAG_INTERVAL)
+        loop_lag.observe(lag)
+        _last_tick[0], _last_tick[1] = now, lag
+
+
+def healthy():
+    since = time.monotonic() - _last_tick[0]
+    return since < LAG_INTERVAL + LAG_UNHEALTHY and _last_tick[1] < LAG_UNHEALTHY
+
+
+def render():
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
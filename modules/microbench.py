@@ -0,0 +1,189 @@
+"""Micro-benchmarks for the pure-Python helpers that run per item or per progress tick.
+
+Each case is timed against realistic fixtures (a long yt-dlp -F listing, a
+100k-line .txt of links, a long ffmpeg stderr) and compared with the stored
+baseline; the run fails if any case got slower than the tolerance allows:
+
+    python modules/microbench.py                  # compare, exit 1 on a regression
+    python modules/microbench.py --update         # record a new baseline
+    python modules/microbench.py -k hr --tolerance 0.5
+
+Timings are divided by a fixed calibration loop so a baseline recorded on one
+machine stays meaningful on another. Needs the bot's own requirements.
+"""
+import os
+import sys
+import json
+import random
+import asyncio
+import argparse
+import timeit
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BASELINE = os.path.join(HERE, "microbench.json")
+TOLERANCE = 0.25            # Allowed slowdown vs. the baseline (0.25 = 25 %)
+REPEAT = 5                  # Timing runs per case; the fastest counts
+MIN_TIME = 0.2              # Seconds each timing run lasts at least
+
+
+# ——— Fixtures ———
+def ytdl_listing(variants=400, seed=0):
+    """`yt-dlp -F` output for a site with many HLS/DASH renditions."""
+    rng = random.Random(seed)
+    lines = ["[generic] Extracting URL: https://example.com/course/lecture-1",
+             "[info] Available formats for lecture-1:",
+             "ID              EXT   RESOLUTION FPS CH |   FILESIZE   TBR PROTO | VCODEC        VBR ACODEC      ABR ASR MORE INFO",
+             "-" * 118]
+    heights = [144, 240, 360, 480, 720, 1080]
+    for n in range(variants):
+        if n % 5 == 0:
+            lines.append(f"hls-audio-{n:<6}  mp4   audio only        2 | ~ {rng.uniform(1, 40):6.2f}MiB  {rng.randint(48, 160)}k m3u8  | audio only        mp4a.40.2   {rng.randint(48, 160)}k 44k")
+            continue
+        h = heights[n % len(heights)]
+        w = h * 16 // 9
+        tbr = rng.randint(100, 6000)
+        lines.append(f"hls-{tbr}-{n:<9}  mp4   {w}x{h:<8} {rng.choice((25, 30, 60))}    | ~ {rng.uniform(5, 900):6.2f}MiB {tbr:5d}k m3u8  | avc1.64001F  {tbr}k mp4a.40.2       {rng.randint(48, 160)}k")
+    return "\n".join(lines)
+
+
+def link_file(lines=100_000, seed=0):
+    """A .txt upload: `Title:https://host/path` per line, with the junk real titles carry."""
+    rng = random.Random(seed)
+    junk = "\t:/+#|@*."
+    out = []
+    for n in range(lines):
+        words = [rng.choice(("Lecture", "Class", "DPP", "Notes", "Revision", "Part", "Chapter")) for _ in range(rng.randint(2, 8))]
+        title = " ".join(words) + f" {n} " + "".join(rng.choice(junk) for _ in range(rng.randint(0, 6)))
+        if n % 7 == 0:
+            title += " https www.example.com"
+        out.append(f"{title}:https://cdn{n % 13}.example.com/v/{rng.getrandbits(64):x}/master.m3u8")
+    return "\n".join(out)
+
+
+def ffmpeg_stderr(size=2 * 1024 * 1024, seed=0):
+    """What a failed long encode leaves on stderr: progress lines, then the error."""
+    rng = random.Random(seed)
+    lines = []
+    total = 0
+    while total < size:
+        line = (f"frame={rng.randint(1, 200000):6d} fps={rng.uniform(20, 400):5.1f} q=28.0 size={rng.randint(1, 900000):8d}kB "
+                f"time=00:{rng.randint(0, 59):02d}:{rng.randint(0, 59):02d}.00 bitrate={rng.uniform(200, 8000):7.1f}kbits/s speed={rng.uniform(0.5, 9):.2f}x")
+        lines.append(line)
+        total += len(line) + 1
+    lines.append("[aac @ 0x55d5c] Too many bits 8832 > 6144 per frame requested, clamping to max")
+    lines.append("Conversion failed!")
+    return "\n".join(lines)
+
+
+class _QuietBot:
+    async def send_message(self, chat_id, text, *args, **kwargs):
+        return None
+
+
+# ——— Cases ———
+def cases():
+    """name → zero-argument callable; imports happen here so fixtures are built once."""
+    import core
+    import utils
+    import batch2
+    import pro
+
+    rng = random.Random(0)
+    listing = ytdl_listing()
+    links = link_file()
+    stderr = ffmpeg_stderr()
+    sizes = [rng.randint(0, 1 << 42) for _ in range(10_000)]
+    seconds = [rng.uniform(0, 3 * 86400) for _ in range(10_000)]
+    ticks = [(n * 7919 % 10**9, 10**9, rng.uniform(1e5, 5e7)) for n in range(1, 2001)]
+    loop = asyncio.new_event_loop()
+    bot = _QuietBot()
+
+    def parse_links():
+        # main.account_login: split the file, then clean every title
+        for line in links.split("\n"):
+            utils.clean_name(line.split("://", 1)[0])
+
+    return {
+        "core.vid_info": lambda: core.vid_info(listing),
+        "core.parse_vid_info": lambda: core.parse_vid_info(listing),
+        "core.human_readable_size": lambda: [core.human_readable_size(s) for s in sizes],
+        "utils.hrb": lambda: [utils.hrb(s) for s in sizes],
+        "utils.hrt": lambda: [utils.hrt(s, precision=1) for s in seconds],
+        "utils.upload_progress_text": lambda: [utils.upload_progress_text(c, t, 37) for c, t, _ in ticks],
+        "utils.download_progress_text": lambda: [utils.download_progress_text(c, t, s) for c, t, s in ticks],
+        "main.link_titles": parse_links,
+        "batch2.split_long": lambda: batch2.split_long(stderr),
+        "pro.send_message_in_parts": lambda: loop.run_until_complete(pro.send_message_in_parts(bot, 1, stderr)),
+    }
+
+
+# ——— Runner ———
+def _calibrate():
+    """A fixed pure-Python workload: dict, str and arithmetic, like the cases."""
+    def work():
+        d = {}
+        for i in range(20_000):
+            d[str(i)] = i * 3 // 7
+        return sum(len(k) for k in d)
+    return measure(work)
+
+
+def measure(fn):
+    """Fastest seconds per call over REPEAT runs of at least MIN_TIME each."""
+    timer = timeit.Timer(fn)
+    number = 1
+    while timer.timeit(number) < MIN_TIME:
+        number *= 2
+    return min(timer.repeat(REPEAT, number)) / number
+
+
+def run(selected, baseline, tolerance):
+    calibration = _calibrate()
+    base_cal = baseline.get("calibration")
+    results, regressions = {}, []
+    for name, fn in selected.items():
+        seconds = measure(fn)
+        results[name] = seconds
+        old = baseline.get("cases", {}).get(name)
+        if old is None or not base_cal:
+            print(f"{name:<30} {seconds * 1e3:10.3f} ms   (no baseline)")
+            continue
+        ratio = (seconds / calibration) / (old / base_cal)
+        flag = "REGRESSED" if ratio > 1 + tolerance else ""
+        print(f"{name:<30} {seconds * 1e3:10.3f} ms   {ratio:6.2f}x baseline {flag}")
+        if flag:
+            regressions.append(name)
+    return calibration, results, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-k", default="", help="only cases whose name contains this")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--update", action="store_true", help="store these timings as the new baseline")
+    args = parser.parse_args()
+
+    sys.path.insert(0, HERE)
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    except (OSError, ValueError):
+        baseline = {}
+    selected = {name: fn for name, fn in cases().items() if args.k in name}
+    calibration, results, regressions = run(selected, baseline, args.tolerance)
+
+    if args.update:
+        # Rescale kept cases to this machine so one file never mixes two calibrations
+        scale = calibration / baseline["calibration"] if baseline.get("calibration") else 1
+        kept = {name: s * scale for name, s in baseline.get("cases", {}).items() if name not in results}
+        with open(args.baseline, "w") as f:
+            json.dump({"calibration": calibration, "cases": {**kept, **results}}, f, indent=2, sort_keys=True)
+        print(f"\nBaseline written to {args.baseline}")
+    elif regressions:
+        print(f"\n{len(regressions)} regressed beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
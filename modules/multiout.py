@@ -0,0 +1,72 @@
+import os
+import re
+import shlex
+
+from fvr import run_ffmpeg, validate_args
+
+UNSUPPORTED = {"-filter_complex", "-lavfi", "-map"}
+VIDEO_FILTER_OPTS = {"-vf", "-filter:v"}
+
+
+def parse_specs(text):
+    """Split a user message into output specs: one per line or separated by `||`."""
+    specs = []
+    for part in re.split(r"\n|\|\|", text):
+        part = part.strip().strip("`").strip()
+        if part:
+            specs.append(part)
+    return specs
+
+
+async def validate_specs(specs):
+    """Validate every spec; returns an error naming the first bad one, or None."""
+    for i, spec in enumerate(specs, 1):
+        if any(t in UNSUPPORTED for t in shlex.split(spec)):
+            return f"Output {i}: -filter_complex/-map can't be combined in multi-output mode."
+        error = await validate_args(spec)
+        if error:
+            return f"Output {i}: {error}"
+    return None
+
+
+def build_args(specs, outs):
+    """Build one ffmpeg arg string that decodes once and encodes every spec.
+
+    The decoded video is fanned out with `split`; each branch gets that
+    spec's -vf chain, then its own maps, codec args and output file. The
+    last output is left off so run_ffmpeg can append it as usual.
+    """
+    n = len(specs)
+    graph = [f"[0:v]split={n}" + "".join(f"[s{i}]" for i in range(n))]
+    parts = []
+    for i, spec in enumerate(specs):
+        tokens = shlex.split(spec)
+        vf, rest = None, []
+        it = iter(tokens)
+        for tok in it:
+            if tok in VIDEO_FILTER_OPTS:
+                vf = next(it, None)
+            else:
+                rest.append(tok)
+        graph.append(f"[s{i}]{vf or 'null'}[v{i}]")
+        parts.append(f"-map '[v{i}]' -map '0:a?' {' '.join(shlex.quote(t) for t in rest)}")
+
+    args = f"-filter_complex {shlex.quote(';'.join(graph))}"
+    for part, out in zip(parts[:-1], outs[:-1]):
+        args += f" {part} {shlex.quote(out)}"
+    return f"{args} {parts[-1]}"
+
+
+def output_paths(base, specs):
+    return [f"{base}_{i + 1}.mkv" for i in range(len(specs))]
+
+
+async def run_multi(local_in, specs, outs, chat_id=None, module="", on_start=None):
+    """Encode every rendition from a single decode of local_in."""
+    return await run_ffmpeg(local_in, build_args(specs, outs), outs[-1], chat_id, f"{module}:multi", on_start)
+
+
+def cleanup(paths):
+    for p in paths:
+        try: os.remove(p)
+        except OSError: pass
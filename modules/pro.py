@@ -4,7 +4,15 @@ import logging
 from pyrogram import filters, Client
 from pyrogram.types import Message
 from pyrogram.enums import ChatAction
-from pyromod import listen  # For listening to user messages
+import metrics
+import tracing
+from bandwidth import bandwidth
+from uploadpool import pool as uploads
+from fvr import run_ffmpeg, validate_args
+from segment import parse_parallel, can_segment, segmented_encode
+import multiout
+import serve
+from session import SessionExpired, store as sessions
 
 # Set up logging configuration to capture only errors
 logging.basicConfig(
@@ -29,16 +37,48 @@ async def send_message_in_parts(bot, chat_id, message):
     for part in message_parts:
         await bot.send_message(chat_id, part)
 
+# Encode several renditions from one decode and upload each of them
+async def run_multi_output(bot, m, local_in, specs, base):
+    outs = multiout.output_paths(base, specs)
+    await m.reply_text(f"⚙️ Encoding {len(specs)} renditions from a single decode…")
+    result = await multiout.run_multi(local_in, specs, outs, m.chat.id, "pro")
+    try:
+        if result.returncode != 0:
+            err_msg = result.stderr.strip()
+            logging.error(f"FFmpeg multi-output failed for file {local_in}. Full error message:\n{err_msg}")
+            await send_message_in_parts(bot, m.chat.id, f"❌ Processing failed:\n`{err_msg}`")
+            return
+
+        async def upload(i, spec, path):
+            if serve.wanted(path):
+                await serve.send_link(bot, m.chat.id, path, f"✅ Rendition {i}/{len(specs)}: `{spec}`")
+                return
+            with metrics.timed("upload"), bandwidth.share("up") as share:
+                await uploads.send_document(bot, m.chat.id, path, caption=f"✅ Rendition {i}/{len(specs)}: `{spec}`",
+                                            progress=share.progress())
+            metrics.bytes_total.inc(os.path.getsize(path), direction="up")
+
+        # All renditions are finalized together when ffmpeg exits; send them side by side
+        await m.reply_chat_action(ChatAction.UPLOAD_DOCUMENT)
+        await asyncio.gather(*(upload(i, spec, path) for i, (spec, path) in enumerate(zip(specs, outs), 1)))
+        await m.reply_text(f"`{result.usage.summary()}`")
+    finally:
+        multiout.cleanup(outs + [local_in])
+
 # Main handler function for the "pro" command
 def pro_feature(bot: Client):
     @bot.on_message(filters.command("pro") & filters.private)
+    @sessions.conversation("pro")
     async def pro_handler(_, m: Message):
+        trace_token = None
         try:
+            conv = sessions.find("pro", m.chat.id)
+
             # Ask user to send a video or .mkv file
             await m.reply_text("📥 Please send me a video file or an .mkv document.")
 
             # Wait for the user to send the file
-            file_msg: Message = await bot.listen(m.chat.id)
+            file_msg: Message = await conv.listen()
 
             # Check if it's a video
             if file_msg.video:
@@ -54,62 +94,93 @@ def pro_feature(bot: Client):
             else:
                 return await m.reply_text("❌ Invalid file. Please send a supported video or .mkv file.")
 
+            # Ask for FFmpeg arguments before fetching anything
+            help_text = (
+                "Send your **ffmpeg** arguments.\n"
+                "For example: `-vf scale=1280:720 -c:v libx264 -crf 23`\n"
+                "Type `help` to see more examples.\n"
+                "Add `--parallel` (or `--parallel=N`) to encode keyframe segments on all cores.\n"
+                "Send several lines (one per output) to encode multiple renditions from a single decode."
+            )
+            await m.reply_text(help_text)
+
+            # Listen until the user sends args that pass the preflight check
+            while True:
+                cmd_msg: Message = await conv.listen()
+                ff_args = cmd_msg.text.strip()
+
+                # If user asks for help/examples
+                if ff_args.lower() in ("help", "?", "examples"):
+                    examples = (
+                        "`-vf scale=1280:720 -c:v libx264 -crf 23`\n"
+                        "`-q:v 2 -preset slow`\n"
+                        "`-c:v copy -c:a copy` (stream copy/no re-encode)"
+                    )
+                    await m.reply_text(
+                        f"Here are some example ffmpeg args:\n{examples}\n\nNow please send your ffmpeg arguments:"
+                    )
+                    continue
+
+                specs = multiout.parse_specs(ff_args)
+                if len(specs) > 1:
+                    segments = None
+                    error = await multiout.validate_specs(specs)
+                    if error is None:
+                        break
+                    await m.reply_text(f"❌ These ffmpeg args won't work:\n`{error}`\n\nPlease send corrected arguments:")
+                    continue
+                specs = None
+
+                ff_args, segments = parse_parallel(ff_args)
+                if segments and not can_segment(ff_args):
+                    await m.reply_text("⚠️ These args can't be split into segments, encoding in one pass.")
+                    segments = None
+                error = await validate_args(ff_args)
+                if error is None:
+                    break
+                await m.reply_text(f"❌ These ffmpeg args won't work:\n`{error}`\n\nPlease send corrected arguments:")
+
+            conv.state = "running"
+            trace_token = tracing.begin("pro", m.chat.id, args=ff_args)
+
             # Ensure the download directory exists
             ensure_dir(download_dir)
 
             file_name = os.path.join(download_dir, f"input_{file_msg.id}{ext}")
 
             # Download the file
-            local_in = await file_msg.download(file_name=file_name)
+            with metrics.timed("fetch"), bandwidth.share("down") as share:
+                local_in = await file_msg.download(file_name=file_name, progress=share.progress())
+            metrics.bytes_total.inc(os.path.getsize(local_in), direction="down")
 
             # Confirm download
             await m.reply_text(f"✅ Downloaded: `{os.path.basename(local_in)}`")
 
-            # Ask for FFmpeg arguments
-            help_text = (
-                "Send your **ffmpeg** arguments.\n"
-                "For example: `-vf scale=1280:720 -c:v libx264 -crf 23`\n"
-                "Type `help` to see more examples."
-            )
-            await m.reply_text(help_text)
-
-            # Listen for the user inputting ffmpeg args
-            cmd_msg: Message = await bot.listen(m.chat.id)
-            ff_args = cmd_msg.text.strip()
-
-            # If user asks for help/examples
-            if ff_args.lower() in ("help", "?", "examples"):
-                examples = (
-                    "`-vf scale=1280:720 -c:v libx264 -crf 23`\n"
-                    "`-q:v 2 -preset slow`\n"
-                    "`-c:v copy -c:a copy` (stream copy/no re-encode)"
-                )
-                await m.reply_text(
-                    f"Here are some example ffmpeg args:\n{examples}\n\nNow please send your ffmpeg arguments:"
-                )
-                cmd_msg = await bot.listen(m.chat.id)
-                ff_args = cmd_msg.text.strip()
-
             # Create output file path
             base, _ = os.path.splitext(local_in)
             local_out = f"{base}_pro.mkv"
 
+            if specs:
+                await run_multi_output(bot, m, local_in, specs, f"{base}_pro")
+                return
+
             # Build the ffmpeg command
             cmd = f"ffmpeg -i '{local_in}' {ff_args} '{local_out}'"
             await m.reply_text(f"⚙️ Processing with ffmpeg...\n`{cmd}`")
 
             # Run the ffmpeg command
-            proc = await asyncio.create_subprocess_shell(
-                cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            stdout, stderr = await proc.communicate()
+            if segments:
+                await m.reply_text(f"🧩 Encoding in {segments} parallel segments…")
+                result = await segmented_encode(local_in, ff_args, local_out, segments, m.chat.id, "pro")
+            else:
+                # A graceful restart lets this encode finish and the next process send the result
+                handoff = {"chat": m.chat.id, "caption": "✅ Here is your processed file.", "cleanup": [local_in]}
+                result = await run_ffmpeg(local_in, ff_args, local_out, m.chat.id, "pro", handoff=handoff)
 
             # Check if processing was successful
-            if proc.returncode != 0:
+            if result.returncode != 0:
                 # Capture full error message
-                err_msg = stderr.decode(errors="ignore").strip()
+                err_msg = result.stderr.strip()
                 logging.error(f"FFmpeg processing failed for file {file_name}. Full error message:\n{err_msg}")
                 
                 # Split and send long error messages
@@ -117,16 +188,28 @@ def pro_feature(bot: Client):
                 return
 
             # Upload the processed file
-            await m.reply_chat_action(ChatAction.UPLOAD_DOCUMENT)
-            await m.reply_document(local_out, caption="✅ Here is your processed file.")
+            caption = f"✅ Here is your processed file.\n\n`{result.usage.summary()}`"
+            if serve.wanted(local_out):
+                # Too big for Telegram: the file moves under the web server and is sent as a link
+                await serve.send_link(bot, m.chat.id, local_out, caption)
+                local_out = None
+            else:
+                await m.reply_chat_action(ChatAction.UPLOAD_DOCUMENT)
+                with metrics.timed("upload"), bandwidth.share("up") as share:
+                    await uploads.send_document(bot, m.chat.id, local_out, caption=caption, progress=share.progress())
+                metrics.bytes_total.inc(os.path.getsize(local_out), direction="up")
 
             # Clean up files
-            for path in (local_in, local_out):
+            for path in filter(None, (local_in, local_out)):
                 try:
                     os.remove(path)
                 except OSError as e:
                     logging.error(f"Error removing file {path}: {e}")
 
+        except SessionExpired:
+            raise
         except Exception as e:
             logging.error(f"Unexpected error in pro_handler: {e}")
-            await send_message_in_parts(bot, m.chat.id, f"❌ An unexpected error occurred: {e}")
\ No newline at end of file
+            await send_message_in_parts(bot, m.chat.id, f"❌ An unexpected error occurred: {e}")
+        finally:
+            tracing.end(trace_token)
\ No newline at end of file
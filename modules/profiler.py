@@ -0,0 +1,157 @@
+import io
+import os
+import sys
+import time
+import pstats
+import asyncio
+import cProfile
+import logging
+import threading
+import traceback
+from collections import Counter, deque
+from pyrogram import filters
+from pyrogram.types import Message
+
+import metrics
+from vars import OWNER_ID, SUDO_USERS
+from uploadpool import pool as uploads
+
+# ——— Configuration ———
+STALL_MS = int(os.environ.get("WATCHDOG_MS", 250))  # Loop stalls longer than this are captured; 0 disables
+BEAT = 0.05                 # Seconds between loop heartbeats
+MAX_SECONDS = 300           # Longest /profile session
+SAMPLE_INTERVAL = 0.005     # Seconds between stack samples in sampling mode
+TOP = 40                    # Functions listed in the report
+
+stalls_total = metrics.Counter("bot_loop_stalls_total", "Event-loop stalls caught by the watchdog.")
+
+stalls = deque(maxlen=50)   # recent stalls: {"at", "seconds", "stack"}
+_state = {"beat": time.monotonic(), "thread": None, "profiling": False}
+
+
+# ——— Stall Watchdog ———
+def _heartbeat(loop):
+    _state["beat"] = time.monotonic()
+    loop.call_later(BEAT, _heartbeat, loop)
+
+
+def _loop_stack():
+    frame = sys._current_frames().get(_state["thread"])
+    return "".join(traceback.format_stack(frame)) if frame else "(loop thread not found)"
+
+
+def _watch():
+    threshold = STALL_MS / 1000
+    current = None  # the stall in progress, if any
+    while True:
+        time.sleep(BEAT)
+        late = time.monotonic() - _state["beat"]
+        if late > threshold + BEAT:
+            if current is None:
+                # Grab the stack while the blocking call is still on it
+                current = {"at": time.time(), "seconds": late, "stack": _loop_stack()}
+                stalls.append(current)
+                stalls_total.inc()
+            current["seconds"] = late
+        elif current is not None:
+            logging.warning(f"Event loop stalled for {current['seconds']:.2f}s:\n{current['stack']}")
+            current = None
+
+
+def start_watchdog(loop=None):
+    """Start the heartbeat on the loop and the thread that watches it; call once from the loop."""
+    if not STALL_MS or _state["thread"] is not None:
+        return
+    loop = loop or asyncio.get_running_loop()
+    _state["thread"] = threading.get_ident()
+    _heartbeat(loop)
+    threading.Thread(target=_watch, name="loop-watchdog", daemon=True).start()
+
+
+def stall_report():
+    if not stalls:
+        return f"No event-loop stalls over {STALL_MS} ms recorded."
+    by_site = Counter(s["stack"] for s in stalls)
+    lines = [f"{len(stalls)} stalls over {STALL_MS} ms (most recent first):", ""]
+    for s in reversed(stalls):
+        when = time.strftime("%H:%M:%S", time.localtime(s["at"]))
+        lines.append(f"— {when}, {s['seconds']:.2f}s (seen {by_site[s['stack']]}x)")
+        lines.append(s["stack"])
+    return "\n".join(lines)
+
+
+# ——— Profiling Sessions ———
+async def profile_cpu(seconds):
+    """cProfile everything that runs on the loop thread for `seconds`."""
+    prof = cProfile.Profile()
+    prof.enable()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        prof.disable()
+    out = io.StringIO()
+    stats = pstats.Stats(prof, stream=out)
+    stats.sort_stats("tottime").print_stats(TOP)
+    stats.sort_stats("cumulative").print_stats(TOP)
+    return out.getvalue()
+
+
+def _sample(seconds, thread_id):
+    own, total = Counter(), Counter()
+    samples = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        frame = sys._current_frames().get(thread_id)
+        seen = set()
+        leaf = True
+        while frame is not None:
+            code = frame.f_code
+            key = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+            if leaf:
+                own[key] += 1
+                leaf = False
+            if key not in seen:
+                total[key] += 1
+                seen.add(key)
+            frame = frame.f_back
+        samples += 1
+        time.sleep(SAMPLE_INTERVAL)
+    return samples, own, total
+
+
+async def profile_samples(seconds):
+    """Sample the loop thread's stack from another thread; near-zero overhead on the loop."""
+    samples, own, total = await asyncio.to_thread(_sample, seconds, threading.get_ident())
+    lines = [f"{samples} samples every {SAMPLE_INTERVAL * 1000:.0f} ms", "", "Own time:"]
+    lines += [f"{n / samples:7.1%}  {key}" for key, n in own.most_common(TOP)]
+    lines += ["", "Inclusive time:"]
+    lines += [f"{n / samples:7.1%}  {key}" for key, n in total.most_common(TOP)]
+    return "\n".join(lines)
+
+
+def register_profile_command(bot):
+    @bot.on_message(filters.command("profile"))
+    async def profile_handler(client, m: Message):
+        """/profile [seconds] [sample] profiles the bot and sends the top functions plus stalls."""
+        if not m.from_user or m.from_user.id not in [OWNER_ID] + SUDO_USERS:
+            return await m.reply_text("⛔ /profile is for bot admins (OWNER_ID / SUDO_USERS).")
+        args = m.command[1:]
+        sampling = "sample" in args
+        seconds = min(MAX_SECONDS, max(1, int(next((a for a in args if a.isdigit()), 30))))
+        if _state["profiling"]:
+            return await m.reply_text("⏳ A profiling session is already running.")
+
+        _state["profiling"] = True
+        try:
+            await m.reply_text(f"🔬 Profiling for {seconds}s ({'sampling' if sampling else 'cProfile'})…")
+            report = await (profile_samples if sampling else profile_cpu)(seconds)
+        finally:
+            _state["profiling"] = False
+
+        path = f"profile_{int(time.time())}.txt"
+        with open(path, "w") as f:
+            f.write(report + "\n\n" + "=" * 60 + "\n\n" + stall_report() + "\n\nUpload sessions:\n" + uploads.status() + "\n")
+        try:
+            await m.reply_document(path, caption=f"📊 {seconds}s profile, {len(stalls)} stalls recorded")
+        finally:
+            os.remove(path)
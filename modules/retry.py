@@ -0,0 +1,190 @@
+import time
+import random
+import asyncio
+import logging
+from urllib.parse import urlparse
+
+import drain
+import metrics
+import tracing
+
+# ——— Configuration ———
+FAILURE_THRESHOLD = 5   # Consecutive failures that trip a host's breaker
+COOLDOWN = 120          # Seconds a tripped breaker stays open before a probe is let through
+MAX_COOLDOWN = 30 * 60  # Cooldown doubles after every failed probe, up to this
+MAX_DEFERRALS = 3       # Times a link may be pushed to the end of a batch before it counts as failed
+# Lower-cased fragments of yt-dlp and aria2 errors that no retry can fix; anything else
+# (timeouts, 5xx, 429, resets, DNS hiccups) is taken as transient
+PERMANENT_MARKERS = (
+    "http error 400", "http error 401", "http error 403", "http error 404", "http error 410",
+    "status=400", "status=401", "status=403", "status=404", "status=410", "resource not found",
+    "unsupported url", "is not a valid url", "private video", "video unavailable", "has been removed",
+    "this video is not available", "does not exist", "requested format is not available",
+    "sign in to confirm your age", "copyright", "members-only", "no video formats found",
+)
+
+breaker_trips = metrics.Counter("bot_breaker_trips_total", "Circuit breaker trips by host.", ["host"])
+retries_total = metrics.Counter("bot_retries_total", "Retried attempts by host.", ["host"])
+permanent_total = metrics.Counter("bot_permanent_failures_total", "Failures not retried (dead or unsupported links) by host.", ["host"])
+
+
+class RetryPolicy:
+    """Exponential backoff with jitter: attempt n waits about base * factor**n, capped."""
+
+    def __init__(self, attempts=3, base=2.0, factor=2.0, cap=60.0, jitter=0.5):
+        self.attempts = attempts
+        self.base = base
+        self.factor = factor
+        self.cap = cap
+        self.jitter = jitter
+
+    def delay(self, attempt):
+        d = min(self.cap, self.base * self.factor ** attempt)
+        return d * (1 - self.jitter * random.random())
+
+
+DEFAULT_POLICY = RetryPolicy()
+# URL substring → policy, for providers known to fail transiently a lot
+POLICIES = {
+    "visionias": RetryPolicy(attempts=10, base=5.0, cap=60.0),
+}
+
+
+def policy_for(url):
+    return next((p for key, p in POLICIES.items() if key in url), DEFAULT_POLICY)
+
+
+class CircuitOpen(Exception):
+    def __init__(self, host, retry_in):
+        super().__init__(f"{host} is failing, next try in {retry_in:.0f}s")
+        self.host = host
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """closed → (FAILURE_THRESHOLD failures) → open → (cooldown) → half-open, one probe at a time."""
+
+    __slots__ = ("host", "failures", "opened_at", "cooldown", "probing", "last_error")
+
+    def __init__(self, host):
+        self.host = host
+        self.failures = 0
+        self.opened_at = None
+        self.cooldown = COOLDOWN
+        self.probing = False
+        self.last_error = None
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if self.retry_in() == 0 else "open"
+
+    def retry_in(self):
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.opened_at + self.cooldown - time.monotonic())
+
+    def allow(self):
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self.probing:
+            self.probing = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.cooldown = COOLDOWN
+        self.probing = False
+
+    def record_failure(self, error=None):
+        self.failures += 1
+        self.last_error = str(error) if error else None
+        if self.probing:
+            # The probe failed: stay open, and wait longer next time
+            self.probing = False
+            self.cooldown = min(self.cooldown * 2, MAX_COOLDOWN)
+            self.opened_at = time.monotonic()
+        elif self.opened_at is None and self.failures >= FAILURE_THRESHOLD:
+            self.opened_at = time.monotonic()
+            breaker_trips.inc(host=self.host)
+            logging.warning(f"Circuit opened for {self.host} after {self.failures} failures: {error}")
+
+
+breakers = {}  # host → CircuitBreaker
+
+
+def host_of(url):
+    return urlparse(url).hostname or url
+
+
+def breaker_for(url):
+    host = host_of(url)
+    if host not in breakers:
+        breakers[host] = CircuitBreaker(host)
+    return breakers[host]
+
+
+def is_permanent(error):
+    """Whether retrying `error` is pointless: a dead, private or unsupported link, not a flaky host."""
+    text = str(error).lower()
+    return any(marker in text for marker in PERMANENT_MARKERS)
+
+
+def next_half_open():
+    """Seconds until the first open breaker lets a probe through (0 if none is open)."""
+    waits = [b.retry_in() for b in breakers.values() if b.opened_at is not None]
+    return min(waits) if waits else 0.0
+
+
+async def call(url, fn, policy=None, retry_on=(Exception,)):
+    """Run `await fn()` for url under its host's breaker and retry policy.
+
+    Raises CircuitOpen without calling fn when the host is tripped, or when
+    it trips during the retries; otherwise the last error once attempts run out.
+    Permanent errors (see is_permanent) are raised at once and don't count
+    against the host: the host answered, the link is what's broken. So are
+    errors while /stop drains, which come from drain pausing the downloads.
+    """
+    policy = policy or policy_for(url)
+    breaker = breaker_for(url)
+    for attempt in range(policy.attempts):
+        if not breaker.allow():
+            raise CircuitOpen(breaker.host, breaker.retry_in())
+        try:
+            result = await fn()
+        except retry_on as e:
+            if drain.draining():
+                # Paused for the restart, not failed: the caller checkpoints the link
+                breaker.probing = False
+                raise
+            if is_permanent(e):
+                breaker.probing = False
+                permanent_total.inc(host=breaker.host)
+                logging.error(f"Giving up on {url}, not retryable: {e}")
+                raise
+            breaker.record_failure(e)
+            logging.error(f"Attempt {attempt + 1}/{policy.attempts} failed for {url}: {e}")
+            if attempt + 1 == policy.attempts:
+                raise
+            retries_total.inc(host=breaker.host)
+            with tracing.span("retry-wait", attempt=attempt + 1):
+                await asyncio.sleep(policy.delay(attempt))
+        except BaseException:
+            breaker.probing = False
+            raise
+        else:
+            breaker.record_success()
+            return result
+
+
+def report():
+    """One line per host whose breaker isn't closed."""
+    lines = []
+    for b in breakers.values():
+        if b.state != "closed":
+            lines.append(f"{b.host}: {b.state}, {b.failures} failures, retry in {b.retry_in():.0f}s ({b.last_error})")
+    return "\n".join(lines)
@@ -0,0 +1,280 @@
+import asyncio
+import logging
+from pyrogram import filters
+
+import metrics
+
+# ——— Configuration ———
+GROUP = -2                  # Ahead of the lazy-loading stubs (-1) and every feature (0)
+CANCEL_COMMAND = "cancel"
+
+routes_open = metrics.Gauge("bot_router_routes", "Chats with an active conversation route.")
+routed_total = metrics.Counter("bot_router_messages_total", "Messages handed to a conversation.")
+closed_total = metrics.Counter("bot_router_closed_total", "Routes ended by the router.", ["reason"])
+
+
+class RouteClosed(Exception):
+    """The route ended before a message came; reason is "idle", "replaced", "cancelled" or the owner's."""
+
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class Route:
+    """One chat's active flow: either a state handler or a single pending wait."""
+
+    __slots__ = ("chat", "owner", "handler", "future", "commands", "timeout", "deadline", "timer", "on_close")
+
+    def __init__(self, chat, owner, handler, future, commands, timeout, on_close):
+        self.chat = chat
+        self.owner = owner
+        self.handler = handler    # bound flows: awaited with every non-command message
+        self.future = future      # waits: resolved with the next message
+        self.commands = commands  # commands that belong to the flow; others go to their handlers
+        self.timeout = timeout
+        self.deadline = None
+        self.timer = None
+        self.on_close = on_close  # called with the reason when the router ends the route
+
+
+def _command(text):
+    return text.split(maxsplit=1)[0][1:].split("@")[0].lower()
+
+
+class Router:
+    """Chat → the one flow that receives its messages.
+
+    Every update costs a dict lookup whatever the number of open
+    conversations, and a chat can only ever be routed to one flow: opening
+    a route closes the previous owner's with "replaced". A message only moves
+    its route's deadline; the one timer per route re-checks it when it fires.
+    """
+
+    def __init__(self):
+        self.routes = {}
+
+    def owner(self, chat):
+        route = self.routes.get(chat)
+        return route.owner if route else None
+
+    def wants(self, m):
+        """Whether m belongs to a conversation; used as the handler's filter."""
+        route = self.routes.get(m.chat.id) if m.chat else None
+        if route is None:
+            return False
+        text = m.text or ""
+        return not text.startswith("/") or _command(text) in route.commands
+
+    # ——— Opening and Closing ———
+    def _open(self, chat, owner, handler, future, commands, timeout, on_close):
+        old = self.routes.get(chat)
+        if old is not None:
+            if old.owner is owner:
+                self._drop(old)
+            else:
+                self._close(old, "replaced")
+        route = self.routes[chat] = Route(chat, owner, handler, future, commands, timeout, on_close)
+        routes_open.set(len(self.routes))
+        self._arm(route)
+        return route
+
+    def _arm(self, route):
+        if route.timeout:
+            loop = asyncio.get_running_loop()
+            route.deadline = loop.time() + route.timeout
+            route.timer = loop.call_later(route.timeout, self._expire, route)
+
+    def _expire(self, route):
+        if self.routes.get(route.chat) is not route:
+            return
+        left = route.deadline - asyncio.get_running_loop().time()
+        if left > 0:
+            route.timer = asyncio.get_running_loop().call_later(left, self._expire, route)
+        else:
+            self._close(route, "idle")
+
+    def _drop(self, route):
+        """Forget a route without telling its owner."""
+        if self.routes.get(route.chat) is route:
+            del self.routes[route.chat]
+            routes_open.set(len(self.routes))
+        if route.timer:
+            route.timer.cancel()
+            route.timer = None
+
+    def _close(self, route, reason):
+        self._drop(route)
+        closed_total.inc(reason=reason)
+        if route.future is not None and not route.future.done():
+            route.future.set_exception(RouteClosed(reason))
+        if route.on_close:
+            try:
+                route.on_close(reason)
+            except Exception as e:
+                logging.error(f"Closing the route for {route.chat} failed: {e}")
+
+    def bind(self, chat, owner, handler, timeout=None, on_close=None):
+        """Send every non-command message in chat to `await handler(m)` until released.
+
+        Each message restarts the timeout; on_close(reason) runs if the
+        router ends the route (idle, replaced or /cancel).
+        """
+        self._open(chat, owner, handler, None, frozenset(), timeout, on_close)
+
+    async def wait(self, chat, owner, timeout=None, commands=()):
+        """The chat's next message, or one of `commands`; raises RouteClosed."""
+        future = asyncio.get_running_loop().create_future()
+        route = self._open(chat, owner, None, future, frozenset(commands), timeout, None)
+        try:
+            return await future
+        finally:
+            self._drop(route)
+
+    def release(self, chat, owner, reason="released"):
+        """End owner's route on chat, if it still has it; a pending wait raises RouteClosed(reason)."""
+        route = self.routes.get(chat)
+        if route is None or route.owner is not owner:
+            return
+        self._drop(route)
+        if route.future is not None and not route.future.done():
+            route.future.set_exception(RouteClosed(reason))
+
+    def cancel(self, chat):
+        """/cancel: end whatever flow the chat is in. False if there was none."""
+        route = self.routes.get(chat)
+        if route is None:
+            return False
+        self._close(route, "cancelled")
+        return True
+
+    # ——— Dispatch ———
+    async def deliver(self, m):
+        """Hand m to its chat's flow; False if the chat has none."""
+        route = self.routes.get(m.chat.id)
+        if route is None:
+            return False
+        routed_total.inc()
+        if route.future is not None:
+            self._drop(route)
+            if not route.future.done():
+                route.future.set_result(m)
+            return True
+        if route.timeout:
+            route.deadline = asyncio.get_running_loop().time() + route.timeout
+        await route.handler(m)
+        return True
+
+
+router = Router()
+
+
+def attach(bot, group=GROUP):
+    """Register the router ahead of every feature; a routed message goes nowhere else."""
+    async def routed(_, __, m):
+        return router.wants(m)
+
+    @bot.on_message(filters.create(routed), group)
+    async def route_message(_, m):
+        await router.deliver(m)
+        m.stop_propagation()
+
+    @bot.on_message(filters.command(CANCEL_COMMAND), group)
+    async def cancel_handler(_, m):
+        # The flow itself says what was cancelled
+        if not router.cancel(m.chat.id):
+            await m.reply_text("🤷 Nothing to cancel.")
+        m.stop_propagation()
+
+
+# ——— Load Test ———
+async def _load_test(chats, rounds=5, seed=1):
+    """Thousands of chats talking at once: half in bound state machines, half in wait() loops."""
+    import time
+    import random
+    from types import SimpleNamespace
+
+    r = Router()
+    rng = random.Random(seed)
+    got = {c: [] for c in range(chats)}
+    owners = {c: object() for c in range(chats)}  # stand-ins for sessions; routes compare owners by identity
+
+    def message(chat, text):
+        return SimpleNamespace(chat=SimpleNamespace(id=chat), text=text)
+
+    async def waiter(chat):
+        try:
+            for _ in range(rounds):
+                got[chat].append((await r.wait(chat, owners[chat], timeout=60)).text)
+        except RouteClosed as e:
+            got[chat].append(e.reason)
+
+    for c in range(0, chats, 2):
+        async def handler(m, c=c):
+            got[c].append(m.text)
+        r.bind(c, owners[c], handler, timeout=60, on_close=lambda reason, c=c: got[c].append(reason))
+    tasks = [asyncio.ensure_future(waiter(c)) for c in range(1, chats, 2)]
+    await asyncio.sleep(0)
+
+    order = list(range(chats))
+    elapsed = delivered = 0
+    for n in range(rounds):
+        rng.shuffle(order)
+        batch = [message(c, f"{c}:{n}") for c in order]
+        start = time.perf_counter()
+        for m in batch:
+            if r.wants(m):
+                delivered += await r.deliver(m)
+        elapsed += time.perf_counter() - start
+        await asyncio.sleep(0)  # let the waiters resume and wait again
+    for c in range(0, chats, 2):
+        r.release(c, owners[c])
+    await asyncio.gather(*tasks)
+
+    misrouted = [c for c, texts in got.items() if texts != [f"{c}:{n}" for n in range(rounds)]]
+    assert not misrouted, f"{len(misrouted)} chats misrouted, e.g. {got[misrouted[0]]}"
+    assert delivered == chats * rounds and not r.routes
+    return elapsed / delivered * 1e6
+
+
+async def _timeout_and_cancel_test():
+    from types import SimpleNamespace
+
+    r = Router()
+    closed = []
+    idle = asyncio.ensure_future(r.wait(1, "a", timeout=0.05))
+    r.bind(2, "b", None, timeout=0.05, on_close=closed.append)
+    cancelled = asyncio.ensure_future(r.wait(3, "c"))
+    await asyncio.sleep(0)
+    assert r.cancel(3) and not r.cancel(3)
+    r.bind(3, "d", None, on_close=closed.append)
+    replaced = asyncio.ensure_future(r.wait(3, "e"))
+    await asyncio.sleep(0.1)
+    outcomes = []
+    for task in (idle, cancelled):
+        try:
+            await task
+        except RouteClosed as e:
+            outcomes.append(e.reason)
+    assert outcomes == ["idle", "cancelled"], outcomes
+    assert sorted(closed) == ["idle", "replaced"], closed
+    assert r.owner(3) == "e" and not r.wants(SimpleNamespace(chat=SimpleNamespace(id=3), text="/cancel"))
+    assert r.wants(SimpleNamespace(chat=SimpleNamespace(id=3), text="2"))
+    replaced.cancel()
+    await asyncio.gather(replaced, return_exceptions=True)
+    assert not r.routes
+
+
+def _main():
+    import sys
+
+    asyncio.run(_timeout_and_cancel_test())
+    print("timeouts, cancel and replace: OK")
+    sizes = [int(a) for a in sys.argv[1:]] or [100, 1000, 10000]
+    for chats in sizes:
+        per_msg = asyncio.run(_load_test(chats))
+        print(f"{chats:>6} chats: {per_msg:6.2f} µs per routed message, none misrouted")
+
+
+if __name__ == "__main__":
+    _main()
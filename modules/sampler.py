@@ -0,0 +1,187 @@
+import os
+import time
+import asyncio
+import logging
+import platform
+import subprocess
+from collections import deque
+from contextlib import asynccontextmanager
+
+import psutil
+
+# ——— Configuration ———
+INTERVAL = 5                    # Seconds between system samples
+WINDOW = 15 * 60 // INTERVAL    # Samples kept: 15 minutes of history
+JOB_INTERVAL = 1                # Seconds between per-job process polls
+DISK_PATHS = ("/", "./downloads")
+
+samples = deque(maxlen=WINDOW)  # dicts with t, cpu, freq, ram, disk, net_up, net_down, load
+recent_jobs = deque(maxlen=20)  # finished JobUsage summaries
+_static = {}
+
+
+def static_info():
+    """Hardware facts that never change; probed once (nvidia-smi included), primed by run()."""
+    if not _static:
+        freq = psutil.cpu_freq()
+        _static.update(
+            cpu_name=platform.processor() or "Unknown CPU (Colab?)",
+            physical_cores=psutil.cpu_count(logical=False),
+            logical_cores=psutil.cpu_count(logical=True),
+            freq_max=freq.max if freq else 0.0,
+            gpu=_gpu_info(),
+        )
+    return _static
+
+
+def _gpu_info():
+    try:
+        result = subprocess.run(
+            ["nvidia-smi", "--query-gpu=name,memory.total", "--format=csv,noheader,nounits"],
+            capture_output=True, text=True, check=True
+        )
+        name, mem_total = result.stdout.strip().split("\n")[0].split(", ")
+        return name, float(mem_total)
+    except Exception:
+        return "GPU Not Available", 0.0
+
+
+def gpu_usage():
+    """(utilisation %, memory used MB) of the first GPU, or None; blocking, call it in a thread."""
+    try:
+        result = subprocess.run(
+            ["nvidia-smi", "--query-gpu=utilization.gpu,memory.used", "--format=csv,noheader,nounits"],
+            capture_output=True, text=True, check=True
+        )
+        util, mem_used = result.stdout.strip().split("\n")[0].split(", ")
+        return float(util), float(mem_used)
+    except Exception:
+        return None
+
+
+def _disk_usage():
+    seen, usage = set(), {}
+    for path in DISK_PATHS:
+        if not os.path.exists(path):
+            continue
+        dev = os.stat(path).st_dev
+        if dev not in seen:
+            seen.add(dev)
+            usage[path] = psutil.disk_usage(path)
+    return usage
+
+
+def _take_sample(prev_net):
+    net = psutil.net_io_counters()
+    freq = psutil.cpu_freq()
+    now = time.time()
+    sample = {
+        "t": now,
+        "cpu": psutil.cpu_percent(interval=None),
+        "freq": freq.current if freq else 0.0,
+        "ram": psutil.virtual_memory(),
+        "disk": _disk_usage(),
+        "load": os.getloadavg(),
+        "net_up": 0.0,
+        "net_down": 0.0,
+    }
+    if prev_net:
+        elapsed = max(now - prev_net[0], 1e-6)
+        sample["net_up"] = (net.bytes_sent - prev_net[1].bytes_sent) / elapsed
+        sample["net_down"] = (net.bytes_recv - prev_net[1].bytes_recv) / elapsed
+    return sample, (now, net)
+
+
+async def run():
+    """Background task: sample the system every INTERVAL seconds into the ring buffer."""
+    psutil.cpu_percent(interval=None)  # prime the counter; the first reading is meaningless
+    await asyncio.to_thread(static_info)  # nvidia-smi can take a second; keep it off the loop
+    prev_net = None
+    while True:
+        try:
+            sample, prev_net = await asyncio.to_thread(_take_sample, prev_net)
+            samples.append(sample)
+        except Exception as e:
+            logging.error(f"System sampler failed: {e}")
+        await asyncio.sleep(INTERVAL)
+
+
+def current():
+    return samples[-1] if samples else None
+
+
+def trend(key, minutes):
+    """Average of a numeric sample field over the last `minutes`."""
+    cutoff = time.time() - minutes * 60
+    values = [s[key] for s in samples if s["t"] >= cutoff]
+    return sum(values) / len(values) if values else 0.0
+
+
+# ——— Per-job Accounting ———
+class JobUsage:
+    __slots__ = ("label", "start", "cpu", "rss_peak", "read", "write", "_seen", "wall")
+
+    def __init__(self, label):
+        self.label = label
+        self.start = time.monotonic()
+        self.cpu = self.read = self.write = 0.0
+        self.rss_peak = 0
+        self.wall = 0.0
+        self._seen = {}  # pid → (cpu, read, write) at first sight, last sight
+
+    def poll(self, root_pid):
+        try:
+            root = psutil.Process(root_pid)
+            procs = [root] + root.children(recursive=True)
+        except psutil.Error:
+            return
+        rss = 0
+        for p in procs:
+            try:
+                with p.oneshot():
+                    t = p.cpu_times()
+                    cpu = t.user + t.system
+                    try:
+                        io = p.io_counters()
+                        read, write = io.read_bytes, io.write_bytes
+                    except (psutil.AccessDenied, AttributeError):
+                        read = write = 0
+                    rss += p.memory_info().rss
+            except psutil.Error:
+                continue
+            first, _ = self._seen.get(p.pid, ((cpu, read, write), None))
+            self._seen[p.pid] = (first, (cpu, read, write))
+        self.rss_peak = max(self.rss_peak, rss)
+        # Long-lived processes (pool workers) count only what they did during this job
+        self.cpu = sum(last[0] - (first[0] if pid == root_pid else 0) for pid, (first, last) in self._seen.items())
+        self.read = sum(last[1] - (first[1] if pid == root_pid else 0) for pid, (first, last) in self._seen.items())
+        self.write = sum(last[2] - (first[2] if pid == root_pid else 0) for pid, (first, last) in self._seen.items())
+
+    def summary(self):
+        return (f"{self.label}: {self.wall:.0f}s wall, {self.cpu:.1f} CPU-s, "
+                f"peak RSS {self.rss_peak / 2**20:.0f} MiB, "
+                f"I/O {self.read / 2**20:.0f} MiB read / {self.write / 2**20:.0f} MiB written")
+
+
+@asynccontextmanager
+async def account(pid, label):
+    """Poll a child process tree while the block runs; yields its JobUsage."""
+    usage = JobUsage(label)
+
+    async def poller():
+        while True:
+            await asyncio.sleep(JOB_INTERVAL)
+            await asyncio.to_thread(usage.poll, pid)
+
+    # A baseline before the job and a last sample after it, so jobs shorter than
+    # JOB_INTERVAL on a long-lived pool worker still count what they used
+    await asyncio.to_thread(usage.poll, pid)
+    task = asyncio.create_task(poller())
+    try:
+        yield usage
+    finally:
+        await asyncio.to_thread(usage.poll, pid)
+        task.cancel()
+        usage.wall = time.monotonic() - usage.start
+        recent_jobs.append(usage.summary())
+        logging.info(usage.summary())
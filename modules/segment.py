@@ -0,0 +1,189 @@
+import os
+import re
+import sys
+import time
+import shlex
+import shutil
+import asyncio
+import tempfile
+
+from fvr import run_ffmpeg, probe, FFmpegResult
+from sampler import JobUsage
+
+# ——— Configuration ———
+CPUS = os.cpu_count() or 1
+MIN_SEGMENT = 30   # Seconds; shorter chunks cost more in keyframe overhead than they gain
+
+AUDIO_OPTS = {"-c:a", "-acodec", "-codec:a", "-b:a", "-ab", "-ar", "-ac", "-af", "-filter:a", "-q:a", "-aq"}
+AUDIO_FLAGS = {"-an"}
+# Args that depend on the whole timeline or on stream layout can't be split safely
+UNSAFE = {"-filter_complex", "-lavfi", "-ss", "-t", "-to", "-map", "-shortest", "-r", "-vsync", "-fps_mode"}
+PASSTHROUGH_EXTS = {".mkv", ".mka"}  # Containers that take any subtitle or attachment as is
+
+_PARALLEL = re.compile(r"(?:^|\s)--parallel(?:=(\d+))?(?=\s|$)")
+
+
+def parse_parallel(ff_args):
+    """Strip a `--parallel[=N]` marker from user args; returns (args, N or None)."""
+    match = _PARALLEL.search(ff_args)
+    if not match:
+        return ff_args, None
+    n = int(match.group(1)) if match.group(1) else CPUS
+    return _PARALLEL.sub(" ", ff_args).strip(), max(1, n)
+
+
+def split_args(ff_args):
+    """Separate ff_args into (video args, audio args)."""
+    tokens = shlex.split(ff_args)
+    video, audio = [], []
+    i = 0
+    while i < len(tokens):
+        tok = tokens[i]
+        if tok in AUDIO_OPTS and i + 1 < len(tokens):
+            audio += tokens[i:i + 2]
+            i += 2
+            continue
+        (audio if tok in AUDIO_FLAGS else video).append(tok)
+        i += 1
+    return video, audio
+
+
+def can_segment(ff_args):
+    tokens = shlex.split(ff_args)
+    if any(t in UNSAFE for t in tokens):
+        return False
+    for opt, value in zip(tokens, tokens[1:]):
+        if opt in ("-c:v", "-vcodec", "-c", "-codec") and value == "copy":
+            return False
+    return True
+
+
+def _join(tokens):
+    return " ".join(shlex.quote(t) for t in tokens)
+
+
+def _combine(label, results, wall):
+    usage = JobUsage(label)
+    for r in results:
+        usage.cpu += r.usage.cpu
+        usage.read += r.usage.read
+        usage.write += r.usage.write
+        usage.rss_peak += r.usage.rss_peak  # segments run side by side
+    usage.wall = wall
+    return usage
+
+
+async def segmented_encode(local_in, ff_args, local_out, segments=CPUS, chat_id=None, module="pro"):
+    """Encode local_in in `segments` keyframe-aligned chunks at once, then stitch.
+
+    The video stream is cut with stream copy at keyframes, each chunk is
+    encoded by its own ffmpeg with the user's video args, every audio track
+    is encoded once for the whole file, and the concat demuxer joins
+    everything without re-encoding; subtitles and attachments are copied
+    from the input. Inputs whose extra streams the output container can't
+    take as they are (or with a second video stream such as cover art) get
+    a single plain pass instead. Returns an FFmpegResult like fvr.run_ffmpeg.
+    """
+    start = time.monotonic()
+    info = await probe(local_in)
+    kinds = [s.split(":")[0] for s in info["streams"]] if info else []
+    subs = "subtitle" in kinds and "-sn" not in shlex.split(ff_args)
+    attachments = "attachment" in kinds
+    passthrough = os.path.splitext(local_out)[1].lower() in PASSTHROUGH_EXTS
+    if kinds.count("video") > 1 or ((subs or attachments) and not passthrough):
+        return await run_ffmpeg(local_in, ff_args, local_out, chat_id, module)
+    duration = info["duration"] if info else 0
+    segments = max(1, min(segments, int(duration // MIN_SEGMENT) or 1))
+    work = tempfile.mkdtemp(prefix="seg_", dir=os.path.dirname(os.path.abspath(local_out)))
+    results = []
+
+    def failed(result):
+        return FFmpegResult(result.returncode, result.stderr, _combine("segmented", results, time.monotonic() - start), result.entry)
+
+    try:
+        # 1. Cut the video stream at keyframes
+        split = await run_ffmpeg(
+            local_in,
+            f"-map 0:v:0 -c copy -f segment -segment_time {duration / segments:.3f} -reset_timestamps 1",
+            os.path.join(work, "seg_%03d.mkv"), chat_id, f"{module}:split"
+        )
+        results.append(split)
+        if split.returncode != 0:
+            return failed(split)
+        chunks = sorted(f for f in os.listdir(work) if f.startswith("seg_"))
+
+        # 2. Encode audio once and every video chunk concurrently
+        video, audio = split_args(ff_args)
+        if "-threads" not in video:
+            video += ["-threads", str(max(1, CPUS // len(chunks)))]
+        audio_out = os.path.join(work, "audio.mka")
+        has_audio = bool(info) and any(s.startswith("audio:") for s in info["streams"]) and "-an" not in audio
+        jobs = []
+        if has_audio:
+            jobs.append(run_ffmpeg(local_in, f"-vn -map 0:a {_join(audio or ['-c:a', 'copy'])}", audio_out,
+                                   chat_id, f"{module}:audio"))
+        for chunk in chunks:
+            jobs.append(run_ffmpeg(os.path.join(work, chunk), f"-an {_join(video)}",
+                                   os.path.join(work, "enc_" + chunk), chat_id, f"{module}:segment"))
+        encoded = await asyncio.gather(*jobs)
+        results.extend(encoded)
+        for r in encoded:
+            if r.returncode != 0:
+                return failed(r)
+
+        # 3. Stitch the chunks and the audio back together, and copy subtitles and attachments over
+        listing = os.path.join(work, "list.txt")
+        with open(listing, "w") as f:
+            f.writelines(f"file '{os.path.join(work, 'enc_' + c)}'\n" for c in chunks)
+        inputs, maps = [], ["-map 0:v"]
+        if has_audio:
+            inputs.append(f"-i '{audio_out}'")
+            maps.append(f"-map {len(inputs)}:a")
+        if subs or attachments:
+            inputs.append(f"-i '{local_in}'")
+            maps += ([f"-map {len(inputs)}:s"] if subs else []) + ([f"-map {len(inputs)}:t"] if attachments else [])
+        mux = " ".join(inputs + maps + ["-c copy"])
+        concat = await run_ffmpeg(listing, mux, local_out, chat_id, f"{module}:concat",
+                                  input_opts="-f concat -safe 0")
+        results.append(concat)
+        if concat.returncode != 0:
+            return failed(concat)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    return FFmpegResult(0, concat.stderr, _combine("segmented", results, time.monotonic() - start), concat.entry)
+
+
+# ——— Benchmark: single process vs segmented ———
+async def _bench(local_in, ff_args, segments):
+    ext = ".mkv"
+    single_out = os.path.splitext(local_in)[0] + "_single" + ext
+    seg_out = os.path.splitext(local_in)[0] + "_segmented" + ext
+    for p in (single_out, seg_out):
+        if os.path.exists(p):
+            os.remove(p)
+
+    t0 = time.monotonic()
+    single = await run_ffmpeg(local_in, ff_args, single_out, module="bench:single")
+    t1 = time.monotonic()
+    seg = await segmented_encode(local_in, ff_args, seg_out, segments, module="bench")
+    t2 = time.monotonic()
+    if single.returncode or seg.returncode:
+        print((single.stderr if single.returncode else seg.stderr)[-2000:])
+        sys.exit(1)
+
+    a, b = await probe(single_out), await probe(seg_out)
+    print(f"single   : {t1 - t0:8.1f}s")
+    print(f"segmented: {t2 - t1:8.1f}s  ({(t1 - t0) / (t2 - t1):.2f}x, {segments} segments)")
+    print(f"duration : {a['duration']:.2f}s vs {b['duration']:.2f}s")
+    layout = lambda p: [s.split()[0] for s in p["streams"]]
+    ok = abs(a["duration"] - b["duration"]) <= 0.5 and layout(a) == layout(b)
+    print(f"streams  : {layout(a)} vs {layout(b)}")
+    print("MATCH" if ok else "MISMATCH")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        sys.exit("usage: python segment.py INPUT 'FF_ARGS' [SEGMENTS]")
+    asyncio.run(_bench(sys.argv[1], sys.argv[2], int(sys.argv[3]) if len(sys.argv) > 3 else CPUS))
@@ -0,0 +1,150 @@
+import os
+import hmac
+import json
+import time
+import shutil
+import asyncio
+import hashlib
+import logging
+import secrets
+from urllib.parse import quote
+from aiohttp import web
+
+from vars import BASE_URL, DIRECT_LINKS
+
+# ——— Configuration ———
+SERVE_DIR = "./downloads/public"
+TTL = 24 * 3600                 # Seconds a published link stays valid
+UPLOAD_LIMIT = 2000 * 2**20     # Outputs above this can't go through Telegram at all
+MAX_CONNECTIONS = 16            # Concurrent downloads across all files
+MAX_PER_IP = 4                  # Concurrent downloads per client address
+GC_INTERVAL = 10 * 60
+
+routes = web.RouteTableDef()
+_state = {"serving": False, "secret": None, "active": 0}
+_per_ip = {}
+
+
+def _secret():
+    """HMAC key from SERVE_SECRET, or one generated once and kept next to the files."""
+    if _state["secret"] is None:
+        key = os.environ.get("SERVE_SECRET", "")
+        if not key:
+            os.makedirs(SERVE_DIR, exist_ok=True)
+            path = os.path.join(SERVE_DIR, ".secret")
+            if not os.path.exists(path):
+                with open(path, "w") as f:
+                    f.write(secrets.token_hex(32))
+            with open(path) as f:
+                key = f.read().strip()
+        _state["secret"] = key.encode()
+    return _state["secret"]
+
+
+def _sign(token, name, expires):
+    msg = f"{token}/{name}:{expires}".encode()
+    return hmac.new(_secret(), msg, hashlib.sha256).hexdigest()[:32]
+
+
+def wanted(path):
+    """Whether an output should go out as a link instead of a Telegram upload."""
+    if not _state["serving"] or not BASE_URL or not DIRECT_LINKS:
+        return False
+    return DIRECT_LINKS == "always" or os.path.getsize(path) > UPLOAD_LIMIT
+
+
+def publish(path, ttl=TTL):
+    """Move a finished file under SERVE_DIR and return its signed, expiring URL."""
+    token = secrets.token_urlsafe(9)
+    name = os.path.basename(path)
+    expires = int(time.time() + ttl)
+    folder = os.path.join(SERVE_DIR, token)
+    os.makedirs(folder)
+    shutil.move(path, os.path.join(folder, name))
+    with open(os.path.join(folder, "meta.json"), "w") as f:
+        json.dump({"name": name, "expires": expires}, f)
+    return f"{BASE_URL.rstrip('/')}/d/{token}/{quote(name)}?e={expires}&s={_sign(token, name, expires)}"
+
+
+async def send_link(bot, chat_id, path, caption=""):
+    size = os.path.getsize(path)
+    url = await asyncio.to_thread(publish, path)
+    await bot.send_message(
+        chat_id,
+        f"{caption}\n\n🔗 **Direct link** ({size / 2**30:.2f} GiB, valid {TTL // 3600} h):\n{url}".strip(),
+        disable_web_page_preview=True
+    )
+    return url
+
+
+@routes.get("/d/{token}/{name}")
+async def download_handler(request):
+    token, name = request.match_info["token"], request.match_info["name"]
+    try:
+        expires = int(request.query.get("e", ""))
+    except ValueError:
+        raise web.HTTPForbidden()
+    if not hmac.compare_digest(request.query.get("s", ""), _sign(token, name, expires)):
+        raise web.HTTPForbidden()
+    if expires < time.time():
+        raise web.HTTPGone(text="This link has expired.")
+    path = os.path.join(SERVE_DIR, token, name)
+    if os.sep in token or os.sep in name or not os.path.isfile(path):
+        raise web.HTTPNotFound()
+
+    ip = request.remote
+    if _state["active"] >= MAX_CONNECTIONS or _per_ip.get(ip, 0) >= MAX_PER_IP:
+        raise web.HTTPServiceUnavailable(headers={"Retry-After": "30"}, text="Too many downloads, retry shortly.")
+    _state["active"] += 1
+    _per_ip[ip] = _per_ip.get(ip, 0) + 1
+    try:
+        # FileResponse uses sendfile() and answers Range/If-Range requests itself
+        resp = web.FileResponse(path, headers={
+            "Content-Disposition": f"attachment; filename*=UTF-8''{quote(name)}",
+            "Cache-Control": "private, max-age=0",
+        })
+        await resp.prepare(request)
+        return resp
+    finally:
+        _state["active"] -= 1
+        _per_ip[ip] -= 1
+        if not _per_ip[ip]:
+            del _per_ip[ip]
+
+
+def _collect():
+    if not os.path.isdir(SERVE_DIR):
+        return 0
+    removed = 0
+    now = time.time()
+    for token in os.listdir(SERVE_DIR):
+        folder = os.path.join(SERVE_DIR, token)
+        if not os.path.isdir(folder):
+            continue
+        try:
+            with open(os.path.join(folder, "meta.json")) as f:
+                expires = json.load(f)["expires"]
+        except (OSError, ValueError, KeyError):
+            expires = os.path.getmtime(folder) + TTL
+        if expires < now:
+            shutil.rmtree(folder, ignore_errors=True)
+            removed += 1
+    return removed
+
+
+async def gc_loop():
+    """Delete published files once their links have expired."""
+    while True:
+        try:
+            removed = await asyncio.to_thread(_collect)
+            if removed:
+                logging.info(f"Removed {removed} expired direct-download files")
+        except Exception as e:
+            logging.error(f"Direct-download GC failed: {e}")
+        await asyncio.sleep(GC_INTERVAL)
+
+
+def setup(app):
+    """Mount the download route on the bot's web server and turn link delivery on."""
+    app.add_routes(routes)
+    _state["serving"] = True
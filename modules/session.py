@@ -0,0 +1,238 @@
+import os
+import sys
+import time
+import signal
+import asyncio
+import logging
+import functools
+from collections import OrderedDict
+from pyrogram import filters
+from pyrogram.types import Message
+
+import metrics
+from router import router, RouteClosed
+from vars import OWNER_ID, SUDO_USERS
+
+# ——— Configuration ———
+IDLE_TTL = int(os.environ.get("SESSION_TTL", 30 * 60))   # Seconds without a message before a session ends
+MAX_SESSIONS = int(os.environ.get("MAX_SESSIONS", 2000))  # Least recently used sessions go first beyond this
+SWEEP_INTERVAL = 60
+
+sessions_open = metrics.Gauge("bot_sessions", "Open conversation sessions.", ["kind"])
+session_bytes = metrics.Gauge("bot_session_bytes", "Approximate memory held by sessions.")
+evictions_total = metrics.Counter("bot_session_evictions_total", "Sessions ended by the store.", ["reason"])
+
+
+class SessionExpired(Exception):
+    """The session was evicted (idle, or the store was full) while waiting on the user."""
+
+
+class Session:
+    """One chat's conversation with one feature.
+
+    `state` is None when idle, any feature-defined string while talking to
+    the user, and "running" while work is in progress; running sessions are
+    never evicted. `tasks` and `procs` are cancelled/killed on eviction.
+    Messages reach a session through the router, by listen() or route().
+    """
+
+    __slots__ = ("kind", "chat", "state", "tasks", "procs", "touched", "closed")
+
+    def __init__(self, kind, chat):
+        self.kind = kind
+        self.chat = chat
+        self.state = None
+        self.tasks = []
+        self.procs = []
+        self.touched = time.monotonic()
+        self.closed = False
+
+    @property
+    def running(self):
+        return self.state == "running"
+
+    def idle_for(self):
+        return time.monotonic() - self.touched
+
+    async def listen(self, timeout=IDLE_TTL, commands=()):
+        """The chat's next message (or one of `commands`); raises SessionExpired on timeout, /cancel or eviction."""
+        if self.closed:
+            raise SessionExpired(f"/{self.kind} was cancelled.")
+        store.touch(self)
+        try:
+            return await router.wait(self.chat, self, timeout, commands)
+        except RouteClosed as e:
+            if e.reason == "idle":
+                raise SessionExpired(f"No reply for {timeout // 60} min, /{self.kind} cancelled.")
+            if e.reason == "replaced":
+                raise SessionExpired(f"/{self.kind} was cancelled by another command.")
+            raise SessionExpired(f"/{self.kind} was cancelled.")
+        finally:
+            store.touch(self)
+
+    def route(self, handler, timeout=IDLE_TTL):
+        """Send the chat's non-command messages to `await handler(m)` until release().
+
+        If the router ends the route (idle, /cancel, another flow) the session is evicted.
+        """
+        async def on_message(m):
+            store.touch(self)
+            await handler(m)
+        router.bind(self.chat, self, on_message, timeout, lambda reason: store.evict(self, reason))
+
+    def release(self):
+        router.release(self.chat, self)
+
+    def footprint(self):
+        """Approximate bytes held: the object, its slots and one level into containers."""
+        total = sys.getsizeof(self)
+        for name in _all_slots(type(self)):
+            value = getattr(self, name, None)
+            total += sys.getsizeof(value)
+            if isinstance(value, dict):
+                total += sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in value.items())
+            elif isinstance(value, (list, tuple, set)):
+                total += sum(sys.getsizeof(v) for v in value)
+        return total
+
+
+@functools.lru_cache(maxsize=None)
+def _all_slots(cls):
+    return tuple(s for c in cls.__mro__ for s in getattr(c, "__slots__", ()))
+
+
+class SessionStore:
+    """All sessions by (kind, chat), least recently used first."""
+
+    def __init__(self, ttl=IDLE_TTL, max_sessions=MAX_SESSIONS):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.sessions = OrderedDict()
+        self.bot = None
+
+    def find(self, kind, chat):
+        """The chat's session for `kind` if it has one, marked as just used."""
+        session = self.sessions.get((kind, chat))
+        if session is not None:
+            self.touch(session)
+        return session
+
+    def get(self, kind, chat, cls=Session):
+        """The chat's session for `kind`, created if needed, and marked as just used."""
+        session = self.sessions.get((kind, chat))
+        if session is None:
+            session = self.sessions[(kind, chat)] = cls(kind, chat)
+            sessions_open.inc(kind=kind)
+            self._enforce_limit()
+        self.touch(session)
+        return session
+
+    def touch(self, session):
+        session.touched = time.monotonic()
+        if self.sessions.get((session.kind, session.chat)) is session:
+            self.sessions.move_to_end((session.kind, session.chat))
+
+    def close(self, session):
+        """Forget a session whose work finished normally."""
+        session.closed = True
+        session.release()
+        if self.sessions.get((session.kind, session.chat)) is session:
+            del self.sessions[(session.kind, session.chat)]
+            sessions_open.inc(-1, kind=session.kind)
+
+    def evict(self, session, reason):
+        """End a session: stop its route and tasks, kill its processes, tell the user."""
+        if session.closed:
+            return
+        # Conversations report their own end through SessionExpired
+        notify = session.state not in (None, "talking")
+        router.release(session.chat, session, reason)
+        self.close(session)
+        evictions_total.inc(reason=reason)
+        for task in session.tasks:
+            if task is not asyncio.current_task():
+                task.cancel()
+        for proc in session.procs:
+            try: proc.send_signal(signal.SIGKILL)
+            except ProcessLookupError: pass
+        if notify and self.bot:
+            note = {"idle": "idle", "cancelled": "cancelled", "replaced": "another command took over"}.get(
+                reason, "the bot is busy")
+            asyncio.ensure_future(self._notify(session.chat, f"⌛ Your /{session.kind} session was closed ({note})."))
+
+    async def _notify(self, chat, text):
+        try:
+            await self.bot.send_message(chat, text)
+        except Exception as e:
+            logging.error(f"Could not tell {chat} about its closed session: {e}")
+
+    def _enforce_limit(self):
+        if len(self.sessions) <= self.max_sessions:
+            return
+        for session in list(self.sessions.values()):
+            if len(self.sessions) <= self.max_sessions:
+                break
+            if not session.running:
+                self.evict(session, "lru")
+
+    def sweep(self):
+        for session in list(self.sessions.values()):
+            if not session.running and session.idle_for() > self.ttl:
+                self.evict(session, "idle")
+        session_bytes.set(sum(s.footprint() for s in self.sessions.values()))
+
+    async def sweep_loop(self, bot):
+        self.bot = bot
+        while True:
+            await asyncio.sleep(SWEEP_INTERVAL)
+            try:
+                self.sweep()
+            except Exception as e:
+                logging.error(f"Session sweep failed: {e}")
+
+    def conversation(self, kind):
+        """Decorator for a handler that talks to the user: one session per chat while it runs.
+
+        A new command replaces a conversation that is still waiting on the
+        user, but not one that is already running. Expiry ends the handler
+        with a short notice instead of an error.
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(client, m):
+                old = self.find(kind, m.chat.id)
+                if old and old.running:
+                    return await m.reply_text(f"⏳ Your previous /{kind} is still running.")
+                if old:
+                    self.evict(old, "replaced")
+                session = self.get(kind, m.chat.id)
+                session.state = "talking"
+                try:
+                    return await func(client, m)
+                except SessionExpired as e:
+                    await m.reply_text(f"⌛ {e}")
+                finally:
+                    self.close(session)
+            return wrapper
+        return decorator
+
+    def report(self):
+        lines = []
+        for s in sorted(self.sessions.values(), key=lambda s: s.footprint(), reverse=True):
+            lines.append(f"/{s.kind} {s.chat}: {s.state or 'idle'}, {s.footprint() / 1024:.1f} KiB, "
+                         f"idle {s.idle_for():.0f}s, {len(s.tasks)} tasks")
+        total = sum(s.footprint() for s in self.sessions.values())
+        header = f"{len(self.sessions)}/{self.max_sessions} sessions, {total / 1024:.1f} KiB"
+        return "\n".join([header] + lines)
+
+
+store = SessionStore()
+
+
+def register_sessions_command(bot):
+    @bot.on_message(filters.command("sessions"))
+    async def sessions_handler(client, m: Message):
+        """/sessions lists open sessions with their memory, biggest first."""
+        if not m.from_user or m.from_user.id not in [OWNER_ID] + SUDO_USERS:
+            return await m.reply_text("⛔ /sessions is for bot admins (OWNER_ID / SUDO_USERS).")
+        await m.reply_text(store.report()[:4096])
@@ -1,88 +1,84 @@
 import os
 import time
+import asyncio
 import logging
 import psutil
-import platform
 import datetime
-import subprocess
+import loader
+import sampler
 from pyrogram import filters
 from pyrogram.types import Message
 
 LOGS = logging.getLogger("System_Info")
 
-def get_gpu_info():
-    try:
-        result = subprocess.run(
-            ["nvidia-smi", "--query-gpu=name,memory.total,memory.used", "--format=csv,noheader,nounits"],
-            capture_output=True, text=True, check=True
-        )
-        name, mem_total, mem_used = result.stdout.strip().split(', ')
-        return name, float(mem_total), float(mem_used)
-    except Exception as e:
-        LOGS.warning(f"GPU info not available via nvidia-smi: {e}")
-        return "GPU Not Available", 0.0, 0.0
-
 def register_system_info_handler(bot):
     @bot.on_message(filters.command("systeminfo"))
     async def system_info(client, message: Message):
         LOGS.info(f"Received /systeminfo from {message.from_user.id if message.from_user else 'Unknown'}")
         try:
-            # CPU Info
-            cpu_name = platform.processor() or "Unknown CPU (Colab?)"
-            physical_cores = psutil.cpu_count(logical=False)
-            logical_cores = psutil.cpu_count(logical=True)
-            cpu_freq = psutil.cpu_freq()
-            cpu_usage = psutil.cpu_percent(interval=1)
+            info = await asyncio.to_thread(sampler.static_info)  # already probed unless the sampler just started
+            now = sampler.current()
+            if now is None:
+                return await message.reply_text("⏳ System sampler is still warming up, try again in a few seconds.")
 
             # RAM Info
-            virtual_memory = psutil.virtual_memory()
-            total_ram = virtual_memory.total / (1024 ** 3)
-            available_ram = virtual_memory.available / (1024 ** 3)
-            used_ram = virtual_memory.used / (1024 ** 3)
-            ram_usage = virtual_memory.percent
+            ram = now["ram"]
+            total_ram = ram.total / (1024 ** 3)
+            available_ram = ram.available / (1024 ** 3)
+            used_ram = ram.used / (1024 ** 3)
 
             # Disk Info
-            partitions = psutil.disk_partitions()
             disk_info = ""
-            for partition in partitions:
-                try:
-                    usage = psutil.disk_usage(partition.mountpoint)
-                    disk_info += (
-                        f"\n🔹 **{partition.device}**: {usage.percent}% used "
-                        f"({usage.used / (1024 ** 3):.2f} GB / {usage.total / (1024 ** 3):.2f} GB)"
-                    )
-                except PermissionError:
-                    continue
+            for path, usage in now["disk"].items():
+                disk_info += (
+                    f"\n🔹 **{path}**: {usage.percent}% used "
+                    f"({usage.used / (1024 ** 3):.2f} GB / {usage.total / (1024 ** 3):.2f} GB)"
+                )
+
+            # Trends over the sampler's ring buffer
+            cpu_trend = " / ".join(f"{sampler.trend('cpu', m):.0f}%" for m in (1, 5, 15))
+            up_trend = " / ".join(f"{sampler.trend('net_up', m) / 1024 ** 2:.2f}" for m in (1, 5, 15))
+            down_trend = " / ".join(f"{sampler.trend('net_down', m) / 1024 ** 2:.2f}" for m in (1, 5, 15))
+            load = " / ".join(f"{x:.2f}" for x in now["load"])
 
             # GPU Info
-            gpu_name, gpu_memory, gpu_usage = get_gpu_info()
+            gpu_name, gpu_memory = info["gpu"]
+            gpu_now = await asyncio.to_thread(sampler.gpu_usage) if gpu_memory else None
+            gpu_util, gpu_used = gpu_now or (0.0, 0.0)
 
             # Uptime
-            boot_time = psutil.boot_time()
-            uptime_seconds = time.time() - boot_time
+            uptime_seconds = time.time() - psutil.boot_time()
             uptime = str(datetime.timedelta(seconds=int(uptime_seconds)))
 
+            jobs = "\n".join(sampler.recent_jobs) or "None yet"
+
             # Build the reply
             reply = (
                 "🖥 **System Information (Colab)**\n"
-                f"🔹 **Processor**: {cpu_name}\n"
-                f"🔹 **Physical Cores**: {physical_cores}\n"
-                f"🔹 **Logical Cores**: {logical_cores}\n"
-                f"🔹 **Max Frequency**: {cpu_freq.max:.2f} MHz\n"
-                f"🔹 **Current Frequency**: {cpu_freq.current:.2f} MHz\n"
-                f"🔹 **CPU Usage**: {cpu_usage}%\n\n"
+                f"🔹 **Processor**: {info['cpu_name']}\n"
+                f"🔹 **Physical Cores**: {info['physical_cores']}\n"
+                f"🔹 **Logical Cores**: {info['logical_cores']}\n"
+                f"🔹 **Max Frequency**: {info['freq_max']:.2f} MHz\n"
+                f"🔹 **Current Frequency**: {now['freq']:.2f} MHz\n"
+                f"🔹 **CPU Usage**: {now['cpu']}%\n"
+                f"🔹 **CPU 1/5/15m**: {cpu_trend}\n"
+                f"🔹 **Load 1/5/15m**: {load}\n\n"
                 f"🔹 **Total RAM**: {total_ram:.2f} GB\n"
                 f"🔹 **Used RAM**: {used_ram:.2f} GB\n"
                 f"🔹 **Available RAM**: {available_ram:.2f} GB\n"
-                f"🔹 **RAM Usage**: {ram_usage}%\n\n"
+                f"🔹 **RAM Usage**: {ram.percent}%\n\n"
+                f"🔹 **Net Up 1/5/15m**: {up_trend} MB/s\n"
+                f"🔹 **Net Down 1/5/15m**: {down_trend} MB/s\n\n"
                 f"🔹 **Disk Info**: {disk_info}\n\n"
                 f"🔹 **GPU**: {gpu_name}\n"
                 f"🔹 **GPU Memory**: {gpu_memory:.2f} MB\n"
-                f"🔹 **GPU Usage**: {gpu_usage:.2f} MB\n\n"
-                f"🔹 **System Uptime**: {uptime}"
+                f"🔹 **GPU Usage**: {gpu_util:.0f}% ({gpu_used:.2f} MB used)\n\n"
+                f"🔹 **System Uptime**: {uptime}\n\n"
+                f"🔹 **Recent Jobs**:\n`{jobs}`\n\n"
+                f"🔹 **Feature Import Cost**:\n`{loader.import_report()}`"
             )
 
             await message.reply_text(reply)
         except Exception as e:
             LOGS.error(f"Error in /systeminfo: {e}")
-            await message.reply_text("❌ Failed to fetch system info. Possibly due to Colab limitations.")
\ No newline at end of file
+            await message.reply_text("❌ Failed to fetch system info. Possibly due to Colab limitations.")
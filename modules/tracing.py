@@ -0,0 +1,178 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import itertools
+import contextvars
+from collections import OrderedDict
+from contextlib import contextmanager
+from pyrogram import filters
+from pyrogram.types import Message
+
+from vars import OWNER_ID, SUDO_USERS
+
+# ——— Configuration ———
+# Set TRACE=0 to keep only the in-memory summaries and skip the trace file
+ENABLED = os.environ.get("TRACE", "1") != "0"
+TRACE_DIR = "/content/traces" if os.path.isdir("/content") else "./traces"
+KEEP_BATCHES = 50   # Batch summaries kept in memory for /trace
+MAX_TRACE_MB = int(os.environ.get("TRACE_MAX_MB", 20))  # Trace file size before it's rotated, so /trace file can send it
+
+# Trace file in Chrome's JSON array format: "[" then one event per line with a
+# trailing comma. The closing bracket is optional, so the file loads into
+# chrome://tracing or ui.perfetto.dev at any point, even while being written.
+TRACE_FILE = os.path.join(TRACE_DIR, time.strftime("trace_%Y%m%d-%H%M%S.json"))
+PREVIOUS_FILE = TRACE_FILE.replace(".json", ".prev.json")  # the part before the last rotation
+
+_ids = contextvars.ContextVar("trace_ids", default={})  # chat, batch, item of the running job
+_batch_ids = itertools.count(1)
+batches = OrderedDict()  # batch id → summary dict, see begin()
+last_batch = {}          # chat id → most recent batch id
+_state = {"queue": None, "writer": None}
+
+
+def _now_us():
+    return time.time() * 1e6
+
+
+def _append(lines):
+    os.makedirs(TRACE_DIR, exist_ok=True)
+    if os.path.exists(TRACE_FILE) and os.path.getsize(TRACE_FILE) > MAX_TRACE_MB * 2**20:
+        os.replace(TRACE_FILE, PREVIOUS_FILE)
+    new = not os.path.exists(TRACE_FILE)
+    with open(TRACE_FILE, "a") as f:
+        if new:
+            f.write("[\n")
+        f.writelines(lines)
+
+
+async def _writer():
+    queue = _state["queue"]
+    while True:
+        lines = [await queue.get()]
+        while not queue.empty():
+            lines.append(queue.get_nowait())
+        try:
+            await asyncio.to_thread(_append, lines)
+        except Exception as e:
+            logging.error(f"Failed to write trace file: {e}")
+
+
+def _emit(event):
+    if not ENABLED:
+        return
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return  # outside the bot's loop (benchmarks, worker processes)
+    if _state["writer"] is None:
+        _state["queue"] = asyncio.Queue()
+        _state["writer"] = asyncio.create_task(_writer())
+    _state["queue"].put_nowait(json.dumps(event) + ",\n")
+
+
+# ——— Batches & Items ———
+def begin(kind, chat_id, **args):
+    """Start a traced batch in the current task; returns a token for end()."""
+    batch_id = next(_batch_ids)
+    batches[batch_id] = {
+        "kind": kind, "chat": chat_id, "args": args,
+        "start": time.time(), "end": None,
+        "stages": {},  # name → [total seconds, count, max seconds]
+        "items": {},   # item → seconds
+    }
+    while len(batches) > KEEP_BATCHES:
+        batches.popitem(last=False)
+    last_batch[chat_id] = batch_id
+    _emit({"name": "process_name", "ph": "M", "pid": batch_id,
+           "args": {"name": f"{kind} #{batch_id} (chat {chat_id})"}})
+    return _ids.set({"chat": chat_id, "batch": batch_id, "kind": kind, "item": 0})
+
+
+def current():
+    """IDs of the job running in this task: chat, batch, kind and item (empty outside a batch)."""
+    return _ids.get()
+
+
+def end(token):
+    if token is None:
+        return
+    batch = batches.get(_ids.get().get("batch"))
+    if batch:
+        batch["end"] = time.time()
+    _ids.reset(token)
+
+
+@contextmanager
+def item(n, **args):
+    """Tag every span inside the block with item number `n` and time the item as a whole."""
+    token = _ids.set({**_ids.get(), "item": n})
+    try:
+        with span("item", **args):
+            yield
+    finally:
+        _ids.reset(token)
+
+
+@contextmanager
+def span(name, **args):
+    """Time the enclosed block as one complete ("X") trace event."""
+    ids = _ids.get()
+    start = _now_us()
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        dur = time.perf_counter() - t0
+        batch = batches.get(ids.get("batch"))
+        if batch is not None:
+            if name == "item":
+                batch["items"][ids["item"]] = dur
+            else:
+                stage = batch["stages"].setdefault(name, [0.0, 0, 0.0])
+                stage[0] += dur
+                stage[1] += 1
+                stage[2] = max(stage[2], dur)
+        _emit({"name": name, "cat": batch["kind"] if batch else "bot", "ph": "X",
+               "ts": start, "dur": dur * 1e6,
+               "pid": ids.get("batch", 0), "tid": ids.get("item", 0),
+               "args": {"chat": ids.get("chat"), **args}})
+
+
+# ——— /trace ———
+def summarize(batch_id):
+    batch = batches[batch_id]
+    wall = (batch["end"] or time.time()) - batch["start"]
+    status = "done" if batch["end"] else "running"
+    lines = [f"🧭 **{batch['kind']} #{batch_id}** ({status}) wall {wall:.0f}s, {len(batch['items'])} items"]
+
+    stages = sorted(batch["stages"].items(), key=lambda kv: -kv[1][0])
+    busy = sum(s[0] for _, s in stages) or 1
+    for name, (total, count, longest) in stages:
+        lines.append(f"`{name:<10} {total:8.1f}s {total * 100 / busy:5.1f}%  ×{count:<4} max {longest:.1f}s`")
+    if not stages:
+        lines.append("No stages recorded.")
+
+    slow = sorted(batch["items"].items(), key=lambda kv: -kv[1])[:3]
+    if slow:
+        lines.append("Slowest items: " + ", ".join(f"#{n} {secs:.0f}s" for n, secs in slow))
+    lines.append("Stage shares are of summed stage time; concurrent items overlap in wall time.")
+    return "\n".join(lines)
+
+
+def register_trace_command(bot):
+    @bot.on_message(filters.command("trace"))
+    async def trace_handler(client, m: Message):
+        """/trace summarizes the chat's last batch; `/trace file` sends the timeline (admins only)."""
+        if len(m.command) > 1 and m.command[1].lower() == "file":
+            # The timeline holds every chat's file names and ffmpeg args
+            if not m.from_user or m.from_user.id not in [OWNER_ID] + SUDO_USERS:
+                return await m.reply_text("⛔ /trace file is for bot admins (OWNER_ID / SUDO_USERS).")
+            if not os.path.exists(TRACE_FILE):
+                return await m.reply_text("No trace recorded yet.")
+            return await m.reply_document(TRACE_FILE, caption="Open in ui.perfetto.dev or chrome://tracing")
+        batch_id = last_batch.get(m.chat.id)
+        if batch_id not in batches:
+            return await m.reply_text("No traced batch for this chat yet.")
+        await m.reply_text(summarize(batch_id)[:4096])
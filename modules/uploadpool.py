@@ -0,0 +1,188 @@
+import os
+import time
+import asyncio
+import logging
+from pyrogram import Client
+from pyrogram.errors import FloodWait
+
+import metrics
+import tracing
+from vars import API_ID, API_HASH, BOT_TOKEN, UPLOAD_SESSIONS, UPLOAD_BOT_TOKENS, UPLOAD_CHAT, UPLOAD_TRANSMISSIONS
+
+# ——— Configuration ———
+DEFAULT_RATE = 4 * 2**20    # Bytes/s assumed for a session until it has finished an upload
+MIN_SAMPLE = 2**20          # Smaller uploads are mostly latency and don't update the rate
+RATE_WEIGHT = 0.3           # Weight of the newest upload in a session's smoothed rate
+
+session_active = metrics.Gauge("bot_upload_session_active", "Uploads in flight per upload session.", ["session"])
+session_rate = metrics.Gauge("bot_upload_session_rate", "Smoothed upload throughput per session, bytes/s.", ["session"])
+session_bytes = metrics.Counter("bot_upload_session_bytes_total", "Bytes uploaded per upload session.", ["session"])
+session_floodwaits = metrics.Counter("bot_upload_session_floodwaits_total", "FloodWaits per upload session.", ["session"])
+
+
+class UploadSession:
+    """One authorized client that can carry uploads."""
+
+    __slots__ = ("name", "client", "direct", "active", "pending", "rate", "flood_until")
+
+    def __init__(self, name, client, direct):
+        self.name = name
+        self.client = client
+        self.direct = direct      # sends as the main bot; otherwise uploads to UPLOAD_CHAT to be copied
+        self.active = 0
+        self.pending = 0          # bytes of the uploads in flight
+        self.rate = None          # smoothed bytes/s of finished uploads
+        self.flood_until = 0.0    # monotonic time its FloodWait ends
+
+    def eta(self, size):
+        """Seconds until this session would be done with what it has plus `size` bytes."""
+        return (self.pending + size) / (self.rate or DEFAULT_RATE)
+
+    def observe(self, size, seconds):
+        if size >= MIN_SAMPLE and seconds > 0:
+            rate = size / seconds
+            self.rate = rate if self.rate is None else RATE_WEIGHT * rate + (1 - RATE_WEIGHT) * self.rate
+            session_rate.set(self.rate, session=self.name)
+
+
+def _size(media):
+    return os.path.getsize(media) if isinstance(media, str) and os.path.isfile(media) else 0
+
+
+class UploadPool:
+    """Spreads uploads over the main bot and any extra sessions.
+
+    Each upload goes to the session expected to finish it first: the bytes
+    it already has in flight plus this file, over its measured throughput.
+    A session in a FloodWait is skipped until the wait ends and the upload
+    moves on to another. Clones of BOT_TOKEN (UPLOAD_SESSIONS) send straight
+    to the chat; other bots (UPLOAD_BOT_TOKENS) upload to UPLOAD_CHAT and the
+    main bot copies the message, so every result still comes from the main bot.
+    """
+
+    def __init__(self):
+        self.main = None
+        self.sessions = []
+
+    async def start(self, bot):
+        """Log in the extra sessions; uploads use the main bot alone until they're up."""
+        self.main = bot
+        self.sessions = [UploadSession("main", bot, True)]
+        extra = [(f"clone{n}", f"bot_upload{n}", BOT_TOKEN, True) for n in range(1, UPLOAD_SESSIONS + 1)]
+        if UPLOAD_BOT_TOKENS and not UPLOAD_CHAT:
+            logging.error("UPLOAD_BOT_TOKENS is set without UPLOAD_CHAT; the extra bots stay unused")
+        else:
+            # Session files are named by bot id so a reordered token list can't mix them up
+            extra += [(f"bot{t.split(':')[0]}", f"upload_{t.split(':')[0]}", t, False) for t in UPLOAD_BOT_TOKENS]
+
+        async def login(name, session_name, token, direct):
+            client = Client(session_name, api_id=API_ID, api_hash=API_HASH, bot_token=token,
+                            no_updates=True, max_concurrent_transmissions=UPLOAD_TRANSMISSIONS)
+            try:
+                await client.start()
+            except Exception as e:
+                logging.error(f"Upload session {name} did not start: {e}")
+                return
+            self.sessions.append(UploadSession(name, client, direct))
+            session_active.set(0, session=name)
+
+        await asyncio.gather(*(login(*args) for args in extra))
+        if len(self.sessions) > 1:
+            logging.warning(f"Uploading over {len(self.sessions)} sessions: {', '.join(s.name for s in self.sessions)}")
+
+    async def close(self):
+        for s in self.sessions[1:]:
+            try:
+                await s.client.stop()
+            except Exception as e:
+                logging.error(f"Stopping upload session {s.name} failed: {e}")
+        self.sessions = self.sessions[:1]
+
+    def pick(self, size):
+        """The session that would finish `size` more bytes first, or None while all are flood-waiting."""
+        now = time.monotonic()
+        ready = [s for s in self.sessions if s.flood_until <= now]
+        return min(ready, key=lambda s: (s.eta(size), s.active)) if ready else None
+
+    # ——— Sending ———
+    async def send(self, bot, method, chat_id, media, size, **kwargs):
+        """`bot.<method>(chat_id, media, **kwargs)` on the least-loaded session."""
+        if bot is not self.main or len(self.sessions) < 2:
+            return await getattr(bot, method)(chat_id, media, **kwargs)
+        while True:
+            s = self.pick(size)
+            if s is None:
+                wait = max(0, min(x.flood_until for x in self.sessions) - time.monotonic())
+                metrics.floodwait_seconds.inc(wait)
+                with tracing.span("floodwait", seconds=wait):
+                    await asyncio.sleep(wait)
+                continue
+            try:
+                stored = await self._upload(s, method, chat_id, media, size, kwargs)
+            except FloodWait as e:
+                s.flood_until = time.monotonic() + e.value
+                session_floodwaits.inc(session=s.name)
+                logging.warning(f"Upload session {s.name}: FloodWait {e.value}s, moving the upload on")
+                continue
+            return stored if s.direct else await self._copy(s, stored, chat_id, kwargs.get("reply_to_message_id"))
+
+    async def _upload(self, s, method, chat_id, media, size, kwargs):
+        if not s.direct:
+            kwargs = {k: v for k, v in kwargs.items() if k != "reply_to_message_id"}
+        s.active += 1
+        s.pending += size
+        session_active.set(s.active, session=s.name)
+        start = time.monotonic()
+        try:
+            with tracing.span("upload_session", session=s.name):
+                msg = await getattr(s.client, method)(chat_id if s.direct else UPLOAD_CHAT, media, **kwargs)
+        finally:
+            s.active -= 1
+            s.pending -= size
+            session_active.set(s.active, session=s.name)
+        s.observe(size, time.monotonic() - start)
+        session_bytes.inc(size, session=s.name)
+        return msg
+
+    async def _copy(self, s, stored, chat_id, reply_to):
+        """Repost an upload from UPLOAD_CHAT as the main bot, then drop the stored one."""
+        group = isinstance(stored, list)
+        while True:
+            try:
+                if group:
+                    msg = await self.main.copy_media_group(chat_id, UPLOAD_CHAT, stored[0].id,
+                                                           reply_to_message_id=reply_to)
+                else:
+                    msg = await self.main.copy_message(chat_id, UPLOAD_CHAT, stored.id, reply_to_message_id=reply_to)
+                break
+            except FloodWait as e:
+                metrics.floodwait_seconds.inc(e.value)
+                with tracing.span("floodwait", seconds=e.value):
+                    await asyncio.sleep(e.value)
+        try:
+            await s.client.delete_messages(UPLOAD_CHAT, [x.id for x in stored] if group else stored.id)
+        except Exception as e:
+            logging.error(f"Could not clear a stored upload from UPLOAD_CHAT: {e}")
+        return msg
+
+    async def send_document(self, bot, chat_id, document, **kwargs):
+        return await self.send(bot, "send_document", chat_id, document, _size(document), **kwargs)
+
+    async def send_video(self, bot, chat_id, video, **kwargs):
+        return await self.send(bot, "send_video", chat_id, video, _size(video), **kwargs)
+
+    async def send_media_group(self, bot, chat_id, media, **kwargs):
+        return await self.send(bot, "send_media_group", chat_id, media, sum(_size(x.media) for x in media), **kwargs)
+
+    def status(self):
+        """One line per session for /profile."""
+        now = time.monotonic()
+        lines = []
+        for s in self.sessions:
+            rate = f"{s.rate / 2**20:.1f} MiB/s" if s.rate else "no sample yet"
+            flood = f", FloodWait {s.flood_until - now:.0f}s" if s.flood_until > now else ""
+            lines.append(f"{s.name}: {s.active} uploading ({s.pending / 2**20:.0f} MiB), {rate}{flood}")
+        return "\n".join(lines)
+
+
+pool = UploadPool()
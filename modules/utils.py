@@ -1,7 +1,11 @@
 import time
+import asyncio
 import math
 import os
+from collections import OrderedDict
 from pyrogram.errors import FloodWait
+import metrics
+import tracing
 
 class Timer:
     def __init__(self, time_between=5):
@@ -64,35 +68,81 @@ def hrt(seconds, precision = 0):
 
 
 
-timer = Timer()
+MAX_TIMERS = 256   # progress messages throttled at once; the least recently edited are forgotten
+_timers = OrderedDict()  # (chat id, message id) → Timer
+
+
+def timer_for(reply):
+    """The edit throttle of one progress message, so concurrent jobs don't hold back each other's."""
+    key = (reply.chat.id, reply.id)
+    t = _timers.get(key)
+    if t is None:
+        t = _timers[key] = Timer()
+        if len(_timers) > MAX_TIMERS:
+            _timers.popitem(last=False)
+    else:
+        _timers.move_to_end(key)
+    return t
 
 # Powered By Ankush
+def upload_progress_text(current, total, elapsed):
+    """The upload status message after `elapsed` whole seconds."""
+    perc = f"{current * 100 / total:.1f}%"
+    speed = current / elapsed
+    remaining_bytes = total - current
+    if speed > 0:
+        eta_seconds = remaining_bytes / speed
+        eta = hrt(eta_seconds, precision=1)
+    else:
+        eta = "-"
+    sp = str(hrb(speed)) + "/s"
+    tot = hrb(total)
+    cur = hrb(current)
+    bar_length = 11
+    completed_length = int(current * bar_length / total)
+    remaining_length = bar_length - completed_length
+    progress_bar = "◆" * completed_length + "◇" * remaining_length
+    return f'\n `╭─⌯══⟰ 𝐔𝐩𝐥𝐨𝐝𝐢𝐧𝐠 ⟰══⌯──★ \n├⚡ {progress_bar}|﹝{perc}﹞ \n├🚀 Speed » {sp} \n├📟 Processed » {cur}\n├🧲 Size - ETA » {tot} - {eta} \n`├𝐁𝐲 » 𝐖𝐃 𝐙𝐎𝐍𝐄\n╰─══ ✪ @Opleech_WD ✪ ══─★\n'
+
+
+def download_progress_text(current, total, speed):
+    perc = f"{current * 100 / total:.1f}%"
+    eta = hrt((total - current) / speed, precision=1) if speed else "-"
+    completed_length = int(current * 11 / total)
+    bar = "◆" * completed_length + "◇" * (11 - completed_length)
+    return f'\n `╭─⌯══⟱ 𝐃𝐨𝐰𝐧𝐥𝐨𝐚𝐝𝐢𝐧𝐠 ⟱══⌯──★ \n├⚡ {bar}|﹝{perc}﹞ \n├🚀 Speed » {hrb(speed)}/s \n├📟 Processed » {hrb(current)}\n├🧲 Size - ETA » {hrb(total)} - {eta} \n`╰─══ ✪ @Opleech_WD ✪ ══─★\n'
+
+
+def clean_name(title):
+    """A .txt link title made safe for file names and captions."""
+    # Chained replace() beats str.translate() and re.sub() here, see microbench.py
+    return (title.replace("\t", "").replace(":", "").replace("/", "").replace("+", "").replace("#", "")
+            .replace("|", "").replace("@", "").replace("*", "").replace(".", "")
+            .replace("https", "").replace("http", "").strip())
+
+
 async def progress_bar(current, total, reply, start):
-    if timer.can_send():
+    if timer_for(reply).can_send():
         now = time.time()
         diff = now - start
         if diff < 1:
             return
         else:
-            perc = f"{current * 100 / total:.1f}%"
-            elapsed_time = round(diff)
-            speed = current / elapsed_time
-            remaining_bytes = total - current
-            if speed > 0:
-                eta_seconds = remaining_bytes / speed
-                eta = hrt(eta_seconds, precision=1)
-            else:
-                eta = "-"
-            sp = str(hrb(speed)) + "/s"
-            tot = hrb(total)
-            cur = hrb(current)
-            bar_length = 11
-            completed_length = int(current * bar_length / total)
-            remaining_length = bar_length - completed_length
-            progress_bar = "◆" * completed_length + "◇" * remaining_length
-            
             try:
-                await reply.edit(f'\n `╭─⌯══⟰ 𝐔𝐩𝐥𝐨𝐝𝐢𝐧𝐠 ⟰══⌯──★ \n├⚡ {progress_bar}|﹝{perc}﹞ \n├🚀 Speed » {sp} \n├📟 Processed » {cur}\n├🧲 Size - ETA » {tot} - {eta} \n`├𝐁𝐲 » 𝐖𝐃 𝐙𝐎𝐍𝐄\n╰─══ ✪ @Opleech_WD ✪ ══─★\n') 
+                await reply.edit(upload_progress_text(current, total, round(diff)))
             except FloodWait as e:
-                time.sleep(e.x)
-
+                metrics.floodwait_seconds.inc(e.value)
+                with tracing.span("floodwait", seconds=e.value):
+                    await asyncio.sleep(e.value)
+
+
+async def download_progress(current, total, speed, reply):
+    if timer_for(reply).can_send() and total:
+        try:
+            await reply.edit(download_progress_text(current, total, speed))
+        except FloodWait as e:
+            metrics.floodwait_seconds.inc(e.value)
+            with tracing.span("floodwait", seconds=e.value):
+                await asyncio.sleep(e.value)
+        except Exception:
+            pass
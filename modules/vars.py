@@ -6,3 +6,29 @@ BOT_TOKEN = os.environ.get("BOT_TOKEN", "")
 
 WEBHOOK = True  # Don't change this
 PORT = int(os.environ.get("PORT", 8080))  # Default to 8000 if not set
+
+# Telegram user ids allowed to run admin commands such as /profile
+OWNER_ID = int(os.environ.get("OWNER_ID", 0))
+SUDO_USERS = [int(x) for x in os.environ.get("SUDO_USERS", "").split()]
+
+# Set to e.g. sqlite:///./downloads/jobs.db to hand /batch2 files to worker.py processes
+JOB_QUEUE = os.environ.get("JOB_QUEUE", "")
+
+# Send /batch and /batch2 outputs as albums of up to 10 documents instead of one by one
+DOC_ALBUMS = os.environ.get("DOC_ALBUMS", "").lower() in ("1", "true", "yes")
+
+# Public URL of the web server (e.g. https://mybot.example.com); needed for direct-download links
+BASE_URL = os.environ.get("BASE_URL", "")
+# "auto": /pro and /batch2 outputs too big for Telegram are sent as links, "always": every output is
+DIRECT_LINKS = os.environ.get("DIRECT_LINKS", "auto").lower()
+if DIRECT_LINKS not in ("auto", "always"):
+    DIRECT_LINKS = ""
+
+# Extra upload sessions, picked per file by expected finish time (see uploadpool.py):
+# UPLOAD_SESSIONS more logins of BOT_TOKEN, and other bots that upload to UPLOAD_CHAT
+# (a channel the main bot and they are admins of) for the main bot to copy from
+UPLOAD_SESSIONS = int(os.environ.get("UPLOAD_SESSIONS", 0))
+UPLOAD_BOT_TOKENS = os.environ.get("UPLOAD_BOT_TOKENS", "").split()
+UPLOAD_CHAT = int(os.environ.get("UPLOAD_CHAT", 0))
+# Uploads each session runs at once, each over its own media connection (pyrogram's default is 1)
+UPLOAD_TRANSMISSIONS = int(os.environ.get("UPLOAD_TRANSMISSIONS", 1))
@@ -0,0 +1,126 @@
+import os
+import sys
+import signal
+import socket
+import asyncio
+import logging
+from pyrogram import Client
+
+import batch2
+import jobqueue
+import tracing
+from vars import API_ID, API_HASH, BOT_TOKEN, JOB_QUEUE
+
+# ——— Configuration ———
+POLL = 2                          # Seconds between claims when the queue is empty
+HEARTBEAT = jobqueue.LEASE / 4    # Seconds between lease renewals
+CONCURRENCY = int(os.environ.get("WORKER_JOBS", 2))
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+
+class JobFailed(Exception):
+    """The job ran and failed for good (bad input or args); retrying won't help."""
+
+
+class Running:
+    __slots__ = ("job", "procs", "progress")
+
+    def __init__(self, job):
+        self.job = job
+        self.procs = []
+        self.progress = "starting"
+
+    def on_start(self, proc):
+        self.procs.append(proc)
+        self.progress = f"ffmpeg pid {proc.pid}"
+
+
+# ——— Job Handlers ———
+async def run_batch2(bot, run):
+    p = run.job.payload
+    token = tracing.begin("worker", p["chat"], batch=run.job.batch)
+    try:
+        with tracing.item(run.job.id, file=p["file_name"]):
+            run.progress = "downloading"
+            ok = await batch2.process_file(bot, p["chat"], p["batch_no"], p["file_id"], p["file_name"], p["args"],
+                                           on_start=run.on_start)
+    finally:
+        tracing.end(token)
+    if not ok:
+        raise JobFailed("ffmpeg failed")
+    return {"file": p["file_name"]}
+
+
+HANDLERS = {"batch2": run_batch2}
+
+
+class Worker:
+    """Claims jobs from the shared queue and runs up to `concurrency` of them at once."""
+
+    def __init__(self, queue, bot, name, concurrency=CONCURRENCY):
+        self.queue = queue
+        self.bot = bot
+        self.name = name
+        self.concurrency = concurrency
+
+    async def run(self):
+        running = set()
+        while True:
+            while len(running) < self.concurrency:
+                job = await self.queue.claim(self.name)
+                if job is None:
+                    break
+                logging.info(f"{self.name} claimed job {job.id} ({job.kind}, attempt {job.attempts})")
+                running.add(asyncio.create_task(self.execute(job)))
+            if running:
+                _, running = await asyncio.wait(running, timeout=POLL, return_when=asyncio.FIRST_COMPLETED)
+            else:
+                await asyncio.sleep(POLL)
+
+    async def execute(self, job):
+        run = Running(job)
+        task = asyncio.create_task(HANDLERS[job.kind](self.bot, run))
+        try:
+            while not task.done():
+                await asyncio.wait({task}, timeout=HEARTBEAT)
+                if not task.done() and not await self.queue.heartbeat(job.id, self.name, run.progress):
+                    # Cancelled, or the lease ran out and another worker owns the job now
+                    logging.warning(f"{self.name} lost job {job.id}, stopping it")
+                    break
+        finally:
+            if not task.done():
+                task.cancel()
+                for proc in run.procs:
+                    try: proc.send_signal(signal.SIGKILL)
+                    except ProcessLookupError: pass
+        if task.cancelled():
+            return
+        try:
+            result = task.result()
+        except JobFailed as e:
+            await self.queue.fail(job.id, self.name, str(e))
+        except Exception as e:
+            logging.exception(f"Job {job.id} crashed")
+            await self.queue.fail(job.id, self.name, f"{type(e).__name__}: {e}", retry=True)
+        else:
+            await self.queue.complete(job.id, self.name, result)
+
+
+async def main(concurrency):
+    if not JOB_QUEUE:
+        sys.exit("Set JOB_QUEUE (e.g. sqlite:///./downloads/jobs.db) to the same value as the bot.")
+    name = os.environ.get("WORKER_NAME") or f"{socket.gethostname()}-{os.getpid()}"
+    # Same bot token as the front-end, but its own session and no updates: it only sends
+    bot = Client(f"worker_{name}", api_id=API_ID, api_hash=API_HASH, bot_token=BOT_TOKEN,
+                 in_memory=True, no_updates=True)
+    await bot.start()
+    logging.info(f"Worker {name} started, {concurrency} concurrent jobs")
+    try:
+        await Worker(jobqueue.open_queue(JOB_QUEUE), bot, name, concurrency).run()
+    finally:
+        await bot.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else CONCURRENCY))
@@ -0,0 +1,330 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import itertools
+
+# ——— Configuration ———
+POOL_SIZE = int(os.environ.get("YTDL_WORKERS", 2))  # Warm yt-dlp processes kept alive
+PROGRESS_EVERY = 1.0                                 # Seconds between progress events per job
+SPAWN_TIMEOUT = 60                                   # Seconds a new worker gets to import yt_dlp and say "ready"
+SPAWN_ATTEMPTS = 5                                   # Failed starts in a row before a worker slot is given up
+SPAWN_BACKOFF = 1.0                                  # Seconds before retrying a failed start, doubling each time
+
+# Options matching the old `yt-dlp -R 25 --fragment-retries 25 --external-downloader aria2c` CLI
+DEFAULT_OPTS = {
+    # Short in-process retries; retry.py backs off between whole attempts per host
+    "retries": 3,
+    "fragment_retries": 10,
+    "external_downloader": {"default": "aria2c"},
+    "external_downloader_args": {"aria2c": ["-x", "16", "-j", "32"]},
+}
+
+
+def with_rate_limit(opts, rate):
+    """Cap a download at `rate` bytes/s, both in yt-dlp and in the aria2c it spawns."""
+    aria2 = DEFAULT_OPTS["external_downloader_args"]["aria2c"]
+    return {**opts, "ratelimit": int(rate),
+            "external_downloader_args": {"aria2c": aria2 + [f"--max-download-limit={int(rate)}"]}}
+
+
+class YtdlError(Exception):
+    pass
+
+
+class _Job:
+    def __init__(self, job_id, future, progress):
+        self.id = job_id
+        self.future = future
+        self.progress = progress
+        self.worker = None
+        self.reporting = None
+
+    def __await__(self):
+        return self.future.__await__()
+
+
+class _Worker:
+    def __init__(self, proc):
+        self.proc = proc
+        self.job = None
+
+    def send(self, msg):
+        self.proc.stdin.write((json.dumps(msg) + "\n").encode())
+
+
+class YtdlPool:
+    """Warm yt-dlp worker processes fed with download jobs over a pipe.
+
+    Each worker imports yt_dlp once and runs every job in a fresh YoutubeDL
+    instance, so a crash or a bad extractor only ever takes down one job.
+    """
+
+    def __init__(self, size=POOL_SIZE):
+        self.size = size
+        self._idle = None
+        self._jobs = {}
+        self._ids = itertools.count(1)
+        self._lock = asyncio.Lock()
+        self._closing = False
+        self._alive = 0       # workers that said "ready" and haven't exited
+        self._spawning = 0    # worker slots still trying to start one
+        self._down = None     # why submit() fails: closed, or no worker would start
+
+    async def start(self):
+        async with self._lock:
+            if self._idle is not None:
+                return
+            self._idle = asyncio.Queue()
+            await asyncio.gather(*(self._spawn() for _ in range(self.size)))
+
+    async def _spawn(self):
+        """Start a worker, backing off between failed starts; gives the slot up after SPAWN_ATTEMPTS."""
+        self._spawning += 1
+        try:
+            for attempt in range(SPAWN_ATTEMPTS):
+                if attempt:
+                    await asyncio.sleep(SPAWN_BACKOFF * 2 ** (attempt - 1))
+                if self._closing:
+                    return
+                proc = await asyncio.create_subprocess_exec(
+                    sys.executable, os.path.abspath(__file__), "--worker",
+                    stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE
+                )
+                try:
+                    # "ready" once yt_dlp is imported; EOF means it died on the way (e.g. a broken install)
+                    line = await asyncio.wait_for(proc.stdout.readline(), SPAWN_TIMEOUT)
+                    ready = json.loads(line).get("event") == "ready"
+                except (asyncio.TimeoutError, ValueError):
+                    ready = False
+                if ready:
+                    worker = _Worker(proc)
+                    self._alive += 1
+                    asyncio.create_task(self._pump(worker))
+                    self._idle.put_nowait(worker)
+                    return
+                if proc.returncode is None:
+                    proc.kill()
+                await proc.wait()
+                logging.error(f"yt-dlp worker failed to start (exit {proc.returncode}), "
+                              f"attempt {attempt + 1}/{SPAWN_ATTEMPTS}")
+        finally:
+            self._spawning -= 1
+        logging.error("Giving up on a yt-dlp worker slot")
+        if not self._alive and not self._spawning:
+            # Nothing left to run jobs: fail them instead of letting submit() wait forever
+            self._down = "yt-dlp workers fail to start, see the log"
+            self._idle.put_nowait(None)
+
+    async def _pump(self, worker):
+        while True:
+            line = await worker.proc.stdout.readline()
+            if not line:
+                break
+            msg = json.loads(line)
+            job = self._jobs.get(msg.get("id"))
+            if not job:
+                continue
+            event = msg["event"]
+            if event == "progress":
+                # Drop ticks while the previous callback (e.g. a message edit) is still running
+                if job.progress and (job.reporting is None or job.reporting.done()):
+                    job.reporting = asyncio.create_task(
+                        job.progress(msg["downloaded"], msg["total"], msg["speed"])
+                    )
+                continue
+            self._jobs.pop(job.id, None)
+            worker.job = None
+            if not job.future.done():
+                if event == "done":
+                    job.future.set_result(msg.get("path"))
+                elif event == "cancelled":
+                    job.future.cancel()
+                else:
+                    job.future.set_exception(YtdlError(msg.get("error", "yt-dlp failed")))
+            self._idle.put_nowait(worker)
+
+        # Worker died: fail its job and replace it
+        await worker.proc.wait()
+        self._alive -= 1
+        job = self._jobs.pop(worker.job, None)
+        if job and not job.future.done():
+            job.future.set_exception(YtdlError(f"yt-dlp worker exited with {worker.proc.returncode}"))
+        if not self._closing:
+            logging.error(f"yt-dlp worker exited with {worker.proc.returncode}, respawning")
+            await self._spawn()
+
+    async def submit(self, url, opts=None, info_path=None, progress=None):
+        """Queue a download and return the job; `await job` yields the file path."""
+        if self._down:
+            raise YtdlError(self._down)
+        await self.start()
+        while True:
+            worker = await self._idle.get()
+            if worker is None:
+                # Closed or out of workers while this job waited; pass the wake-up on to the next waiter
+                self._idle.put_nowait(None)
+                raise YtdlError(self._down)
+            if worker.proc.returncode is None:
+                break
+        job = _Job(next(self._ids), asyncio.get_running_loop().create_future(), progress)
+        job.worker = worker
+        worker.job = job.id
+        self._jobs[job.id] = job
+        worker.send({"id": job.id, "url": url, "opts": {**DEFAULT_OPTS, **(opts or {})},
+                     "info_path": info_path})
+        await worker.proc.stdin.drain()
+        return job
+
+    async def download(self, url, opts=None, info_path=None, progress=None):
+        job = await self.submit(url, opts, info_path, progress)
+        try:
+            return await job
+        except asyncio.CancelledError:
+            self.cancel(job)
+            raise
+
+    def cancel(self, job):
+        if job.id in self._jobs and job.worker.proc.returncode is None:
+            job.worker.send({"cancel": job.id})
+
+    async def close(self):
+        self._closing = True
+        self._down = "yt-dlp pool is shut down"
+        if self._idle is None:
+            return
+        for job in list(self._jobs.values()):
+            job.worker.proc.kill()
+        while not self._idle.empty():
+            worker = self._idle.get_nowait()
+            if worker and worker.proc.returncode is None:
+                worker.proc.stdin.close()
+                await worker.proc.wait()
+        self._idle.put_nowait(None)
+
+
+pool = YtdlPool()
+
+
+# ——— Worker Process ———
+def _serve():
+    import queue
+    import threading
+    import yt_dlp
+    from yt_dlp.utils import DownloadCancelled
+
+    out = os.fdopen(os.dup(sys.stdout.fileno()), "w", buffering=1)
+    sys.stdout = sys.stderr  # keep stray prints off the protocol pipe
+
+    def emit(**msg):
+        out.write(json.dumps(msg) + "\n")
+
+    jobs = queue.Queue()
+    cancelled = set()
+
+    def reader():
+        for line in sys.stdin:
+            msg = json.loads(line)
+            if "cancel" in msg:
+                cancelled.add(msg["cancel"])
+            else:
+                jobs.put(msg)
+        jobs.put(None)
+
+    threading.Thread(target=reader, daemon=True).start()
+    emit(event="ready")
+
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        job_id = job["id"]
+        last = [0.0]
+
+        def hook(d):
+            if job_id in cancelled:
+                raise DownloadCancelled()
+            now = time.monotonic()
+            if d["status"] == "downloading" and now - last[0] >= PROGRESS_EVERY:
+                last[0] = now
+                emit(id=job_id, event="progress", downloaded=d.get("downloaded_bytes") or 0,
+                     total=d.get("total_bytes") or d.get("total_bytes_estimate") or 0,
+                     speed=d.get("speed") or 0)
+
+        opts = dict(job["opts"], progress_hooks=[hook], quiet=True, noprogress=True)
+        try:
+            probed = None
+            if job.get("info_path"):
+                try:
+                    with open(job["info_path"]) as f:
+                        probed = json.load(f)
+                except FileNotFoundError:
+                    pass  # expired and purged by formats.py after the job was queued: probe again
+            with yt_dlp.YoutubeDL(opts) as ydl:
+                if probed is not None:
+                    info = ydl.process_ie_result(probed, download=True)
+                else:
+                    info = ydl.extract_info(job["url"], download=True)
+                downloads = info.get("requested_downloads") or [{}]
+                path = downloads[0].get("filepath") or ydl.prepare_filename(info)
+            emit(id=job_id, event="done", path=path)
+        except DownloadCancelled:
+            emit(id=job_id, event="cancelled")
+        except BaseException as e:
+            emit(id=job_id, event="error", error=str(e))
+        finally:
+            cancelled.discard(job_id)
+
+
+# ——— Benchmark: cold CLI vs warm pool ———
+async def _bench(url, runs):
+    import subprocess
+
+    opts = {"simulate": True, "external_downloader": {}, "external_downloader_args": {}}
+
+    start = time.perf_counter()
+    for _ in range(runs):
+        await asyncio.to_thread(subprocess.run, ["yt-dlp", "-q", "--simulate", url],
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    cold = (time.perf_counter() - start) / runs
+
+    bench_pool = YtdlPool(size=1)
+    await bench_pool.start()
+    start = time.perf_counter()
+    for _ in range(runs):
+        await bench_pool.download(url, opts)
+    warm = (time.perf_counter() - start) / runs
+    await bench_pool.close()
+
+    print(f"cold CLI : {cold * 1000:8.1f} ms/link")
+    print(f"warm pool: {warm * 1000:8.1f} ms/link  ({cold / warm:.1f}x)")
+
+
+def _bench_main(argv):
+    import tempfile
+    import threading
+    import functools
+    from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+    runs = int(argv[argv.index("-n") + 1]) if "-n" in argv else 10
+    url = next((a for a in argv if "://" in a), None)
+    if not url:
+        # Serve a small local file so the benchmark measures overhead, not the network
+        root = tempfile.mkdtemp()
+        with open(os.path.join(root, "sample.mp4"), "wb") as f:
+            f.write(os.urandom(256 * 1024))
+        handler = functools.partial(SimpleHTTPRequestHandler, directory=root)
+        handler.log_message = lambda *a: None
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_port}/sample.mp4"
+    asyncio.run(_bench(url, runs))
+
+
+if __name__ == "__main__":
+    if "--worker" in sys.argv:
+        _serve()
+    elif "--bench" in sys.argv:
+        _bench_main(sys.argv)